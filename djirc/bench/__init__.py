@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+"""Benchmarks for djirc's hot paths
+
+Each module can be run as a script, e.g.::
+
+    python -m djirc.bench.templates
+
+"""
+import os
+import time
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+def rate(func, n, repeat=3):
+    """Return the best calls/second of `func` over `repeat` runs of `n` calls
+    
+    """
+    best = None
+    for _ in xrange(repeat):
+        start = time.time()
+        for _ in xrange(n):
+            func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return n / max(best, 1e-9)
+
+def report(name, value, unit):
+    print '%-40s %12.1f %s' % (name, value, unit)
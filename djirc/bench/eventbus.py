@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""Benchmark publishing events to many subscribed views
+
+Subscribes 500 views (50 channels on each of 10 networks), a history logger
+and a few plugins filtering on kind and nick to an `eventbus.EventBus`, and
+times publishing messages to random channels through it, against fanning
+each message out to every subscriber to check its own filter::
+
+    python -m djirc.bench.eventbus --views 500
+
+"""
+import sys
+import random
+import optparse
+
+from djirc import eventbus, events
+from djirc.bench import rate, report
+
+NETWORKS = 10
+
+def filters(views):
+    """The filters of `views` views, a logger and some plugins"""
+    per_network = views // NETWORKS
+    subscribed = [dict(network='irc%d.example.net' % n, target='#chan%d' % c)
+        for n in xrange(NETWORKS) for c in xrange(per_network)]
+    subscribed.append({}) # the history
+    subscribed.append(dict(kinds=['msg', 'action'], nick='user0000*'))
+    subscribed.append(dict(network='irc0.example.net', kinds=['join']))
+    return subscribed, per_network
+
+def generate(rng, n, per_network):
+    return [events.Msg('irc%d.example.net' % rng.randrange(NETWORKS),
+        '#chan%d' % rng.randrange(per_network),
+        'user%05d' % rng.randrange(1000), u'hello', 'msg', i)
+        for i in xrange(n)]
+
+class FanOut(object):
+    """Offer every record to every subscriber, as views were sent events"""
+    def __init__(self):
+        self.subs = []
+
+    def subscribe(self, callback, network=None, target=None, kinds=None,
+            nick=None):
+        sub = eventbus.Subscription(len(self.subs), callback, network,
+            target and eventbus._target_key(target), kinds, nick)
+        self.subs.append(sub)
+
+    def publish(self, record):
+        network, kind = record.network, record.kind
+        target = eventbus._target_key(record.target)
+        for sub in self.subs:
+            if (sub.network is None or sub.network == network) and \
+                    (sub.target is None or sub.target == target) and \
+                    (sub.kinds is None or kind in sub.kinds) and \
+                    sub.wants_nick(record):
+                sub.callback(record)
+
+def parse_args(argv):
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option('--views', type='int', default=500,
+        help="views to subscribe [default: %default]")
+    parser.add_option('--events', type='int', default=20000,
+        help="events to publish per run [default: %default]")
+    options, args = parser.parse_args(argv)
+    if args:
+        parser.error("unexpected arguments: %s" % ' '.join(args))
+    return options
+
+def main(argv=None):
+    options = parse_args(argv)
+    subscribed, per_network = filters(options.views)
+    records = generate(random.Random(0), options.events, per_network)
+    for name, bus in [('indexed', eventbus.EventBus()), ('fan-out', FanOut())]:
+        delivered = []
+        for kwargs in subscribed:
+            bus.subscribe(delivered.append, **kwargs)
+        def publish_all():
+            for record in records:
+                bus.publish(record)
+        report('%s: %d views' % (name, options.views),
+            rate(publish_all, 1, repeat=3) * options.events, 'events/s')
+        report('%s: deliveries per event' % name,
+            float(len(delivered)) / (3 * options.events), '')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""Benchmark the memory taken by buffered events
+
+Buffers generated messages in a `common.LineBuffer` the way a hidden wx view
+does, and reports the resident memory taken per million events for each
+way of keeping them: as lxml elements, flattened to text and style runs (as
+views kept every line before event records), and as `djirc.events` records,
+rendered only when read::
+
+    python -m djirc.bench.events --events 1000000
+
+Each way is measured in a process of its own, so that memory freed by one
+doesn't hide what the next takes.
+
+"""
+import sys
+import random
+import optparse
+import multiprocessing
+
+from djirc import ircclient, events
+from djirc.ui import common, css
+from djirc.bench import ircserver, report
+from djirc.bench.tabs import rss_mb
+
+def generate(rng, n):
+    for _ in xrange(n):
+        yield ('user%05d' % rng.randrange(500),
+            ircserver._sentence(rng).decode('utf-8'))
+
+def fill(how, n):
+    """Buffer `n` messages the way `how`; returns the MB taken"""
+    templates = ircclient.load_event_templates()
+    render = lambda record: templates.element(record.kind, **record.fields)
+    buf = common.LineBuffer(n, None, css.element_path, css.ROOT_PATH, render)
+    rng = random.Random(0)
+    messages = list(generate(rng, n))
+
+    before = rss_mb()
+    if how == 'elements':
+        kept = [templates.element('msg', nick=nick, msg=text)
+            for nick, text in messages]
+    elif how == 'flattened':
+        for nick, text in messages:
+            buf.append(templates.element('msg', nick=nick, msg=text))
+    else:
+        for i, (nick, text) in enumerate(messages):
+            buf.append_event(
+                events.Msg('irc.example.net', '#bench', nick, text, 'msg', i))
+    return rss_mb() - before
+
+def _run(how, n, results):
+    results.put(fill(how, n))
+
+def measure(how, n):
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run, args=(how, n, results))
+    process.start()
+    mb = results.get()
+    process.join()
+    return mb
+
+def parse_args(argv):
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option('--events', type='int', default=1000000,
+        help="events to buffer [default: %default]")
+    options, args = parser.parse_args(argv)
+    if args:
+        parser.error("unexpected arguments: %s" % ' '.join(args))
+    return options
+
+def main(argv=None):
+    options = parse_args(argv)
+    scale = 1e6 / options.events
+    for how in ['elements', 'flattened', 'records']:
+        report('%s: per 1M events' % how,
+            measure(how, options.events) * scale, 'MB')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
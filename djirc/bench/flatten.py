@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""Benchmark flattening elements to text and style runs
+
+Compares `common.flatten` with the previous approach of walking the tree once
+with `common.etree_tostring` for the text and again with `common.dfs` for the
+offsets, on typical lines and on deep and wide trees.
+
+"""
+import operator
+
+from lxml import etree
+
+from djirc.ui import common
+from djirc.bench import rate, report
+
+def dfs_runs(element):
+    text = common.etree_tostring(element)
+    starts = {}
+    ends = {}
+    pos = 0
+    for node, seen in common.dfs(element):
+        if not seen:
+            starts[node] = pos
+            pos += len(node.text or '')
+        else:
+            ends[node] = pos
+            pos += len(node.tail or '')
+    runs = [(start, ends[node], node)
+        for node, start in sorted(starts.iteritems(),
+            key=operator.itemgetter(1))]
+    return text, runs
+
+def line():
+    return etree.fromstring(
+        '<li>&lt;<b>someone</b>&gt; hello there, everyone</li>')
+
+def deep(depth=200):
+    root = node = etree.Element('li')
+    for i in xrange(depth):
+        node = etree.SubElement(node, 'b')
+        node.text = 'x'
+        node.tail = 'y'
+    return root
+
+def wide(width=200):
+    root = etree.Element('li')
+    for i in xrange(width):
+        node = etree.SubElement(root, 'b')
+        node.text = 'x'
+        node.tail = 'y'
+    return root
+
+def main(n=2000):
+    for name, element, scale in [
+            ('line', line(), 10),
+            ('deep', deep(), 1),
+            ('wide', wide(), 1)]:
+        report('%s: etree_tostring + dfs' % name,
+            rate(lambda: dfs_runs(element), n * scale), 'trees/sec')
+        report('%s: flatten' % name,
+            rate(lambda: common.flatten(element), n * scale), 'trees/sec')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+"""A fake IRC server that replays generated traffic to its clients
+
+Just enough of the protocol is implemented to register a client and join it
+to a channel; after that, the server replays a traffic profile as fast as the
+connection allows (or at a fixed rate), recording when each line was sent.
+
+"""
+import random
+import time
+import collections
+
+from twisted.internet import protocol
+from twisted.protocols import basic
+
+SERVER_NAME = 'bench.example.net'
+CHANNEL = '#bench'
+
+WORDS = ('the a netsplit again why is it always lag today anyone know how '
+    'to fix this build python twisted wx works for me patch review merge ok '
+    'lol brb back ping pong hello').split()
+
+def _sentence(rng):
+    return ' '.join(rng.choice(WORDS) for _ in xrange(rng.randint(2, 14)))
+
+def _user(i):
+    return 'user%05d!~user@%d.example.com' % (i, i % 251)
+
+def chatty(nick, n, seed=0):
+    """Messages, actions and notices in a busy channel"""
+    rng = random.Random(seed)
+    for i in xrange(n):
+        user = _user(rng.randrange(500))
+        kind = rng.random()
+        if kind < 0.8:
+            yield ':%s PRIVMSG %s :%s' % (user, CHANNEL, _sentence(rng))
+        elif kind < 0.9:
+            yield ':%s PRIVMSG %s :\x01ACTION %s\x01' % (
+                user, CHANNEL, _sentence(rng))
+        else:
+            yield ':%s NOTICE %s :%s' % (user, CHANNEL, _sentence(rng))
+
+def join_part(nick, n, seed=0):
+    """Other users joining and leaving the channel"""
+    rng = random.Random(seed)
+    for i in xrange(n):
+        user = _user(i // 2)
+        if i % 2:
+            yield ':%s PART %s :%s' % (user, CHANNEL, _sentence(rng))
+        else:
+            yield ':%s JOIN :%s' % (user, CHANNEL)
+
+def netsplit(nick, n, seed=0):
+    """A storm of users quitting because of a netsplit"""
+    for i in xrange(n):
+        yield ':%s QUIT :hub.example.net %s' % (_user(i), SERVER_NAME)
+
+def motd(nick, n, seed=0):
+    """A long message of the day, shown in the '*' view"""
+    rng = random.Random(seed)
+    yield ':%s 375 %s :- %s Message of the Day -' % (
+        SERVER_NAME, nick, SERVER_NAME)
+    for i in xrange(max(n - 2, 0)):
+        yield ':%s 372 %s :- %s' % (SERVER_NAME, nick, _sentence(rng))
+    yield ':%s 376 %s :End of /MOTD command.' % (SERVER_NAME, nick)
+
+PROFILES = collections.OrderedDict([
+    ('chatty', chatty),
+    ('join-part', join_part),
+    ('netsplit', netsplit),
+    ('motd', motd),
+])
+
+class ServerStats(object):
+    """Send times of every line sent to a client, in order"""
+    def __init__(self):
+        self.sent = collections.deque()
+        self.finished = False
+
+class FakeIRCServer(basic.LineReceiver):
+    nickname = None
+
+    def connectionMade(self):
+        self.stats = ServerStats()
+        self.factory.clients.append(self)
+
+    def connectionLost(self, reason):
+        self.factory.clients.remove(self)
+
+    def send(self, line):
+        self.stats.sent.append(time.time())
+        self.sendLine(line)
+
+    def lineReceived(self, line):
+        command, _, rest = line.partition(' ')
+        handler = getattr(self, 'irc_%s' % command.upper(), None)
+        if handler is not None:
+            handler(rest)
+
+    def irc_NICK(self, rest):
+        self.nickname = rest.lstrip(':')
+
+    def irc_USER(self, rest):
+        self.send(':%s 001 %s :Welcome to the benchmark network' % (
+            SERVER_NAME, self.nickname))
+        self.send(':%s!~djirc@127.0.0.1 JOIN :%s' % (self.nickname, CHANNEL))
+        self.lines = iter(self.factory.profile(
+            self.nickname, self.factory.lines, self.factory.seed))
+        self.factory.reactor.callLater(0, self.replay)
+
+    def irc_PING(self, rest):
+        self.send(':%s PONG %s' % (SERVER_NAME, rest))
+
+    def replay(self):
+        """Send the next chunk of the profile"""
+        if self.transport is None or self.transport.disconnecting:
+            return
+        for _ in xrange(self.factory.chunk):
+            try:
+                line = next(self.lines)
+            except StopIteration:
+                self.stats.finished = True
+                self.factory.finished(self)
+                return
+            self.send(line)
+        delay = 0
+        if self.factory.rate:
+            delay = float(self.factory.chunk) / self.factory.rate
+        self.factory.reactor.callLater(delay, self.replay)
+
+class FakeIRCServerFactory(protocol.ServerFactory):
+    protocol = FakeIRCServer
+
+    def __init__(self, reactor, profile, lines, chunk=100, rate=None, seed=0):
+        """Replay `lines` lines of traffic `profile` to every client
+
+        Lines are written `chunk` at a time, at most `rate` lines/second if
+        given.
+
+        """
+        self.reactor = reactor
+        self.profile = profile
+        self.lines = lines
+        self.chunk = chunk
+        self.rate = rate
+        self.seed = seed
+        self.clients = []
+
+    def finished(self, server):
+        """Called when a client has been sent all its lines"""
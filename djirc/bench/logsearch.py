@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""Benchmark appending to and searching the history log store
+
+Fills a temporary store with a channel's worth of generated chatter spread
+over `days` days, then times full-text and time-bounded searches::
+
+    python -m djirc.bench.logsearch --lines 2000000
+
+"""
+import os
+import sys
+import time
+import shutil
+import random
+import optparse
+import tempfile
+
+from twisted.internet import task
+
+from djirc import logstore
+from djirc.bench import ircserver, report
+
+DAY = 24 * 60 * 60
+
+def fill(store, lines, days, seed=0):
+    rng = random.Random(seed)
+    step = float(days * DAY) / lines
+    for i in xrange(lines):
+        store.reactor.advance(step)
+        store.append('bench', '#bench', 'msg', {
+            'nick': 'user%05d' % rng.randrange(500),
+            'msg': ircserver._sentence(rng)})
+    store.sync()
+
+def directory_size(root):
+    return sum(os.path.getsize(os.path.join(path, name))
+        for path, _dirs, names in os.walk(root) for name in names)
+
+def timed(func, *args, **kwargs):
+    start = time.time()
+    result = func(*args, **kwargs)
+    return time.time() - start, result
+
+def parse_args(argv):
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option('--lines', type='int', default=500000,
+        help="lines of history [default: %default]")
+    parser.add_option('--days', type='int', default=90,
+        help="days the history covers [default: %default]")
+    options, args = parser.parse_args(argv)
+    if args:
+        parser.error("unexpected arguments: %s" % ' '.join(args))
+    return options
+
+def main(argv=None):
+    options = parse_args(argv)
+    root = tempfile.mkdtemp()
+    try:
+        clock = task.Clock()
+        # the clock runs faster than real time, so sync about as often as
+        # once a second would with a busy channel
+        store = logstore.LogStore(clock, root, sync_interval=DAY)
+        elapsed, _ = timed(fill, store, options.lines, options.days)
+        report('append', options.lines / elapsed, 'lines/sec')
+        store.close()
+        report('store size', directory_size(root) / 1024.0 / 1024, 'MB')
+
+        # a fresh store, as after a restart: nothing is cached
+        store = logstore.LogStore(clock, root)
+        elapsed, _ = timed(store.search_now, 'bench', '#bench', u'')
+        report('open', elapsed * 1000, 'ms')
+        now = clock.seconds()
+        for name, text, since in [
+                ('rare word, all time', u'netsplit', None),
+                ('rare word, 30 days', u'netsplit', now - 30 * DAY),
+                ('two words, 30 days', u'patch review', now - 30 * DAY),
+                ('common word, all time', u'the', None),
+                ('no words, 30 days', u'', now - 30 * DAY)]:
+            elapsed, results = timed(store.search_now, 'bench', '#bench',
+                text, since=since, limit=1000)
+            report('search %s (%d hits)' % (name, len(results)),
+                elapsed * 1000, 'ms')
+        store.close()
+    finally:
+        shutil.rmtree(root)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
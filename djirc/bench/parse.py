@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""Benchmark framing and parsing received IRC traffic
+
+Feeds recorded traffic, in reads as it would come off a socket, through
+Twisted's `LineReceiver` and `parsemsg` and through `ircparse`, up to the
+point where the command handlers would be called.
+
+"""
+import time
+
+from twisted.words.protocols import irc
+
+from djirc import ircclient, ircparse
+from djirc.test import read_recording
+from djirc.bench import report
+
+class TwistedClient(irc.IRCClient):
+    handled = 0
+
+    def handleCommand(self, command, prefix, params):
+        self.handled += 1
+
+class DjircClient(ircclient.IRCClient):
+    handled = 0
+
+    def __init__(self):
+        self.reader = ircparse.MessageReader(self.messageReceived,
+            self.badMessage, self.lineLengthExceeded, self.MAX_LENGTH)
+
+    def handleCommand(self, command, prefix, params):
+        self.handled += 1
+
+def traffic(name='netsplit.log', n=200000, read_size=4096):
+    lines = [line for _ts, line in read_recording(name)]
+    data = ''.join(lines[i % len(lines)] + '\r\n' for i in xrange(n))
+    return [data[i:i + read_size] for i in xrange(0, len(data), read_size)]
+
+def timed(client, reads):
+    start = time.time()
+    for data in reads:
+        client.dataReceived(data)
+    elapsed = time.time() - start
+    return client.handled, elapsed
+
+def main(n=200000):
+    # small reads as from a quiet connection, and large ones as when a
+    # bouncer plays back its buffer
+    for read_size in [4096, 65536]:
+        reads = traffic(n=n, read_size=read_size)
+        for name, client in [('Twisted', TwistedClient()),
+                ('ircparse', DjircClient())]:
+            handled, elapsed = timed(client, reads)
+            assert handled == n, handled
+            report('%s: %d lines in %d KB reads' % (name, n, read_size // 1024),
+                n / elapsed, 'lines/sec')
+
+if __name__ == '__main__':
+    main()
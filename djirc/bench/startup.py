@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""Benchmark startup
+
+Times starting the client with the headless UI until its window is shown and
+until it connects to a local socket, then loading `event_templates.yaml` and
+compiling every template with no cache, and again once the parsed yaml and
+the Jinja bytecode are cached, then compares looking templates up through
+the Jinja environment against the dict of compiled templates.
+
+"""
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from djirc import eventtemplates
+from djirc.bench import DATA_DIR, rate, report
+
+TEMPLATES_FILE = os.path.join(DATA_DIR, 'event_templates.yaml')
+
+def start_client(cache_dir=None):
+    """Return seconds until the client shows its window and until it connects
+    """
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    args = [sys.executable, '-u', '-m', 'djirc.ircclient', '--ui', 'headless',
+        '--server', '127.0.0.1:%d' % server.getsockname()[1],
+        '--no-history', '--log']
+    if cache_dir is None:
+        args.append('--no-cache')
+    else:
+        args.extend(['--cache-dir', cache_dir])
+    start = time.time()
+    process = subprocess.Popen(args, stdout=subprocess.PIPE)
+    try:
+        for line in iter(process.stdout.readline, ''):
+            if 'startup: window shown' in line:
+                shown = time.time() - start
+                break
+        connection, _ = server.accept()
+        connected = time.time() - start
+        connection.close()
+    finally:
+        process.terminate()
+        process.communicate()
+        server.close()
+    return shown, connected
+
+def main(n=50, lookups=200000, starts=5):
+    cache_dir = tempfile.mkdtemp()
+    try:
+        for name, cache in [('no cache', None), ('cached', cache_dir)]:
+            times = [start_client(cache) for _ in xrange(starts)]
+            report('start, %s: window shown' % name,
+                1000 * min(shown for shown, _ in times), 'ms')
+            report('start, %s: connected' % name,
+                1000 * min(connected for _, connected in times), 'ms')
+
+        def load(cache_dir=None):
+            return eventtemplates.JinjaTemplateDict.from_yaml_file(
+                TEMPLATES_FILE, cache_dir, element_factories=True)
+
+        def cold():
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            load(cache_dir)
+
+        report('templates: no cache', 1000 / rate(load, n), 'ms')
+        report('templates: writing cache', 1000 / rate(cold, n), 'ms')
+        load(cache_dir)
+        report('templates: cached', 1000 / rate(lambda: load(cache_dir), n),
+            'ms')
+
+        templates = load()
+        report('lookup: env.get_template',
+            rate(lambda: templates.env.get_template('msg'), lookups),
+            'lookups/sec')
+        report('lookup: compiled dict', rate(lambda: templates['msg'], lookups),
+            'lookups/sec')
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
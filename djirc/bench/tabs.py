@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""Benchmark the memory held by the views of many joined channels
+
+Feeds generated chatter to the line buffers of 200 hidden views, as the wx UI
+keeps them, and reports the resident set size as the channels' history grows.
+With the buffers bounded it should stay flat::
+
+    python -m djirc.bench.tabs --channels 200 --lines 20000
+
+"""
+import os
+import sys
+import random
+import optparse
+
+from djirc import eventtemplates
+from djirc.ui import common, css
+from djirc.bench import DATA_DIR, ircserver, report
+
+def rss_mb():
+    """Current resident set size of this process (Linux only)"""
+    with open('/proc/self/statm') as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf('SC_PAGE_SIZE') / 1024.0 / 1024.0
+
+def parse_args(argv):
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option('--channels', type='int', default=200,
+        help="joined channels [default: %default]")
+    parser.add_option('--lines', type='int', default=10000,
+        help="lines received per channel [default: %default]")
+    parser.add_option('--buffer-lines', type='int', default=500,
+        help="lines each view keeps in memory [default: %default]")
+    options, args = parser.parse_args(argv)
+    if args:
+        parser.error("unexpected arguments: %s" % ' '.join(args))
+    return options
+
+def main(argv=None):
+    options = parse_args(argv)
+    with open(os.path.join(DATA_DIR, 'event_templates.yaml')) as f:
+        templates = eventtemplates.JinjaTemplateDict.from_yaml_f(
+            f, element_factories=True)
+    
+    # the views share one history file, as in the wx UI
+    scrollback_file = common.ScrollbackFile()
+    buffers = [common.LineBuffer(options.buffer_lines,
+            common.ScrollbackLog(scrollback_file),
+            css.element_path, css.ROOT_PATH)
+        for _ in xrange(options.channels)]
+    rng = random.Random(0)
+    
+    report('start', rss_mb(), 'MB')
+    steps = 5
+    for step in xrange(steps):
+        for _ in xrange(options.lines // steps):
+            for buf in buffers:
+                buf.append(templates.element('msg',
+                    nick='user%05d' % rng.randrange(500),
+                    msg=ircserver._sentence(rng)))
+        report('after %d lines/channel' % (
+            (step + 1) * (options.lines // steps)), rss_mb(), 'MB')
+    
+    for buf in buffers:
+        buf.close()
+    scrollback_file.close()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
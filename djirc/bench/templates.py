@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+"""Benchmark rendering events to elements
+
+Compares rendering templates to XHTML and reparsing them with lxml against the
+precompiled element factories.
+
+"""
+import os
+
+from lxml import etree
+
+from djirc import eventtemplates
+from djirc.bench import DATA_DIR, rate, report
+
+EVENTS = [
+    ('msg', dict(nick='someone', msg='hello there, <everyone> & all')),
+    ('action', dict(nick='someone', msg='waves')),
+    ('notice', dict(nick='ChanServ', msg='You are now identified.')),
+    ('join', dict(nick='someone', channel='#djirc')),
+]
+
+def main(n=20000):
+    with open(os.path.join(DATA_DIR, 'event_templates.yaml')) as f:
+        templates = eventtemplates.JinjaTemplateDict.from_yaml_f(
+            f, element_factories=True)
+    
+    for event, kwargs in EVENTS:
+        def reparse():
+            return etree.fromstring(templates[event].render(**kwargs))
+        def direct():
+            return templates.element(event, **kwargs)
+        
+        assert etree.tostring(reparse()) == etree.tostring(direct())
+        before = rate(reparse, n)
+        after = rate(direct, n)
+        report('%s: render + fromstring' % event, before, 'lines/sec')
+        report('%s: element factory' % event, after, 'lines/sec')
+
+if __name__ == '__main__':
+    main()
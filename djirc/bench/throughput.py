@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""End-to-end throughput of the protocol and rendering pipeline
+
+Starts a `FakeIRCServer` on a loopback port and connects headless clients to
+it, then replays traffic profiles and reports how fast the clients ingest and
+display them::
+
+    python -m djirc.bench.throughput --profile chatty --lines 50000
+
+Latency is measured from the server writing a line to the client having
+finished handling it (including rendering it to its view). With ``--stats``,
+the clients time each stage of the pipeline (see `djirc.metrics`) and the
+timings are printed after each profile.
+
+"""
+import sys
+import time
+import resource
+import optparse
+
+from twisted.internet import defer, task
+
+from djirc import ircclient, metrics
+from djirc.ui import headless
+from djirc.bench import ircserver, report
+
+class BenchIRCClient(ircclient.IRCClient):
+    heartbeatInterval = None
+
+    def connectionMade(self):
+        ircclient.IRCClient.connectionMade(self)
+        self.factory.bench.connected(self)
+
+    def messageReceived(self, command, prefix, params):
+        why = ircclient.IRCClient.messageReceived(self, command, prefix, params)
+        self.factory.bench.handled(self)
+        return why
+
+class BenchIRCClientFactory(ircclient.IRCClientFactory):
+    protocol = BenchIRCClient
+
+    def __init__(self, name, metaclient, view, bench):
+        ircclient.IRCClientFactory.__init__(self, name, metaclient, view)
+        self.bench = bench
+
+    def clientConnectionLost(self, connector, reason):
+        """Don't reconnect at the end of the benchmark"""
+
+class Bench(object):
+    """Match lines handled by clients to when the server sent them"""
+    def __init__(self, server_factory, n_clients):
+        self.server_factory = server_factory
+        self.clients = []
+        self.latencies = []
+        self.first_sent = None
+        self.last_handled = None
+        self._remaining = n_clients
+        self.done = defer.Deferred()
+        server_factory.finished = self._server_finished
+
+    def connected(self, client):
+        self.clients.append(client)
+
+    def _server_for(self, client):
+        port = client.transport.getHost().port
+        for server in self.server_factory.clients:
+            if server.transport.getPeer().port == port:
+                client.bench_server = server
+                return server
+        raise LookupError("No server connection for %r" % client)
+
+    def handled(self, client):
+        now = time.time()
+        try:
+            server = client.bench_server
+        except AttributeError:
+            server = self._server_for(client)
+
+        sent = server.stats.sent.popleft()
+        if self.first_sent is None or sent < self.first_sent:
+            self.first_sent = sent
+        self.last_handled = now
+        self.latencies.append(now - sent)
+
+        if server.stats.finished and not server.stats.sent:
+            self._client_done()
+
+    def _server_finished(self, server):
+        # the client may already have handled every line
+        if not server.stats.sent:
+            self._client_done()
+
+    def _client_done(self):
+        self._remaining -= 1
+        if not self._remaining:
+            self.done.callback(self)
+
+    def percentile(self, p):
+        latencies = sorted(self.latencies)
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)]
+
+def peak_rss_kb():
+    """Peak resident set size of this process (KB on Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+@defer.inlineCallbacks
+def run_profile(reactor, templates, profile, lines, clients=1, rate=None,
+        record=False, stats=None):
+    server_factory = ircserver.FakeIRCServerFactory(
+        reactor, ircserver.PROFILES[profile], lines, rate=rate)
+    port = reactor.listenTCP(0, server_factory, interface='127.0.0.1')
+    bench = Bench(server_factory, clients)
+
+    for _ in xrange(clients):
+        meta = headless.create_metaclient(
+            reactor, ircclient.IRCMetaClient, record=record)
+        meta.view_event_templates = templates
+        meta.metrics = stats
+        network = meta.ui.add_network(profile)
+        factory = BenchIRCClientFactory(profile, meta, network, bench)
+        meta.register_factory(factory)
+        reactor.connectTCP('127.0.0.1', port.getHost().port, factory)
+
+    yield bench.done
+
+    for client in bench.clients:
+        client.transport.loseConnection()
+    yield port.stopListening()
+    defer.returnValue(bench)
+
+def parse_args(argv):
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option('--profile', action='append',
+        choices=list(ircserver.PROFILES),
+        help="traffic profile to replay (repeatable) [default: all]")
+    parser.add_option('--lines', type='int', default=20000,
+        help="lines per profile and client [default: %default]")
+    parser.add_option('--clients', type='int', default=1,
+        help="simultaneous clients [default: %default]")
+    parser.add_option('--rate', type='float',
+        help="limit each client to this many lines/sec")
+    parser.add_option('--record', action='store_true',
+        help="keep the rendered text in the headless views")
+    parser.add_option('--stats', action='store_true',
+        help="time the stages of the pipeline and print the timings")
+    options, args = parser.parse_args(argv)
+    if args:
+        parser.error("unexpected arguments: %s" % ' '.join(args))
+    return options
+
+@defer.inlineCallbacks
+def main(reactor, argv=None):
+    options = parse_args(argv)
+    templates = ircclient.load_event_templates()
+
+    for profile in options.profile or list(ircserver.PROFILES):
+        stats = metrics.Metrics() if options.stats else None
+        bench = yield run_profile(reactor, templates, profile,
+            options.lines, options.clients, options.rate, options.record,
+            stats)
+        elapsed = bench.last_handled - bench.first_sent
+        report('%s: throughput' % profile,
+            len(bench.latencies) / max(elapsed, 1e-9), 'lines/sec')
+        for p in [0.5, 0.9, 0.99, 1.0]:
+            report('%s: latency p%g' % (profile, p * 100),
+                bench.percentile(p) * 1000, 'ms')
+        report('%s: peak RSS' % profile, peak_rss_kb() / 1024.0, 'MB')
+        if stats is not None:
+            for line in stats.report():
+                print '%s: %s' % (profile, line)
+
+if __name__ == '__main__':
+    task.react(main, [sys.argv[1:]])
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""Benchmark channel membership updates
+
+Times loading a 10k-user NAMES reply in bulk against adding its users one at a
+time, and QUITs of users who share many channels.
+
+"""
+import time
+import random
+
+from djirc import userlist
+from djirc.bench import report
+
+def names(n, seed=0):
+    rng = random.Random(seed)
+    entries = ['%suser%05d' % (rng.choice('@+' + ' ' * 20).strip(), i)
+        for i in xrange(n)]
+    rng.shuffle(entries)
+    # 353 replies carry about 40 names each
+    return [entries[i:i + 40] for i in xrange(0, n, 40)]
+
+def timed(func):
+    start = time.time()
+    func()
+    return time.time() - start
+
+def main(n=10000, channels=50):
+    replies = names(n)
+    
+    def bulk():
+        users = userlist.Membership()
+        users.joined('#big')
+        for reply in replies:
+            users.names('#big', reply)
+        users.end_of_names('#big')
+    
+    def one_by_one():
+        channel = userlist.Channel('#big')
+        for reply in replies:
+            for entry in reply:
+                prefix, nick = userlist.split_prefix(entry)
+                channel.add(nick, prefix)
+    
+    report('NAMES %d users: bulk load' % n, timed(bulk) * 1000, 'ms')
+    report('NAMES %d users: one at a time' % n, timed(one_by_one) * 1000, 'ms')
+    
+    users = userlist.Membership()
+    for c in xrange(channels):
+        users.joined('#c%d' % c)
+        for reply in replies:
+            users.names('#c%d' % c, reply)
+        users.end_of_names('#c%d' % c)
+    quitters = ['user%05d' % i for i in xrange(0, n, 10)]
+    elapsed = timed(lambda: [users.user_quit(nick) for nick in quitters])
+    report('QUIT fan-out over %d channels' % channels,
+        len(quitters) / elapsed, 'quits/sec')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""Benchmark `WxTabView.receive_xml` on typical lines
+
+Compares building a `wx.TextAttr` for every node with the per-UI
+`TextAttrCache`, reporting lines/sec and `wx.TextAttr`s created per line.
+Needs wxPython and a display.
+
+"""
+from __future__ import absolute_import
+
+import os
+
+import wx as wxpython
+import cssutils
+
+from djirc import eventtemplates
+from djirc.ui import wx, common, css
+from djirc.bench import DATA_DIR, rate, report
+
+EVENTS = [
+    ('msg', dict(nick='someone', msg='hello there, <everyone> & all')),
+    ('action', dict(nick='someone', msg='waves')),
+    ('notice', dict(nick='ChanServ', msg='You are now identified.')),
+]
+
+class CountingTextAttr(wxpython.TextAttr):
+    created = 0
+    def __init__(self, *args, **kwargs):
+        CountingTextAttr.created += 1
+        wxpython.TextAttr.__init__(self, *args, **kwargs)
+
+def main(n=2000):
+    app = wxpython.App(False)
+    frame = wxpython.Frame(None)
+    stylesheet = cssutils.parseFile(os.path.join(DATA_DIR, 'style.css'))
+    
+    with open(os.path.join(DATA_DIR, 'event_templates.yaml')) as f:
+        templates = eventtemplates.JinjaTemplateDict.from_yaml_f(
+            f, element_factories=True)
+    
+    cascade = css.Cascade(stylesheet)
+    def uncached(path):
+        return wx._dict2TextAttr(cascade.lookup(path))
+    
+    original_TextAttr = wxpython.TextAttr
+    wxpython.TextAttr = CountingTextAttr
+    try:
+        for event, kwargs in EVENTS:
+            element = templates.element(event, **kwargs)
+            for name, text_attrs in [
+                    ('uncached', uncached),
+                    ('cached', wx.TextAttrCache(stylesheet))]:
+                control = wxpython.TextCtrl(frame, -1, "",
+                    style=wxpython.TE_MULTILINE | wxpython.TE_RICH)
+                view = wx.WxTabView(event,
+                    scrollback_factory=lambda: common.Scrollback(1000),
+                    text_attrs=text_attrs)
+                view.attach(control)
+                
+                CountingTextAttr.created = 0
+                lines_per_sec = rate(lambda: view.receive_xml(element), n)
+                report('%s: %s' % (event, name), lines_per_sec, 'lines/sec')
+                report('%s: %s' % (event, name),
+                    CountingTextAttr.created / (3.0 * n), 'TextAttrs/line')
+                control.Destroy()
+    finally:
+        wxpython.TextAttr = original_TextAttr
+        frame.Destroy()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""Coalesce netsplit quits and the joins that follow into summary events
+
+When two servers split, every user behind the other server quits with the
+names of the two servers as the reason, and rejoins when they reconnect.
+Rather than showing thousands of quit and join lines, `Coalescer` holds them
+back and shows one summary per channel once the burst is over.
+
+"""
+import re
+
+# quit reasons like "hub.example.net leaf.example.net" or "*.net *.split"
+_HOST = r'[\w*-]+(?:\.[\w*-]+)+'
+NETSPLIT_RE = re.compile(r'^(%s) (%s)$' % (_HOST, _HOST))
+
+def netsplit_servers(reason):
+    """Return the two servers of a netsplit quit reason, or None"""
+    match = NETSPLIT_RE.match(reason)
+    if match is None:
+        return None
+    return match.groups()
+
+def summarize(nicks, max_nicks=20):
+    """List `nicks` for a summary, eliding all but the first `max_nicks`"""
+    if len(nicks) <= max_nicks:
+        return ', '.join(nicks)
+    return '%s and %d more' % (
+        ', '.join(nicks[:max_nicks]), len(nicks) - max_nicks)
+
+class Burst(object):
+    """Events held back for one summary"""
+    def __init__(self, view, event, servers, started):
+        self.view = view
+        self.event = event
+        self.servers = servers
+        self.started = started
+        self.nicks = []
+        self.call = None
+
+class Coalescer(object):
+    """Hold back netsplit quits and joins, and show summaries instead
+
+    `show(view, event, **kwargs)` is called for every summary. A burst's
+    summary is shown once no event has been added to it for `quiet`
+    seconds, or `max_delay` seconds after it started. A join is treated as
+    the end of a netsplit if the user quit in one at most `netjoin_window`
+    seconds before.
+
+    """
+    def __init__(self, reactor, show, quiet=1.0, max_delay=5.0,
+            netjoin_window=600.0, max_nicks=20):
+        self.reactor = reactor
+        self.show = show
+        self.quiet = quiet
+        self.max_delay = max_delay
+        self.netjoin_window = netjoin_window
+        self.max_nicks = max_nicks
+
+        self.bursts = {} # (view, event, servers) -> Burst
+        self.split_nicks = {} # nick -> (servers, time it quit)
+
+    def offer(self, view, event, kwargs):
+        """Offer an event on its way to `view`
+
+        Returns True if the event was held back for a summary. Otherwise
+        the caller shows it, after any summary pending for `view` (which
+        are shown first, to keep the view in order).
+
+        """
+        now = self.reactor.seconds()
+        if event == 'quit':
+            servers = netsplit_servers(kwargs.get('msg', ''))
+            if servers is not None:
+                self.split_nicks[kwargs['nick']] = (servers, now)
+                self._add(view, 'netsplit', servers, kwargs['nick'], now)
+                return True
+            self.forget(kwargs['nick'])
+        elif event in ('part', 'kick'):
+            self.forget(kwargs['nick'])
+        elif event == 'join':
+            split = self.split_nicks.get(kwargs['nick'])
+            if split is not None:
+                servers, quit_time = split
+                if now - quit_time <= self.netjoin_window:
+                    self._add(view, 'netjoin', servers, kwargs['nick'], now)
+                    return True
+                del self.split_nicks[kwargs['nick']]
+
+        self.flush(view)
+        return False
+
+    def _add(self, view, event, servers, nick, now):
+        key = (view, event, servers)
+        burst = self.bursts.get(key)
+        if burst is None:
+            burst = self.bursts[key] = Burst(view, event, servers, now)
+        if nick not in burst.nicks:
+            burst.nicks.append(nick)
+
+        # show the summary once the burst goes quiet, but don't wait longer
+        # than max_delay in all
+        delay = min(self.quiet, burst.started + self.max_delay - now)
+        if burst.call is not None and burst.call.active():
+            burst.call.reset(max(delay, 0))
+        else:
+            burst.call = self.reactor.callLater(
+                max(delay, 0), self._show, key)
+
+    def _show(self, key):
+        burst = self.bursts.pop(key, None)
+        if burst is None:
+            return
+        if burst.call is not None and burst.call.active():
+            burst.call.cancel()
+        self.expire()
+        first, second = burst.servers
+        self.show(burst.view, burst.event,
+            servers='%s <-> %s' % (first, second),
+            count=len(burst.nicks),
+            nicks=summarize(burst.nicks, self.max_nicks))
+
+    def flush(self, view=None):
+        """Show the pending summaries for `view` (or every view) now"""
+        keys = [key for key, burst in self.bursts.iteritems()
+            if view is None or key[0] is view]
+        for key in sorted(keys, key=lambda key: self.bursts[key].started):
+            self._show(key)
+
+    def forget(self, nick):
+        """Stop expecting `nick` to rejoin after a netsplit"""
+        self.split_nicks.pop(nick, None)
+
+    def expire(self):
+        """Forget the nicks that quit longer than `netjoin_window` ago"""
+        oldest = self.reactor.seconds() - self.netjoin_window
+        for nick, (_servers, quit_time) in self.split_nicks.items():
+            if quit_time < oldest:
+                del self.split_nicks[nick]
+
+    def reset(self):
+        """Show the pending summaries, and forget every split nick
+
+        Call it when the connection is lost: the nicks seen next will be
+        from a new one.
+
+        """
+        self.flush()
+        self.split_nicks.clear()
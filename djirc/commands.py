@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+"""The slash commands typed into views, and how their arguments are parsed
+
+A `CommandTable` maps command names, aliases and unambiguous abbreviations
+(``/j`` for ``/join``) to `Command`s. The lookup table is rebuilt whenever a
+command is registered, which normally only happens at startup, so that
+handling a line is a single dictionary lookup. Each command parses its
+arguments with one of the parsers below before its handler is called.
+
+"""
+
+class UsageError(Exception):
+    """A command was given the wrong arguments"""
+
+class UnknownCommand(Exception):
+    """No command has the name, alias or abbreviation typed"""
+
+class AmbiguousCommand(UnknownCommand):
+    """An abbreviation that more than one command starts with"""
+    def __init__(self, name, candidates):
+        UnknownCommand.__init__(self, name)
+        self.candidates = candidates
+
+# argument parsers: each takes the text after the command name and returns
+# the arguments for the handler, or raises UsageError
+
+def text(data):
+    """All of the text, which mustn't be empty"""
+    if not data.strip():
+        raise UsageError()
+    return (data,)
+
+def optional_text(data):
+    """All of the text, which may be empty"""
+    return (data,)
+
+def word(data):
+    """A single word"""
+    words = data.split()
+    if len(words) != 1:
+        raise UsageError()
+    return (words[0],)
+
+def word_and_optional_word(data):
+    """One word, and maybe another (as in ``/join #channel key``)"""
+    words = data.split()
+    if not 1 <= len(words) <= 2:
+        raise UsageError()
+    return tuple(words) + (None,) * (2 - len(words))
+
+def word_and_text(data):
+    """A word, then the rest of the text (as in ``/msg nick hello there``)"""
+    first, _, rest = data.lstrip().partition(' ')
+    if not first or not rest.strip():
+        raise UsageError()
+    return (first, rest)
+
+class Command(object):
+    """A slash command
+
+    `handler(protocol, context, *args)` is called with the `IRCClient`, the
+    channel or nick of the view the command was typed in (None for a network
+    view) and the arguments `parse` returns. Commands that `need_context` are
+    refused in network views.
+
+    """
+    def __init__(self, name, handler, parse=optional_text, usage='',
+            aliases=(), need_context=False):
+        self.name = name
+        self.handler = handler
+        self.parse = parse
+        self.usage = usage or '/%s' % name
+        self.aliases = tuple(aliases)
+        self.need_context = need_context
+
+    def __repr__(self):
+        return '<Command /%s>' % self.name
+
+class CommandTable(object):
+    """Commands by name, alias and unambiguous abbreviation"""
+    def __init__(self, commands=()):
+        self.commands = {} # name -> Command
+        self._lookup = {} # name, alias or abbreviation -> Command
+        self._ambiguous = {} # abbreviation -> names it could be
+        for command in commands:
+            self.register(command, rebuild=False)
+        self._rebuild()
+
+    def __iter__(self):
+        return iter(sorted(self.commands.itervalues(),
+            key=lambda command: command.name))
+
+    def __contains__(self, name):
+        return name in self.commands
+
+    def register(self, command, rebuild=True):
+        """Add `command`; raises ValueError if a name or alias is taken"""
+        taken = set(self.commands)
+        for other in self.commands.itervalues():
+            taken.update(other.aliases)
+        for name in (command.name,) + command.aliases:
+            if name in taken:
+                raise ValueError('/%s is already a command' % name)
+        self.commands[command.name] = command
+        if rebuild:
+            self._rebuild()
+
+    def unregister(self, name):
+        del self.commands[name]
+        self._rebuild()
+
+    def _rebuild(self):
+        names = {}
+        for command in self.commands.itervalues():
+            for name in (command.name,) + command.aliases:
+                names[name] = command
+
+        lookup = {}
+        ambiguous = {}
+        for name, command in names.iteritems():
+            for i in xrange(1, len(name)):
+                prefix = name[:i]
+                other = lookup.get(prefix)
+                if other is None and prefix not in ambiguous:
+                    lookup[prefix] = command
+                elif other is not command:
+                    lookup.pop(prefix, None)
+                    ambiguous.setdefault(prefix, set()).add(command.name)
+                    if other is not None:
+                        ambiguous[prefix].add(other.name)
+        # full names and aliases win over abbreviations of longer names
+        lookup.update(names)
+        for name in names:
+            ambiguous.pop(name, None)
+        self._lookup = lookup
+        self._ambiguous = ambiguous
+
+    def resolve(self, name):
+        """Return the `Command` `name` stands for
+
+        Raises `UnknownCommand`, or `AmbiguousCommand` for an abbreviation of
+        more than one command.
+
+        """
+        name = name.lower()
+        try:
+            return self._lookup[name]
+        except KeyError:
+            if name in self._ambiguous:
+                raise AmbiguousCommand(name, sorted(self._ambiguous[name]))
+            raise UnknownCommand(name)
+
+def split(line):
+    """Split an input line into `(command name, text)`
+
+    Lines that aren't commands, and lines starting with ``//`` (as in
+    xchat), are sent with ``say``.
+
+    """
+    if line.startswith('//'):
+        return 'say', line[1:]
+    if line.startswith('/'):
+        name, _, data = line[1:].partition(' ')
+        return name, data
+    return 'say', line
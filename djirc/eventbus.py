@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+"""Deliver event records to the views, loggers and plugins that want them
+
+Everything that wants `djirc.events` records subscribes to the `EventBus`
+of the `IRCMetaClient` with a filter: the network, target (channel or nick;
+'*' for a network view) and kinds of event it wants, and a glob pattern for
+the nick the event is about. Any of these left as None matches everything.
+
+Subscriptions are indexed by the network, target and kind they want, so a
+record is only looked up under the few keys that could match it, and
+delivering it costs in proportion to the subscribers that want it rather
+than to every view open. Nick patterns are compiled when subscribing, and
+only tried on subscribers the index has already matched.
+
+"""
+import fnmatch
+import itertools
+import re
+
+from twisted.python import log
+
+from djirc.userlist import irc_lower
+
+NETWORK_TARGET = '*'
+
+def _target_key(target):
+    """The index key for the record target `target`"""
+    if target is None:
+        return NETWORK_TARGET
+    return irc_lower(target)
+
+def _nick_of(record):
+    nick = getattr(record, 'nick', None)
+    if nick is None:
+        nick = record.fields.get('nick')
+    return nick
+
+class Subscription(object):
+    """A subscriber's callback and what it wants to be called with"""
+    def __init__(self, seq, callback, network, target, kinds, nick):
+        self.seq = seq
+        self.callback = callback
+        self.network = network
+        self.target = target
+        self.kinds = kinds
+        self.nick = nick
+        if nick is None:
+            self.nick_re = None
+        elif hasattr(nick, 'match'):
+            self.nick_re = nick
+        else:
+            self.nick_re = re.compile(fnmatch.translate(irc_lower(nick)))
+        self.keys = [(network, target, kind) for kind in kinds or [None]]
+
+    def wants_nick(self, record):
+        if self.nick_re is None:
+            return True
+        nick = _nick_of(record)
+        return nick is not None and \
+            self.nick_re.match(irc_lower(nick)) is not None
+
+    def __repr__(self):
+        return '<Subscription %r %s/%s %s %s>' % (self.callback,
+            self.network, self.target, self.kinds, self.nick)
+
+class EventBus(object):
+    """Publish event records to the subscribers whose filters they match
+
+    Subscribers are called in the order they subscribed. One that raises is
+    logged, and doesn't stop the record reaching the others.
+
+    """
+    def __init__(self):
+        self._seq = itertools.count()
+        # (network, target, kind), any of them None -> [Subscription]
+        self._index = {}
+        # which of network, target and kind subscriptions filter on, as
+        # (network?, target?, kind?) -> the number of subscriptions
+        self._shapes = {}
+
+    def subscribe(self, callback, network=None, target=None, kinds=None,
+            nick=None):
+        """Call `callback(record)` with each record matching the filter
+
+        `target` is a channel or nick, or '*' for a network view; `kinds`
+        a sequence of event kinds; `nick` a glob pattern (or compiled
+        regular expression, matched against the lower-cased nick).
+
+        Returns the `Subscription`, to pass to `unsubscribe`.
+
+        """
+        if target is not None:
+            target = _target_key(target)
+        if kinds is not None:
+            kinds = tuple(kinds)
+        sub = Subscription(next(self._seq), callback, network, target, kinds,
+            nick)
+        for key in sub.keys:
+            # lists are replaced rather than changed, so that subscribers
+            # can unsubscribe (or subscribe) while a record is published
+            self._index[key] = self._index.get(key, []) + [sub]
+            shape = tuple(part is not None for part in key)
+            self._shapes[shape] = self._shapes.get(shape, 0) + 1
+        return sub
+
+    def unsubscribe(self, sub):
+        """Stop calling the subscriber of the `Subscription` `sub`"""
+        for key in sub.keys:
+            subs = self._index.get(key, [])
+            if sub not in subs:
+                continue
+            subs = [other for other in subs if other is not sub]
+            if subs:
+                self._index[key] = subs
+            else:
+                del self._index[key]
+            shape = tuple(part is not None for part in key)
+            self._shapes[shape] -= 1
+            if not self._shapes[shape]:
+                del self._shapes[shape]
+
+    def subscribers(self, record):
+        """Return the subscriptions `record` matches, in order"""
+        network, target, kind = \
+            record.network, _target_key(record.target), record.kind
+        index = self._index
+        found = []
+        for has_network, has_target, has_kind in self._shapes:
+            subs = index.get((has_network and network or None,
+                has_target and target or None, has_kind and kind or None))
+            if subs:
+                found.append(subs)
+        if not found:
+            return []
+        if len(found) == 1:
+            subs = found[0]
+        else:
+            subs = sorted(itertools.chain(*found), key=lambda sub: sub.seq)
+        return [sub for sub in subs if sub.wants_nick(record)]
+
+    def publish(self, record):
+        """Call every subscriber whose filter matches `record`"""
+        for sub in self.subscribers(record):
+            try:
+                sub.callback(record)
+            except Exception:
+                log.err(None, 'Error delivering %r to %r' % (record, sub))
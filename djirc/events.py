@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""Compact records of the events shown in views
+
+The client passes these around instead of rendered markup: a record says
+what happened, and is only rendered with the event templates where a view
+needs to display it. Views that aren't showing keep the records as they are
+(see `common.LineBuffer.append_event`), so a busy channel in a background tab
+costs a small object per line rather than an lxml tree or its flattened text
+and style runs.
+
+Every record has a `kind` (the name of its event template), a dict of
+template `fields`, the `network` and `target` (channel or nick, None for a
+network view) it's for, and the time `ts` it happened. Messages, by far the
+most common, are `Msg`s, which keep their fields in slots; everything else
+is an `Event` holding its fields in a dict.
+
+"""
+import re
+
+from djirc import logstore
+
+_ESCAPE_RE = re.compile(r'\\(.)')
+_UNESCAPES = {'n': '\n'}
+
+class Event(object):
+    """An event shown with the template `kind` filled in with `fields`"""
+    __slots__ = ['network', 'target', 'kind', 'fields', 'ts']
+
+    def __init__(self, network, target, kind, fields, ts):
+        self.network = network
+        self.target = target
+        self.kind = kind
+        self.fields = fields
+        self.ts = ts
+
+    def __repr__(self):
+        return '<%s %s %s/%s %r>' % (type(self).__name__, self.kind,
+            self.network, self.target, self.fields)
+
+class Msg(object):
+    """A message, notice or action (`kind` 'msg', 'notice' or 'action')"""
+    __slots__ = ['network', 'target', 'nick', 'text', 'kind', 'ts']
+
+    def __init__(self, network, target, nick, text, kind, ts):
+        self.network = network
+        self.target = target
+        self.nick = nick
+        self.text = text
+        self.kind = kind
+        self.ts = ts
+
+    @property
+    def fields(self):
+        return {'nick': self.nick, 'msg': self.text}
+
+    def __repr__(self):
+        return '<%s %s %s/%s %s: %r>' % (type(self).__name__, self.kind,
+            self.network, self.target, self.nick, self.text)
+
+MSG_KINDS = frozenset(['msg', 'notice', 'action'])
+
+def make(network, target, kind, fields, ts):
+    """Return the most compact record for the event"""
+    if kind in MSG_KINDS and len(fields) == 2 and 'nick' in fields \
+            and 'msg' in fields:
+        return Msg(network, target, fields['nick'], fields['msg'], kind, ts)
+    return Event(network, target, kind, fields, ts)
+
+def to_line(record):
+    """Serialize `record`'s kind and fields to a str without newlines
+
+    Lines start with a NUL, so they can be told apart from the serialized
+    elements (see `common.element_to_line`) they may be stored with.
+
+    """
+    payload = logstore.encode_payload(record.kind, record.fields)
+    return '\0' + payload.replace('\\', '\\\\').replace('\n', '\\n')
+
+def is_line(line):
+    """Whether `line` was created by `to_line`"""
+    return line.startswith('\0')
+
+def from_line(line, network=None, target=None, ts=None):
+    """Return the record serialized by `to_line` as `line`"""
+    payload = _ESCAPE_RE.sub(
+        lambda m: _UNESCAPES.get(m.group(1), m.group(1)), line[1:])
+    kind, fields = logstore.decode_payload(payload)
+    return make(network, target, kind, fields, ts)
@@ -1,22 +1,260 @@
-import yaml
-import jinja2
+import os
+import re
+import copy
+import errno
+import marshal
+
+# yaml and jinja2 are slow to import, so they are only imported once
+# templates are loaded (and yaml only if there's no cached copy)
+from lxml import etree
 
 def guess_autoescape(_template_name):
     return True
 
+# only plain variable substitutions can be compiled to element factories
+_VARIABLE_RE = re.compile(r'\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}')
+_JINJA_SYNTAX = ('{{', '{%', '{#')
+
+# slots are marked with private-use characters, which are legal XML text
+_SLOT_START = u'\ue000'
+_SLOT_END = u'\ue001'
+_SLOT_RE = re.compile(u'%s(\\d+)%s' % (_SLOT_START, _SLOT_END))
+
+def _normalize_text(value):
+    """Apply the XML parser's line-end normalization to character data"""
+    return value.replace(u'\r\n', u'\n').replace(u'\r', u'\n')
+
+def _normalize_attribute(value):
+    """Apply the XML parser's attribute-value normalization"""
+    return _normalize_text(value).replace(u'\n', u' ').replace(u'\t', u' ')
+
+# bump when the format of cached yaml changes
+YAML_CACHE_VERSION = 1
+
+def load_yaml(path, cache_path=None):
+    """Load the yaml file at `path`, through a marshalled copy at `cache_path`
+
+    The copy is used as long as the file has the modification time and size
+    it had when the copy was made, and is rewritten otherwise. Caching is
+    skipped if the copy can't be written.
+
+    """
+    st = os.stat(path)
+    key = (YAML_CACHE_VERSION, st.st_mtime, st.st_size)
+    if cache_path is not None:
+        try:
+            with open(cache_path, 'rb') as f:
+                cached_key, data = marshal.load(f)
+        except (IOError, EOFError, ValueError, TypeError):
+            pass
+        else:
+            if cached_key == key:
+                return data
+
+    import yaml
+    with open(path) as f:
+        data = yaml.safe_load(f)
+    if cache_path is not None:
+        # write a new copy and move it into place, so readers never see half
+        temp_path = '%s.%d.tmp' % (cache_path, os.getpid())
+        try:
+            with open(temp_path, 'wb') as f:
+                marshal.dump((key, data), f)
+            os.rename(temp_path, cache_path)
+        except (IOError, OSError, ValueError):
+            pass
+    return data
+
+def cache_directory(path):
+    """Create the directory `path` if needed; returns it, or None if unusable
+    """
+    try:
+        os.makedirs(path)
+    except OSError, e:
+        if e.errno != errno.EEXIST:
+            return None
+    if not os.access(path, os.W_OK):
+        return None
+    return path
+
+class ElementTemplate(object):
+    """Element factory for a template that only substitutes plain variables
+
+    The template source is parsed once into a skeleton element. Rendering
+    copies the skeleton and fills in the text, tails and attribute values that
+    held a ``{{ variable }}``, producing the same tree that
+    ``etree.fromstring(template.render(...))`` would.
+
+    """
+    def __init__(self, skeleton, names, slots):
+        self.skeleton = skeleton
+        self.names = names
+        # (index in skeleton.iter(), field, parts)
+        # field is 'text', 'tail' or ('attrib', name); parts alternate between
+        # literal strings (even indices) and variable names (odd indices)
+        self.slots = slots
+
+    @classmethod
+    def compile(cls, source):
+        """Compile template `source`, or return None if it's not simple enough
+
+        """
+        if not isinstance(source, unicode):
+            source = source.decode('utf-8')
+        if _SLOT_START in source or _SLOT_END in source:
+            return None
+
+        names = []
+        def mark(match):
+            names.append(match.group(1))
+            return u'%s%d%s' % (_SLOT_START, len(names) - 1, _SLOT_END)
+
+        marked = _VARIABLE_RE.sub(mark, source)
+        if any(syntax in marked for syntax in _JINJA_SYNTAX):
+            return None
+
+        try:
+            skeleton = etree.fromstring(marked)
+        except etree.XMLSyntaxError:
+            return None
+
+        def parts_of(value):
+            parts = _SLOT_RE.split(value)
+            for i in xrange(1, len(parts), 2):
+                parts[i] = names[int(parts[i])]
+            return parts
+
+        slots = []
+        for i, node in enumerate(skeleton.iter()):
+            if node.text and _SLOT_START in node.text:
+                slots.append((i, 'text', parts_of(node.text)))
+            if node.tail and _SLOT_START in node.tail:
+                slots.append((i, 'tail', parts_of(node.tail)))
+            for name, value in node.attrib.items():
+                if _SLOT_START in value:
+                    slots.append((i, ('attrib', name), parts_of(value)))
+
+        return cls(skeleton, sorted(set(names)), slots)
+
+    def render(self, kwargs):
+        """Create a new element with `kwargs` substituted into the slots
+
+        Returns None if a value can't be substituted as plain text (i.e. it is
+        already markup), in which case the caller should render the template
+        through Jinja instead.
+
+        """
+        values = {}
+        for name in self.names:
+            try:
+                value = kwargs[name]
+            except KeyError:
+                # jinja renders undefined variables as empty strings
+                value = u''
+            else:
+                if hasattr(value, '__html__'):
+                    return None
+                value = unicode(value)
+            values[name] = value
+
+        element = copy.deepcopy(self.skeleton)
+        if not self.slots:
+            return element
+
+        nodes = list(element.iter())
+        for i, field, parts in self.slots:
+            value = u''.join([
+                values[part] if j % 2 else part
+                for j, part in enumerate(parts)])
+            node = nodes[i]
+            # the parser leaves empty character data as None
+            if field == 'text':
+                node.text = _normalize_text(value) or None
+            elif field == 'tail':
+                node.tail = _normalize_text(value) or None
+            else:
+                node.set(field[1], _normalize_attribute(value))
+        return element
+
 class JinjaTemplateDict(object):
-    def __init__(self, d):
+    def __init__(self, d, element_factories=False, cache_dir=None):
+        """Create a template dict from a dict of jinja2 template sources
+
+        Every template is compiled up front. If `element_factories` is true,
+        templates that only substitute plain variables are also precompiled
+        into `ElementTemplate`s, so that `element` can build their elements
+        without rendering and reparsing XHTML. With a `cache_dir`, compiled
+        templates are kept there as Jinja bytecode for the next start.
+
+        """
+        import jinja2
+        bytecode_cache = None
+        if cache_dir is not None:
+            bytecode_cache = jinja2.FileSystemBytecodeCache(cache_dir)
         self.env = jinja2.Environment(
             autoescape=guess_autoescape,
             loader=jinja2.DictLoader(d),
+            bytecode_cache=bytecode_cache,
             extensions=['jinja2.ext.autoescape'])
-    
+        self.templates = dict((k, self.env.get_template(k)) for k in d)
+
+        self.element_factories = {}
+        if element_factories:
+            for k, source in d.iteritems():
+                factory = ElementTemplate.compile(source)
+                if factory is not None:
+                    self.element_factories[k] = factory
+
     @classmethod
-    def from_yaml_f(cls, f):
+    def from_yaml_f(cls, f, **kwargs):
         """Create a template dict from a file containing yaml with jinja2 values
-        
+
         """
-        return cls(yaml.safe_load(f))
-    
+        import yaml
+        return cls(yaml.safe_load(f), **kwargs)
+
+    @classmethod
+    def from_yaml_file(cls, path, cache_dir=None, **kwargs):
+        """Create a template dict from the yaml file at `path`
+
+        With a `cache_dir`, the parsed yaml and the compiled templates are
+        cached there (see `load_yaml`), if it can be created and written.
+
+        """
+        cache_path = None
+        if cache_dir is not None:
+            cache_dir = cache_directory(cache_dir)
+        if cache_dir is not None:
+            cache_path = os.path.join(
+                cache_dir, os.path.basename(path) + '.marshal')
+        return cls(load_yaml(path, cache_path), cache_dir=cache_dir, **kwargs)
+
     def __getitem__(self, k):
-        return self.env.get_template(k)
+        try:
+            return self.templates[k]
+        except KeyError:
+            import jinja2
+            raise jinja2.TemplateNotFound(k)
+
+    def element(self, k, **kwargs):
+        """Render template `k` with `kwargs` to an lxml element"""
+        try:
+            factory = self.element_factories[k]
+        except KeyError:
+            pass
+        else:
+            element = factory.render(kwargs)
+            if element is not None:
+                return element
+        return etree.fromstring(self[k].render(**kwargs))
+
+    def timed_element(self, metrics, k, kwargs):
+        """Render template `k` like `element`, timing each step in `metrics`
+        """
+        factory = self.element_factories.get(k)
+        if factory is not None:
+            element = metrics.time('render: substitute', factory.render, kwargs)
+            if element is not None:
+                return element
+        source = metrics.time('render: jinja', self[k].render, **kwargs)
+        return metrics.time('render: parse', etree.fromstring, source)
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+"""Pace outgoing lines so that servers don't disconnect us for flooding
+
+Servers charge every line a penalty (ircu and its descendants charge about
+two seconds plus one second per 120 bytes) and drop clients that get more than
+about ten seconds of penalty ahead of the clock. `TokenBucket` models that
+budget, and `OutboundQueue` holds lines back until the budget allows them,
+sending control traffic such as PONG ahead of chat.
+
+"""
+import collections
+
+MAX_LINE = 510 # bytes, not counting the CR LF
+
+# lines for these commands skip ahead of everything else that is queued
+PRIORITY_COMMANDS = frozenset(['PONG', 'PING', 'PASS', 'NICK', 'USER', 'CAP',
+    'QUIT'])
+
+# commands whose parameter is a comma separated list of channels, so that
+# several queued lines can be sent as one
+MERGEABLE_COMMANDS = frozenset(['JOIN', 'PART'])
+
+def command(line):
+    """Return the command of a raw IRC line, upper-cased"""
+    if line.startswith(':'):
+        line = line.partition(' ')[2]
+    return line.partition(' ')[0].upper()
+
+def penalty(line):
+    """Return how many seconds of flood penalty a server charges for `line`"""
+    return 2 + len(line) // 120
+
+def merge(first, second):
+    """Return `first` and `second` as a single line, or None if impossible
+
+    Only lines like ``JOIN #a`` and ``JOIN #b`` (same command, no keys or part
+    message) are merged, into ``JOIN #a,#b``.
+
+    """
+    first_command, _, first_targets = first.partition(' ')
+    second_command, _, second_targets = second.partition(' ')
+    if (first_command.upper() != second_command.upper() or
+            first_command.upper() not in MERGEABLE_COMMANDS):
+        return None
+    if not first_targets or not second_targets:
+        return None
+    if ' ' in first_targets or ' ' in second_targets:
+        return None
+    # "JOIN 0" parts all channels
+    if first_targets == '0' or second_targets == '0':
+        return None
+
+    merged = '%s %s,%s' % (first_command, first_targets, second_targets)
+    if len(merged) > MAX_LINE:
+        return None
+    return merged
+
+class TokenBucket(object):
+    """Allow `capacity` units of cost at once, refilled at `rate` per second
+
+    `clock` provides the time through `seconds()`, like the reactor.
+
+    """
+    def __init__(self, clock, capacity=10.0, rate=1.0):
+        self.clock = clock
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self._last = clock.seconds()
+
+    def _refill(self):
+        now = self.clock.seconds()
+        self.tokens = min(self.capacity,
+            self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def consume(self, cost):
+        """Take `cost` tokens if there are enough; returns whether it did
+
+        A cost larger than the capacity is charged as the whole capacity.
+
+        """
+        self._refill()
+        cost = min(cost, self.capacity)
+        if self.tokens < cost:
+            return False
+        self.tokens -= cost
+        return True
+
+    def delay(self, cost):
+        """Return how many seconds until `cost` tokens are available"""
+        self._refill()
+        cost = min(cost, self.capacity)
+        return max(cost - self.tokens, 0) / float(self.rate)
+
+class OutboundQueue(object):
+    """Send lines through `send` as fast as `bucket` allows
+
+    Lines for `PRIORITY_COMMANDS` are sent before any other queued line, and
+    otherwise lines go out in order. Consecutive JOIN or PART lines waiting in
+    the queue are merged. Without a `bucket`, lines are sent at once.
+
+    """
+    def __init__(self, reactor, send, bucket=None, cost=penalty):
+        self.reactor = reactor
+        self.send = send
+        self.bucket = bucket
+        self.cost = cost
+
+        # [line, time queued]
+        self.priority = collections.deque()
+        self.normal = collections.deque()
+        self._call = None
+        self._idle = [] # called once the normal lane is empty
+
+        # statistics
+        self.sent = 0
+        self.merged = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def __len__(self):
+        return len(self.priority) + len(self.normal)
+
+    @property
+    def depth(self):
+        """Number of lines waiting to be sent"""
+        return len(self)
+
+    def mean_wait(self):
+        """Mean seconds lines sent so far spent in the queue"""
+        if not self.sent:
+            return 0.0
+        return self.total_wait / self.sent
+
+    def oldest_wait(self):
+        """Seconds the line that has waited longest has been in the queue"""
+        queued = [lane[0][1] for lane in (self.priority, self.normal) if lane]
+        if not queued:
+            return 0.0
+        return self.reactor.seconds() - min(queued)
+
+    def put(self, line):
+        """Queue `line` to be sent, and send what the bucket allows"""
+        if command(line) in PRIORITY_COMMANDS:
+            lane = self.priority
+        else:
+            lane = self.normal
+
+        merged = lane and merge(lane[-1][0], line)
+        if merged:
+            lane[-1][0] = merged
+            self.merged += 1
+        else:
+            lane.append([line, self.reactor.seconds()])
+        self._pump()
+
+    def when_idle(self, callback):
+        """Call `callback()` once no ordinary lines are waiting to be sent"""
+        if self.normal:
+            self._idle.append(callback)
+        else:
+            callback()
+
+    def _pump(self):
+        if self._call is not None and self._call.active():
+            self._call.cancel()
+        self._call = None
+        while self.priority or self.normal:
+            lane = self.priority or self.normal
+            line, queued = lane[0]
+            if self.bucket is not None:
+                cost = self.cost(line)
+                if not self.bucket.consume(cost):
+                    self._call = self.reactor.callLater(
+                        self.bucket.delay(cost), self._pump)
+                    break
+            lane.popleft()
+
+            wait = self.reactor.seconds() - queued
+            self.sent += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self.send(line)
+
+        if self._idle and not self.normal:
+            idle, self._idle = self._idle, []
+            for callback in idle:
+                callback()
+
+    def clear(self):
+        """Drop every queued line"""
+        if self._call is not None and self._call.active():
+            self._call.cancel()
+        self._call = None
+        self.priority.clear()
+        self.normal.clear()
+        self._idle = []
@@ -67,6 +67,9 @@ class IUIWindow(Interface):
         """
 
 class IUITab(Interface):
+    name = Attribute("Channel or nick the tab is for (None for a network)")
+    network = Attribute("Name of the network the tab belongs to")
+    
     def highlight():
         """Highlight the tab view in the UI
         
@@ -94,6 +97,37 @@ class IUITab(Interface):
         
         """
 
+class IUIPreparedTab(IUITab):
+    """A tab that can do most of the work of displaying a line in advance
+    
+    `receive_xml(element)` is the same as
+    `receive_prepared(prepare_xml(element))`.
+    
+    """
+    
+    def prepare_xml(element):
+        """Return what `receive_prepared` needs to display `element`
+        
+        Must be safe to call from any thread, and not keep `element`.
+        
+        """
+    
+    def receive_prepared(prepared):
+        """Display a line returned by `prepare_xml`"""
+
+class IUIEventTab(IUITab):
+    """A tab that takes event records, and renders them only when needed
+    
+    Tabs that aren't showing can keep records (see `djirc.events`) as they
+    are, rather than rendering every line they are sent.
+    
+    """
+    showing = Attribute("Whether lines received now are displayed now, "
+        "rather than kept as records")
+    
+    def receive_event(record):
+        """Display the event record `record` in the tab"""
+
 class IUINetwork(Interface):
     """Handle for the UI's network tree/tab
     
@@ -132,15 +166,24 @@ class IUIChannel(IUITab):
 class IUIUserList(Interface):
     """Handle for a channel tab user-list.
     
-    Presently just accepts user set management. Actual sorting/etc. is left to
-    the UI implementation
+    The client keeps the membership of each channel in display order (see
+    `djirc.userlist.Channel`), and passes it on once per batch of changes
+    with `set_users`.
     
     """
     def add_user(nick):
         """Add `nick` to the user list"""
     
     def remove_user(nick):
-        """Add `nick` to the user list"""
+        """Remove `nick` from the user list"""
+    
+    def set_users(users):
+        """Replace the user list with `users`
+        
+        `users` is a sequence of `(prefix, nick)` pairs, already sorted for
+        display; `prefix` holds the user's prefix modes, such as '@' or '+'.
+        
+        """
 
 class IUIConvo(IUITab):
     """Handle for the UI's private conversation tab/display
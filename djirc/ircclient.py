@@ -1,25 +1,41 @@
 #!/usr/bin/env python
 
 # twisted imports
-from twisted.internet import wxreactor
-wxreactor.install()
-
-# import twisted reactor *only after* installing wxreactor
+# (the reactor is only imported in main, once the UI has installed its own)
 from twisted.words.protocols import irc
-from twisted.internet import reactor, protocol
-from twisted.python import log
+from twisted.internet import protocol, task
+from twisted.python import log, threadpool
 
 # system imports
 import sys
 import platform
 import os
 import itertools
-
-# third party
-from lxml import etree
+import optparse
+import re
+import time
 
 # local imports
-from djirc import ui, eventtemplates
+from djirc import ui, interfaces, eventtemplates, reconnect, floodcontrol, \
+    logstore, userlist, coalesce, ircparse, commands, paste, metrics, \
+    profiler, renderpool, events, eventbus
+from djirc.ui import common
+
+EVENT_TEMPLATES_FILE = os.path.join(
+    os.path.dirname(__file__), 'data', 'event_templates.yaml')
+DEFAULT_UI = 'wx'
+DEFAULT_HISTORY_DIR = os.path.join('~', '.djirc', 'history')
+DEFAULT_CACHE_DIR = os.path.join('~', '.djirc', 'cache')
+DEFAULT_PROFILE_DIR = os.path.join('~', '.djirc', 'profiles')
+
+# /search -30d, -12h, -10m: limit the search to recent history
+SEARCH_AGE_RE = re.compile(r'-(\d+)([dhm])(?:\s+|$)')
+SEARCH_AGE_UNITS = {'d': 24 * 60 * 60, 'h': 60 * 60, 'm': 60}
+SEARCH_TIME_FORMAT = '%Y-%m-%d %H:%M'
+
+def load_event_templates(path=EVENT_TEMPLATES_FILE, cache_dir=None):
+    return eventtemplates.JinjaTemplateDict.from_yaml_file(
+        path, cache_dir, element_factories=True)
 
 class IRCClient(irc.IRCClient):
     nickname = "testdjirc"
@@ -32,25 +48,75 @@ class IRCClient(irc.IRCClient):
     versionNum = '0.0a'
     versionEnv = platform.system()
     sourceURL = None
-    lineRate = None
+    lineRate = None # superseded by the outbound queue
+    # flood control: seconds of penalty the server lets us get ahead by, and
+    # how fast that allowance comes back (None to send lines immediately)
+    outboundBurst = 10.0
+    outboundRate = 1.0
+    search_limit = 100 # most results shown by /search
+    paste_notice_lines = 5 # pastes this long say when they start and finish
     
     def connectionMade(self):
+        reactor = self.factory.meta.reactor
+        bucket = None
+        if self.outboundRate is not None:
+            bucket = floodcontrol.TokenBucket(
+                reactor, self.outboundBurst, self.outboundRate)
+        self.outbound = floodcontrol.OutboundQueue(
+            reactor, self._reallySendLine, bucket)
+        self.factory.users = userlist.Membership()
+        self.pastes = {} # target -> paste.Paste being sent
+        self.reader = ircparse.MessageReader(self.messageReceived,
+            self.badMessage, self.lineLengthExceeded, self.MAX_LENGTH)
         irc.IRCClient.connectionMade(self)
-        self.factory.view.receive_xml(etree.fromstring(
-            self.factory.meta.view_event_templates['connect'].render()))
+        self.factory.deliver(self.factory.view, 'connect')
 
     def connectionLost(self, reason):
         irc.IRCClient.connectionLost(self, reason)
-        self.factory.view.receive_xml(etree.fromstring(
-            self.factory.meta.view_event_templates['disconnect'].render(
-                msg=reason)))
+        self.outbound.clear()
+        for pasting in self.pastes.values():
+            pasting.cancel()
+        self.factory.coalescer.reset()
+        self.factory.deliver(self.factory.view, 'disconnect', msg=reason)
+    
+    def sendLine(self, line):
+        """Queue `line`, to be sent as soon as flood control allows"""
+        self.outbound.put(line)
+    
+    def dataReceived(self, data):
+        """Handle each complete message in `data`, see `ircparse`"""
+        stats = self.factory.meta.metrics
+        if stats is None:
+            self.reader.feed(data)
+        else:
+            stats.count('bytes received', len(data))
+            stats.time('receive', self.reader.feed, data)
+    
+    def lineReceived(self, line):
+        buf = bytearray(line)
+        try:
+            prefix, command, params = ircparse.parse(buf, 0, len(buf))
+        except irc.IRCBadMessage:
+            return self.badMessage(line, *sys.exc_info())
+        return self.messageReceived(command, prefix, params)
+    
+    def messageReceived(self, command, prefix, params):
+        """Handle a parsed message; returns true to stop reading for now"""
+        command = irc.numeric_to_symbolic.get(command, command)
+        stats = self.factory.meta.metrics
+        if stats is None:
+            self.handleCommand(command, prefix, params)
+        else:
+            stats.time('handle ' + command,
+                self.handleCommand, command, prefix, params)
+        return self.transport is not None and self.transport.disconnecting
     
     # callbacks for events
     
     def signedOn(self):
         """Called when client has succesfully signed on to server."""
-        self.factory.view.receive_xml(etree.fromstring(
-            self.factory.meta.view_event_templates['signon'].render()))
+        self.factory.reconnect.reset()
+        self.factory.deliver(self.factory.view, 'signon')
     
     def nickChanged(self, new_nick):
         """This will get called when the client's nickname has been changed."""
@@ -59,36 +125,85 @@ class IRCClient(irc.IRCClient):
         
         old_nick = self.nickname
         self.nickname = new_nick
-        nick_msg = self.factory.meta.view_event_templates['you-change-nick'].render(
-            old_nick=old_nick,
-            new_nick=new_nick)
-        
-        for view in self.factory.views:
-            view.receive_xml(etree.fromstring(nick_msg))
+        for view in self.factory.views.values():
+            self.factory.deliver(view, 'you-change-nick',
+                old_nick=old_nick,
+                new_nick=new_nick)
     
     def joined(self, channel):
         """This will get called when the client joins the channel."""
-        ch = self.factory.views[channel] = self.factory.view.add_channel(channel)
-        ch.receive_xml(etree.fromstring(
-            self.factory.meta.view_event_templates['you-join'].render(
-                channel=channel)))
+        ch = self.factory.add_view(channel,
+            self.factory.view.add_channel(channel))
+        self.factory.users.joined(channel)
+        self.factory.deliver(ch, 'you-join', channel=channel)
+    
+    def left(self, channel, msg=''):
+        """Called when the client has left `channel`."""
+        self.factory.users.left(channel)
+        self.factory.deliver(self.factory.views[channel], 'you-part',
+            channel=channel, msg=msg)
+    
+    def kickedFrom(self, channel, kicker, message):
+        """Called when the client was kicked from `channel`."""
+        self.factory.users.left(channel)
+        self.factory.deliver(self.factory.views[channel], 'kick',
+            nick=self.nickname, channel=channel, kicker=kicker, msg=message)
+    
+    def userJoined(self, user, channel):
+        """Called when someone else joins `channel`."""
+        model = self.factory.users.user_joined(channel, user)
+        if model is not None:
+            self.factory.users_changed(model)
+        self.factory.deliver(self.factory.views[channel], 'join',
+            nick=user, channel=channel)
+    
+    def userLeft(self, user, channel, msg=''):
+        """Called when someone else leaves `channel`."""
+        model = self.factory.users.user_left(channel, user)
+        if model is not None:
+            self.factory.users_changed(model)
+        self.factory.deliver(self.factory.views[channel], 'part',
+            nick=user, channel=channel, msg=msg)
+    
+    def userKicked(self, kickee, channel, kicker, message):
+        """Called when someone else is kicked from `channel`."""
+        model = self.factory.users.user_left(channel, kickee)
+        if model is not None:
+            self.factory.users_changed(model)
+        self.factory.deliver(self.factory.views[channel], 'kick',
+            nick=kickee, channel=channel, kicker=kicker, msg=message)
+    
+    def userQuit(self, user, quitMessage):
+        """Called when someone quits; shown in every channel they were in"""
+        for model in self.factory.users.user_quit(user):
+            self.factory.users_changed(model)
+            self.factory.deliver(self.factory.views[model.name], 'quit',
+                nick=user, msg=quitMessage)
+    
+    def modeChanged(self, user, channel, set, modes, args):
+        """Called when modes are changed; tracks prefix modes of members"""
+        for mode, arg in zip(modes, args):
+            if arg is None:
+                continue
+            model = self.factory.users.mode_changed(channel, arg, mode, set)
+            if model is not None:
+                self.factory.users_changed(model)
     
     def _get_msg(self, user, channel, msg, event):
         """This will get called when the client receives a message, notice, or action"""
         nick = user.split('!', 1)[0]
+        factory = self.factory
         # Check to see if they're sending me a private message
         if channel == self.nickname:
-            try:
-                target_view = self.factory.views[nick]
-            except KeyError:
-                target_view = self.factory.views[nick] = self.factory.view.add_convo(nick)
+            target = nick
+            if nick not in factory.views:
+                factory.add_view(nick, factory.view.add_convo(nick))
         else:
-            target_view = self.factory.views[channel]
+            target = channel
         
-        target_view.receive_xml(etree.fromstring(
-            self.factory.meta.view_event_templates[event].render(
-                nick=nick,
-                msg=msg)))
+        # the event bus finds the view for the target
+        factory.deliver_record(events.Msg(factory.name, target, nick, msg,
+            event, factory.meta.reactor.seconds()))
     
     def privmsg(self, user, channel, msg):
         """This will get called when the client receives a message."""
@@ -104,6 +219,34 @@ class IRCClient(irc.IRCClient):
 
     # irc callbacks
 
+    def irc_RPL_MOTD(self, prefix, params):
+        """Show each line of the message of the day as it arrives"""
+        irc.IRCClient.irc_RPL_MOTD(self, prefix, params)
+        self.factory.deliver(self.factory.views['*'], 'motd', msg=params[-1])
+
+    def irc_PART(self, prefix, params):
+        """Called when a user leaves a channel, with an optional message."""
+        nick = prefix.split('!')[0]
+        channel = params[0]
+        msg = params[1] if len(params) > 1 else ''
+        if nick == self.nickname:
+            self.left(channel, msg)
+        else:
+            self.userLeft(nick, channel, msg)
+
+    def irc_RPL_NAMREPLY(self, prefix, params):
+        """Collect a NAMES reply; applied all at once at its end"""
+        channel, names = params[2], params[3]
+        self.factory.users.names(channel, names.split(' '))
+
+    def irc_RPL_ENDOFNAMES(self, prefix, params):
+        channel = params[1]
+        model = self.factory.users.end_of_names(channel)
+        if model is not None:
+            self.factory.users_changed(model)
+            self.factory.deliver(self.factory.views[channel], 'names',
+                channel=channel, count=len(model))
+
     def irc_NICK(self, prefix, params):
         """Called when an IRC user changes their nickname."""
         old_nick = prefix.split('!')[0]
@@ -111,10 +254,12 @@ class IRCClient(irc.IRCClient):
         if old_nick == self.nickname:
             self.nickChanged(new_nick)
         else:
-            self.factory.view.receive_xml(etree.fromstring(
-                self.factory.meta.view_event_templates['change-nick'].render(
-                    old_nick=old_nick,
-                    new_nick=new_nick)))
+            models = self.factory.users.user_renamed(old_nick, new_nick)
+            for model in models:
+                self.factory.users_changed(model)
+            self.factory.deliver(self.factory.view, 'change-nick',
+                old_nick=old_nick,
+                new_nick=new_nick)
 
 
     # For fun, override the method that determines how a nickname is changed on
@@ -125,37 +270,207 @@ class IRCClient(irc.IRCClient):
         """
         return nickname + '_'
     
+    def say(self, target, data):
+        """Send the text `data` to `target`, as a paste if it's long
+        
+        Text with several lines, or too long for one message, is split into
+        lines that fit and sent as flood control allows.
+        
+        """
+        limit = paste.text_limit('PRIVMSG %s :' % target, self.nickname)
+        lines = paste.split_paste(data, limit)
+        if not lines:
+            return
+        if len(lines) == 1 and target not in self.pastes:
+            self.sendLine('PRIVMSG %s :%s' % (target, lines[0]))
+            # simulate a privmsg with this content for consistency
+            self.privmsg(self.nickname, target,
+                lines[0].decode('utf-8', 'replace'))
+            return
+        
+        pasting = self.pastes.get(target)
+        if pasting is not None:
+            pasting.extend(lines)
+            return
+        factory = self.factory
+        # a channel we haven't joined has no view; show it in the network's
+        view = factory.views.get(target, factory.view)
+        
+        def echo(sent):
+            for line in sent:
+                factory.deliver(view, 'msg', nick=self.nickname,
+                    msg=line.decode('utf-8', 'replace'))
+        
+        def done(pasting):
+            del self.pastes[target]
+            if pasting.cancelled:
+                factory.show(view, 'paste-cancelled', target=target,
+                    sent=pasting.sent, count=pasting.total)
+            elif pasting.total >= self.paste_notice_lines:
+                factory.show(view, 'paste-done', target=target,
+                    count=pasting.total)
+        
+        pasting = self.pastes[target] = paste.Paste(
+            self.outbound, target, lines, echo, done)
+        if len(lines) >= self.paste_notice_lines:
+            factory.show(view, 'paste-start', target=target, count=len(lines))
+        pasting.start()
+    
     # dispatch routines
     def do_say(self, channel, data):
-        # simulate a privmsg with this content for consistency
-        self.msg(channel, data)
-        self.privmsg(self.nickname, channel, data)
+        self.say(channel, data)
     
     def do_me(self, channel, data):
         self.describe(channel, data)
         self.action(self.nickname, channel, data)
     
-    def do_msg(self, _channel, data):
-        user, data = data.split(' ', 1)
+    def do_msg(self, _channel, user, data):
+        # open a tab for the conversation first
+        if user not in self.factory.views and \
+                user[:1] not in irc.CHANNEL_PREFIXES:
+            self.factory.add_view(user, self.factory.view.add_convo(user))
+        self.say(user, data)
+    
+    def do_join(self, _channel, channel, key=None):
+        self.join(channel, key)
+    
+    def do_nick(self, _channel, nick):
+        self.setNick(nick)
+    
+    def do_paste(self, channel, data):
+        """Show how far the paste to this view is, or /paste cancel it"""
+        view = self.factory.views[channel]
+        pasting = self.pastes.get(channel)
+        if pasting is None:
+            self.factory.show(view, 'no-paste')
+        elif data.strip() == 'cancel':
+            pasting.cancel()
+        else:
+            self.factory.show(view, 'paste-progress', target=channel,
+                sent=pasting.sent, count=pasting.total)
+    
+    def do_search(self, channel, data):
+        """Search the history of this view: /search [-30d] words..."""
+        factory = self.factory
+        view = factory.views[channel or '*']
+        meta = factory.meta
+        if meta.log_store is None:
+            factory.show(view, 'history-disabled')
+            return
+        
+        since = None
+        match = SEARCH_AGE_RE.match(data)
+        if match:
+            amount, unit = match.groups()
+            since = meta.reactor.seconds() - int(amount) * SEARCH_AGE_UNITS[unit]
+            data = data[match.end():]
+        query = data.decode('utf-8')
         
-        self.msg(user, data)
+        def show(records):
+            for record in reversed(records):
+                text = common.etree_tostring(
+                    meta.render_event(record.event, **record.fields))
+                factory.show(view, 'search-result',
+                    time=time.strftime(SEARCH_TIME_FORMAT,
+                        time.localtime(record.time)),
+                    text=text)
+            factory.show(view, 'search-done',
+                count=len(records), query=query)
         
-        # simulate receiving message -- will also open new tab/view if needed
-        self.privmsg(self.nickname, user, data)
+        d = meta.log_store.search(factory.name, channel or '*', query,
+            since=since, limit=self.search_limit)
+        d.addCallback(show)
+        d.addErrback(log.err)
     
-    def do_join(self, _channel, data):
-        self.join(data)
     
-    def do_nick(self, _channel, data):
-        self.setNick(data)
     
     
     
+    def do_stats(self, channel, data):
+        """Show the pipeline timings, or turn collecting them on or off"""
+        factory = self.factory
+        meta = factory.meta
+        view = factory.views.get(channel or '*', factory.view)
+        data = data.strip()
+        if data == 'on':
+            if meta.metrics is None:
+                meta.metrics = metrics.Metrics()
+        elif data == 'off':
+            meta.metrics = None
+        elif data == 'reset':
+            meta.metrics = metrics.Metrics()
+        elif data:
+            factory.show(view, 'command-usage',
+                usage=COMMANDS.resolve('stats').usage)
+            return
+        if meta.metrics is None:
+            factory.show(view, 'stats-off')
+            return
+        for line in meta.stats_report():
+            factory.show(view, 'stats', line=line)
     
+    def do_profile(self, channel, data):
+        """Start or stop sampling the reactor thread, or save the samples"""
+        factory = self.factory
+        meta = factory.meta
+        view = factory.views.get(channel or '*', factory.view)
+        sampler = meta.profiler
+        data = data.strip()
+        if data == 'start':
+            if sampler is None or not sampler.running:
+                sampler = meta.profiler = profiler.Sampler(tags=PROFILE_TAGS)
+                sampler.start()
+            factory.show(view, 'profile-start')
+            return
+        if data not in ('', 'stop', 'dump'):
+            factory.show(view, 'command-usage',
+                usage=COMMANDS.resolve('profile').usage)
+            return
+        if sampler is None:
+            factory.show(view, 'no-profile')
+            return
+        if data == 'stop':
+            sampler.stop()
+        if not data:
+            factory.show(view, 'profile-status',
+                state='profiling' if sampler.running else 'profiled',
+                count=sampler.count, seconds='%.0f' % sampler.elapsed())
+            return
+        try:
+            path = sampler.dump(meta.profile_dir)
+        except (IOError, OSError), e:
+            factory.show(view, 'profile-failed', msg=e)
+            return
+        top = ', '.join('%s %d%%' % (tag, 100 * n // max(sampler.count, 1))
+            for tag, n in sampler.tag_counts()[:5])
+        factory.show(view,
+            'profile-dump' if sampler.running else 'profile-stop',
+            path=path, count=sampler.count, top=top)
     
     def irc_unknown(self, *args, **kwargs):
         log.msg('Received unknown message: %s %s' % (args, kwargs))
 
+# the commands typed into views; plugins add theirs with COMMANDS.register
+COMMANDS = commands.CommandTable([
+    commands.Command('say', IRCClient.do_say, commands.text,
+        '/say TEXT', need_context=True),
+    commands.Command('me', IRCClient.do_me, commands.text,
+        '/me ACTION', aliases=['action'], need_context=True),
+    commands.Command('msg', IRCClient.do_msg, commands.word_and_text,
+        '/msg NICK TEXT', aliases=['privmsg']),
+    commands.Command('join', IRCClient.do_join,
+        commands.word_and_optional_word, '/join #CHANNEL [KEY]'),
+    commands.Command('nick', IRCClient.do_nick, commands.word, '/nick NICK'),
+    commands.Command('paste', IRCClient.do_paste, commands.optional_text,
+        '/paste [cancel]', need_context=True),
+    commands.Command('search', IRCClient.do_search, commands.optional_text,
+        '/search [-30d|-12h|-10m] WORDS'),
+    commands.Command('stats', IRCClient.do_stats, commands.optional_text,
+        '/stats [on|off|reset]'),
+    commands.Command('profile', IRCClient.do_profile, commands.optional_text,
+        '/profile [start|stop|dump]'),
+])
+
 
 class IRCClientFactory(protocol.ClientFactory):
     """A factory for IRC Clients.
@@ -165,70 +480,167 @@ class IRCClientFactory(protocol.ClientFactory):
 
     # the class of the protocol to build when new connection is made
     protocol = IRCClient
+    command_table = COMMANDS
     
     def __init__(self, name, metaclient, view):
         self.name = name
         self.meta = metaclient
         self.view = view
+        self.reconnect = reconnect.ReconnectPolicy(metaclient.reactor)
         
-        self.views = {'*': view} # * is for MotDs, at least in ircd7
+        # channel or nick -> view, each subscribed to its events on the
+        # metaclient's event bus
+        self.views = userlist.IRCDict()
+        self._subscriptions = userlist.IRCDict()
+        self.add_view('*', view) # * is for MotDs, at least in ircd7
+        
+        # channel membership, and the channels whose user lists need updating
+        self.users = userlist.Membership()
+        self._user_list_updates = common.Batcher(
+            metaclient.reactor, self._update_user_lists)
+        
+        # netsplit quits and joins are shown as one summary per channel
+        self.coalescer = coalesce.Coalescer(metaclient.reactor, self.show)
+    
+    def users_changed(self, channel):
+        """Update the user list of the `userlist.Channel` `channel` soon
+        
+        The user lists of all channels changed in the same reactor tick are
+        updated together, once each.
+        
+        """
+        if channel not in self._user_list_updates.pending:
+            self._user_list_updates.add(channel)
+    
+    def _update_user_lists(self, channels):
+        for channel in channels:
+            if self.users.channels.get(userlist.irc_lower(channel.name)) \
+                    is not channel:
+                continue # we have left it since
+            view = self.views.get(channel.name)
+            if interfaces.IUIUserList.providedBy(view):
+                view.set_users(list(channel))
+    
+    def add_view(self, name, view):
+        """Show the events for the channel or nick `name` in `view`
+        
+        `view` replaces any view `name` had. Returns `view`.
+        
+        """
+        old = self._subscriptions.pop(name, None)
+        if old is not None:
+            self.meta.bus.unsubscribe(old)
+        self.views[name] = view
+        self._subscriptions[name] = self.meta.bus.subscribe(
+            lambda record: self._display(view, record),
+            network=self.name, target=name)
+        return view
+    
+    def record(self, view, event, kwargs):
+        """Return the `events` record of `event` in `view`, happening now"""
+        return events.make(self.name, view.name, event, kwargs,
+            self.meta.reactor.seconds())
+    
+    def deliver(self, view, event, **kwargs):
+        """Show `event` in `view`, and keep it in the history
+        
+        Netsplit quits and joins are kept in the history one by one, but
+        shown as a summary once the split (or rejoin) is over.
+        
+        """
+        self.deliver_record(self.record(view, event, kwargs))
+    
+    def deliver_record(self, record):
+        """Publish the `events` record `record` on the event bus
+        
+        It is kept by the metaclient, and shown by the view for its target.
+        
+        """
+        self.meta.bus.publish(record)
+    
+    def _display(self, view, record):
+        """Show a published record in `view`, unless held for a summary"""
+        if not self.coalescer.offer(view, record.kind, record.fields):
+            self.show_record(view, record)
+    
+    def show(self, view, event, **kwargs):
+        """Show `event` in `view` without keeping it in the history"""
+        self.show_record(view, self.record(view, event, kwargs))
+    
+    def show_record(self, view, record):
+        """Show the `events` record `record` in `view`
+        
+        Views that take records render them when they need to; for the
+        others, the record is rendered here (or on the render pool). The
+        render pool only renders for views that take records while they
+        show what they are sent (or are still waiting for the pool), so
+        hidden views keep their records unrendered.
+        
+        """
+        pool = self.meta.render_pool
+        stats = self.meta.metrics
+        if interfaces.IUIEventTab.providedBy(view) and (pool is None or
+                not (view.showing or pool.pending(view))):
+            if stats is None:
+                view.receive_event(record)
+            else:
+                stats.time('display', view.receive_event, record)
+            return
+        if pool is not None:
+            pool.show(view, record.kind, record.fields)
+            return
+        element = self.meta.render_record(record)
+        if stats is None:
+            view.receive_xml(element)
+        else:
+            stats.time('display', view.receive_xml, element)
     
     def buildProtocol(self, *args, **kwargs):
         proto = protocol.ClientFactory.buildProtocol(self, *args, **kwargs)
         self.protocol_instance = proto
         return proto
     
+    def _schedule_reconnect(self, connector):
+        delay = self.reconnect.schedule(connector.connect)
+        self.deliver(self.view, 'reconnect', delay='%.1f' % delay)
+    
     def clientConnectionLost(self, connector, reason):
-        """If we get disconnected, reconnect to server."""
-        # FIXME: should use templates
-        # TODO: test this
-        self.view.receive_xml(etree.fromstring(
-            self.factory.meta.view_event_templates['disconnect'].render(
-                msg=reason)))
-        connector.connect()
+        """If we get disconnected, reconnect to server after a while."""
+        # the protocol has already shown the disconnection
+        self._schedule_reconnect(connector)
 
     def clientConnectionFailed(self, connector, reason):
-        # FIXME: should use templates
-        # TODO: test this
-        self.view.receive_xml(etree.fromstring(
-            self.factory.meta.view_event_templates['connect-failure'].render(
-                msg=reason)))
+        self.deliver(self.view, 'connect-failure', msg=reason)
+        self._schedule_reconnect(connector)
     
     def send_command(self, irc_context, line):
         """Parse a command line and do relevant actions or send relevant data
         
         irc_context is the context in which the line was entered. It may be
-        a channel name or nick.
+        a channel name or nick, or None for the network view.
         
         """
-        if line.startswith('//'): # xchat behavior
-            command = 'say'
-            data = line[1:]
-        elif line.startswith('/'):
-            command, data = line[1:].split(' ', 1)
-        else:
-            command = 'say'
-            data = line
+        name, data = commands.split(line)
+        view = self.views.get(irc_context or '*', self.view)
+        try:
+            command = self.command_table.resolve(name)
+        except commands.AmbiguousCommand, e:
+            self.show(view, 'ambiguous-command',
+                input=name, candidates=', '.join(e.candidates))
+            return
+        except commands.UnknownCommand:
+            self.show(view, 'invalid-command', input=name)
+            return
         
-        data = data.encode('utf-8')
+        if irc_context is None and command.need_context:
+            self.show(view, 'need-channel-context', input=command.name)
+            return
         try:
-            dispatched = getattr(
-                self.protocol_instance,
-                'do_%s' % command)
-        except AttributeError:
-            self.view.receive_xml(etree.fromstring(elf.factory.meta.
-                view_event_templates['invalid-command'].render(
-                    input=command)))
-        else:
-            if irc_context is not None:
-                dispatched(irc_context, data)
-            else:
-                if command in ['say', 'me', 'notice']:
-                    self.view.receive_xml(etree.fromstring(self.factory.meta.
-                        view_event_templates['need-channel-context'].render(
-                            input=command)))
-                else:
-                    dispatched(None, data)
+            args = command.parse(data.encode('utf-8'))
+        except commands.UsageError:
+            self.show(view, 'command-usage', usage=command.usage)
+            return
+        command.handler(self.protocol_instance, irc_context, *args)
 
 class IRCMetaClient(object):
     """This is the multi-network client handling individual network connections
@@ -242,32 +654,235 @@ class IRCMetaClient(object):
         """Create IRCMetaClient using `reactor` and IUserInterface `ui`"""
         self.reactor = reactor
         self.ui = ui
+        self.view_event_templates = None
+        self.log_store = None # a logstore.LogStore, to keep history
+        self.metrics = None # a metrics.Metrics, while collecting timings
+        self.profiler = None # the profiler.Sampler of the last /profile start
+        # a renderpool.RenderPool, to render events off the reactor thread
+        self.render_pool = None
+        self.profile_dir = os.path.expanduser(DEFAULT_PROFILE_DIR)
+        
+        # every event delivered is published on the bus, for the views,
+        # the history and any plugins that subscribe to it
+        self.bus = eventbus.EventBus()
+        self.bus.subscribe(self._keep)
+        
+        # network name -> IRCClientFactory
+        self.factories = {}
+    
+    def _keep(self, record):
+        """Keep `record` in the history, if keeping it
+        
+        Only events for targets with a view are kept, under the view's name,
+        so that the history isn't named after whatever the server sends.
+        
+        """
+        if self.log_store is None:
+            return
+        factory = self.factories.get(record.network)
+        if factory is None:
+            return
+        view = factory.views.get(record.target or '*')
+        if view is None:
+            return
+        self.log_store.append(record.network, view.name or '*',
+            record.kind, record.fields)
     
-    def connect_to_network(self, name, port):
+    def render_event(self, event, **kwargs):
+        """Render the view event template `event` to an lxml element"""
+        if self.metrics is None:
+            return self.view_event_templates.element(event, **kwargs)
+        return self.view_event_templates.timed_element(
+            self.metrics, event, kwargs)
+    
+    def render_untimed(self, event, **kwargs):
+        """Render `event` like `render_event`, but never time it
+        
+        Unlike `render_event`, this is safe to call from any thread.
+        
+        """
+        return self.view_event_templates.element(event, **kwargs)
+    
+    def render_record(self, record):
+        """Render the `events` record `record` to an lxml element"""
+        return self.render_event(record.kind, **record.fields)
+    
+    def stats_report(self):
+        """Return lines of text describing the timings and outbound queues
+        
+        Parsing isn't timed on its own, as it is done in the same loop that
+        calls the handlers; its share is what `receive` took beyond them.
+        
+        """
+        stats = self.metrics
+        lines = stats.report()
+        receive = stats.histograms.get('receive')
+        if receive is not None:
+            handlers = sum(h.total for stage, h in stats.histograms.iteritems()
+                if stage.startswith('handle '))
+            lines.insert(1, 'receive, excluding handlers: %.1f ms'
+                % ((receive.total - handlers) * 1e3))
+        for name in sorted(self.factories):
+            proto = getattr(self.factories[name], 'protocol_instance', None)
+            outbound = getattr(proto, 'outbound', None)
+            if outbound is None:
+                continue
+            lines.append('%s outbound: %d queued, %d sent, %d merged, '
+                'mean wait %.2f s, max wait %.2f s' % (name, outbound.depth,
+                outbound.sent, outbound.merged, outbound.mean_wait(),
+                outbound.max_wait))
+        return lines
+    
+    def log_stats(self):
+        """Log the `stats_report`, if collecting"""
+        if self.metrics is not None:
+            for line in self.stats_report():
+                log.msg('stats: %s' % line)
+    
+    def register_factory(self, factory):
+        """Route input for the network `factory.name` to `factory`"""
+        if factory.name in self.factories:
+            raise ValueError("Already connected to %s" % factory.name)
+        self.factories[factory.name] = factory
+    
+    def connect_to_network(self, name, port, host=None):
+        """Connect to network `name` at `host` (by default, `name`)
+        
+        Returns the network's IRCClientFactory.
+        
+        """
+        if host is None:
+            host = name
+        # check before the UI gets a view (and the bus a subscription) for it
+        if name in self.factories:
+            raise ValueError("Already connected to %s" % name)
         network_view = self.ui.add_network(name)
         factory = IRCClientFactory(name, self, network_view)
-        # FIXME: HACK HACK HACK
-        #        won't work for multiple servers
-        self.ui.factory = factory
-        # END HACK
-        self.reactor.connectTCP(name, port, factory)
+        self.register_factory(factory)
+        self.reactor.connectTCP(host, port, factory)
+        return factory
+    
+    def send_command(self, view, line):
+        """Handle `line` entered in the IUITab `view`
+        
+        The line goes to the connection for the view's network.
+        
+        """
+        try:
+            factory = self.factories[view.network]
+        except KeyError:
+            log.msg('Input for unknown network %r dropped: %r' %
+                (view.network, line))
+            return
+        factory.send_command(view.name, line)
+
+# what profiler samples are tagged with: the event being shown or kept, or
+# else the command being handled
+PROFILE_TAGS = [
+    (IRCClientFactory.deliver_record, 'record', lambda record: record.kind),
+    (IRCClientFactory.show_record, 'record', lambda record: record.kind),
+    (IRCClient.messageReceived, 'command'),
+]
 
-def main():
+def parse_args(argv):
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option('--ui', default=DEFAULT_UI,
+        help="user interface backend: wx or headless [default: %default]")
+    parser.add_option('--server', action='append',
+        help="IRC server to connect to, as HOST[:PORT] "
+            "(repeat for several networks) [default: irc.freenode.net]")
+    parser.add_option('--port', type='int', default=6667,
+        help="port to connect to by default [default: %default]")
+    parser.add_option('--log', action='store_true',
+        help="log to stdout")
+    parser.add_option('--history-dir', default=DEFAULT_HISTORY_DIR,
+        help="where to keep the history of every view [default: %default]")
+    parser.add_option('--no-history', action='store_true',
+        help="don't keep history")
+    parser.add_option('--cache-dir', default=DEFAULT_CACHE_DIR,
+        help="where to cache parsed and compiled templates "
+            "[default: %default]")
+    parser.add_option('--no-cache', action='store_true',
+        help="don't cache templates")
+    parser.add_option('--render-threads', type='int', default=0,
+        metavar='N', help="render events on N threads rather than the "
+            "one running the UI [default: %default]")
+    parser.add_option('--profile-dir', default=DEFAULT_PROFILE_DIR,
+        help="where /profile writes its samples [default: %default]")
+    parser.add_option('--stats-interval', type='float', metavar='SECONDS',
+        help="collect pipeline timings and log them every SECONDS "
+            "(see also /stats)")
+    options, args = parser.parse_args(argv)
+    if args:
+        parser.error("unexpected arguments: %s" % ' '.join(args))
+    
+    servers = []
+    for server in options.server or ['irc.freenode.net']:
+        host, _, port = server.partition(':')
+        try:
+            servers.append((host, int(port or options.port)))
+        except ValueError:
+            parser.error("invalid server: %s" % server)
+    options.server = servers
+    return options
+
+def start(reactor, metaclient, options):
+    """Load the templates and history, then connect to every server
+    
+    Called once the reactor is running, so that the window is already
+    showing while the slower modules are imported.
+    
+    """
+    cache_dir = None
+    if not options.no_cache:
+        cache_dir = os.path.expanduser(options.cache_dir)
+    metaclient.view_event_templates = load_event_templates(
+        cache_dir=cache_dir)
+    if not options.no_history:
+        metaclient.log_store = logstore.LogStore(
+            reactor, os.path.expanduser(options.history_dir))
+        reactor.addSystemEventTrigger(
+            'before', 'shutdown', metaclient.log_store.close)
+    
+    metaclient.profile_dir = os.path.expanduser(options.profile_dir)
+    if options.render_threads > 0:
+        pool = threadpool.ThreadPool(1, options.render_threads, 'render')
+        pool.start()
+        reactor.addSystemEventTrigger('during', 'shutdown', pool.stop)
+        metaclient.render_pool = renderpool.RenderPool(reactor, pool,
+            metaclient.render_untimed, lambda: metaclient.metrics)
+    if options.stats_interval:
+        metaclient.metrics = metrics.Metrics()
+        task.LoopingCall(metaclient.log_stats).start(
+            options.stats_interval, now=False)
+    
+    for host, port in options.server:
+        metaclient.connect_to_network(host, port)
+    log.msg('startup: connecting')
+
+def main(argv=None):
+    options = parse_args(argv)
+    
     # initialize logging
-    ##log.startLogging(sys.stdout)
-    ui_name = 'wx'
+    if options.log:
+        log.startLogging(sys.stdout)
+    
+    ui_name = options.ui
     __import__('djirc.ui.%s' % ui_name)
     ui_module = getattr(ui, ui_name)
     
+    # the UI may need its own reactor, which has to be installed before the
+    # reactor is first imported
+    ui_module.install_reactor()
+    from twisted.internet import reactor
     
     # create GUI
     metaclient = ui_module.create_metaclient(reactor, IRCMetaClient)
-    pth = os.path.join(os.path.dirname(__file__), 'data', 'event_templates.yaml')
-    with open(pth) as f:
-        metaclient.view_event_templates = eventtemplates.JinjaTemplateDict.from_yaml_f(f)
+    log.msg('startup: window shown')
+    reactor.callWhenRunning(start, reactor, metaclient, options)
     
-    metaclient.connect_to_network("irc.freenode.net", 6667)
-    
-
     # run bot
     reactor.run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+"""Split received IRC traffic into messages without copying every line
+
+Twisted's `LineReceiver` re-splits its whole receive buffer for every line,
+and `IRCClient.lineReceived` copies each line again to undo low-level quoting
+and several more times in `irc.parsemsg`. `MessageReader` instead appends
+received data to one `bytearray`, finds the lines in place and slices the
+prefix, command and parameters straight out of it. The results are the same
+as `parsemsg`'s on the line Twisted would have given it.
+
+"""
+import sys
+
+from twisted.words.protocols import irc
+
+MAX_LENGTH = 16384 # as LineReceiver
+
+COLON = ord(':')
+
+def parse(buf, start, stop):
+    """Parse the line `buf[start:stop]` into `(prefix, command, params)`
+
+    `buf` is a `bytearray`. Raises `irc.IRCBadMessage` for lines that aren't
+    IRC messages.
+
+    """
+    if buf.find('\r', start, stop) != -1 or \
+            buf.find(irc.M_QUOTE, start, stop) != -1:
+        # rare: stray CRs, which Twisted drops, or low-level quoting
+        line = irc.lowDequote(str(buf[start:stop]).replace('\r', ''))
+        buf = bytearray(line)
+        start, stop = 0, len(buf)
+    if start == stop:
+        raise irc.IRCBadMessage('Empty line.')
+
+    prefix = ''
+    if buf[start] == COLON:
+        space = buf.find(' ', start, stop)
+        if space == -1:
+            raise irc.IRCBadMessage('No command.')
+        prefix = str(buf[start + 1:space])
+        start = space + 1
+
+    trailing = buf.find(' :', start, stop)
+    if trailing == -1:
+        params = str(buf[start:stop]).split()
+    else:
+        params = str(buf[start:trailing]).split()
+        params.append(str(buf[trailing + 2:stop]))
+    if not params:
+        raise irc.IRCBadMessage('No command.')
+    command = params.pop(0)
+    return prefix, command, params
+
+class MessageReader(object):
+    """Parse the messages in received data
+
+    `feed` calls `message_received(command, prefix, params)` for every
+    complete line (see `parse`) and `bad_message(line, *exc_info)` for lines
+    that don't parse. If either returns true, the remaining lines stay in the
+    buffer until the next `feed`. A line longer than `max_length` is passed,
+    with everything after it, to `line_length_exceeded` instead.
+
+    """
+    def __init__(self, message_received, bad_message, line_length_exceeded,
+            max_length=MAX_LENGTH):
+        self.message_received = message_received
+        self.bad_message = bad_message
+        self.line_length_exceeded = line_length_exceeded
+        self.max_length = max_length
+        self.buffer = bytearray()
+        self._quoted = False # whether the buffer may hold quoted lines
+        self._busy = False
+
+    def feed(self, data):
+        # Twisted drops every CR, not just those ending lines
+        if '\r' in data:
+            data = data.replace('\r', '')
+        buf = self.buffer
+        buf.extend(data)
+        if irc.M_QUOTE in data:
+            self._quoted = True
+        if self._busy:
+            return None # called from message_received; the loop below sees it
+
+        self._busy = True
+        find = buf.find
+        max_length = self.max_length
+        message_received = self.message_received
+        start = 0
+        try:
+            while True:
+                end = find('\n', start)
+                if end == -1:
+                    if len(buf) - start >= max_length + 1:
+                        return self._exceeded(start)
+                    return None
+                if end - start > max_length:
+                    return self._exceeded(start)
+
+                # as `parse`, inlined
+                try:
+                    if self._quoted and find(irc.M_QUOTE, start, end) != -1:
+                        prefix, command, params = parse(buf, start, end)
+                    else:
+                        i = start
+                        prefix = ''
+                        if i < end and buf[i] == COLON:
+                            space = find(' ', i, end)
+                            if space == -1:
+                                raise irc.IRCBadMessage('No command.')
+                            prefix = str(buf[i + 1:space])
+                            i = space + 1
+                        trailing = find(' :', i, end)
+                        if trailing == -1:
+                            params = str(buf[i:end]).split()
+                        else:
+                            params = str(buf[i:trailing]).split()
+                            params.append(str(buf[trailing + 2:end]))
+                        if not params:
+                            raise irc.IRCBadMessage('No command.')
+                        command = params.pop(0)
+                except irc.IRCBadMessage:
+                    why = self.bad_message(str(buf[start:end]), *sys.exc_info())
+                else:
+                    why = message_received(command, prefix, params)
+                start = end + 1
+                if why:
+                    return why
+        finally:
+            # one move per feed, rather than one per line
+            del buf[:start]
+            if not buf:
+                self._quoted = False
+            self._busy = False
+
+    def _exceeded(self, start):
+        rest = str(self.buffer[start:])
+        del self.buffer[start:]
+        return self.line_length_exceeded(rest)
@@ -0,0 +1,476 @@
+#!/usr/bin/env python
+"""On-disk history of the events shown in each view, with search
+
+Every network and target (channel, nick, or ``*`` for the network view) has
+its own directory of segments. A segment is an append-only file of records::
+
+    <time: float64> <length: uint32> <payload: length bytes>
+
+where the payload is the UTF-8 event name and its fields, separated by NULs
+(which IRC lines can't contain). Once a segment reaches `segment_size` it is
+sealed: its time index (the time and offset of every `index_every`th record)
+and full-text index (offsets of the records containing each word) are written
+next to it, and never change again. The indexes of the segment being written
+are kept in memory; the segment is sealed early when the store is closed, and
+its indexes are rebuilt from it if djirc stops uncleanly.
+
+Writes are buffered and synced to disk at most once per `sync_interval`.
+Searches run in a thread, reading sealed segments and a snapshot of the
+segment being written.
+
+"""
+import os
+import re
+import array
+import bisect
+import struct
+import marshal
+import urllib
+import collections
+
+from twisted.internet import threads
+
+HEADER = struct.Struct('<dI')
+SEGMENT_SUFFIX = '.seg'
+INDEX_SUFFIX = '.idx'
+WORDS_SUFFIX = '.words'
+POSTINGS_SUFFIX = '.post'
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+Record = collections.namedtuple('Record', 'time event fields')
+
+def tokenize(text):
+    """Return the set of lower-cased words in the unicode string `text`"""
+    return set(_WORD_RE.findall(text.lower()))
+
+def _to_unicode(value):
+    if isinstance(value, str):
+        return value.decode('utf-8', 'replace')
+    return unicode(value)
+
+def encode_payload(event, fields):
+    """Encode an event name and its dict of fields to a str"""
+    parts = [_to_unicode(event)]
+    for name, value in sorted(fields.iteritems()):
+        parts.append(_to_unicode(name))
+        parts.append(_to_unicode(value))
+    return u'\0'.join(parts).encode('utf-8')
+
+def decode_payload(payload):
+    """Decode a str created by `encode_payload` to `(event, fields)`"""
+    parts = payload.decode('utf-8').split(u'\0')
+    return parts[0], dict(zip(parts[1::2], parts[2::2]))
+
+def read_record(f, offset):
+    """Return the `Record` at `offset` in the open segment `f`"""
+    f.seek(offset)
+    time, length = HEADER.unpack(f.read(HEADER.size))
+    event, fields = decode_payload(f.read(length))
+    return Record(time, event, fields)
+
+def scan(f, offset=0, end=None):
+    """Yield `(offset, Record)` for the complete records of a segment
+
+    Stops at `end` or at the first incomplete record.
+
+    """
+    f.seek(offset)
+    while end is None or offset < end:
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return
+        time, length = HEADER.unpack(header)
+        payload = f.read(length)
+        if len(payload) < length:
+            return
+        event, fields = decode_payload(payload)
+        yield offset, Record(time, event, fields)
+        offset += HEADER.size + length
+
+def _write_synced(path, data):
+    """Replace the file at `path` with `data`, on disk when this returns"""
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(path + '.tmp', path)
+
+def _contains(offsets, offset):
+    i = bisect.bisect_left(offsets, offset)
+    return i < len(offsets) and offsets[i] == offset
+
+class Segment(object):
+    """The indexes of one segment file, sealed or being written"""
+    def __init__(self, path, start, index_every=64):
+        self.path = path
+        self.start = start
+        self.end = start
+        self.size = 0
+        self.count = 0
+        self.index_every = index_every
+
+        # time index: time and offset of every index_every-th record
+        self.times = array.array('d')
+        self.offsets = array.array('I')
+
+        # full-text index while being written: word -> offsets
+        self.postings = {}
+        # ... and once sealed: sorted words, and where their offsets start in
+        # the postings file (with one extra entry for the end), loaded when
+        # first searched
+        self.sealed = False
+        self.words = None
+        self.word_starts = None
+
+    @property
+    def first(self):
+        """Time of the first record"""
+        if self.times:
+            return self.times[0]
+        return self.start
+
+    @property
+    def base(self):
+        return self.path[:-len(SEGMENT_SUFFIX)]
+
+    def add(self, offset, record):
+        """Index `record`, written at `offset`"""
+        if not self.count % self.index_every:
+            self.times.append(record.time)
+            self.offsets.append(offset)
+        self.count += 1
+        self.end = record.time
+        words = tokenize(u' '.join(record.fields.itervalues()))
+        for word in words:
+            try:
+                self.postings[word].append(offset)
+            except KeyError:
+                self.postings[word] = array.array('I', [offset])
+
+    def rebuild(self):
+        """Index a segment file that was never sealed
+
+        Returns the size of its complete records; anything after that was cut
+        short and should be truncated.
+
+        """
+        size = 0
+        with open(self.path, 'rb') as f:
+            for offset, record in scan(f):
+                self.add(offset, record)
+                size = f.tell()
+        self.size = size
+        return size
+
+    def seal(self):
+        """Write the indexes of this (fully synced) segment next to it"""
+        words = sorted(self.postings)
+        starts = array.array('I')
+        postings = array.array('I')
+        for word in words:
+            starts.append(len(postings))
+            postings.extend(self.postings[word])
+        starts.append(len(postings))
+
+        _write_synced(self.base + POSTINGS_SUFFIX, postings.tostring())
+        _write_synced(self.base + WORDS_SUFFIX,
+            marshal.dumps((words, starts.tostring())))
+        # the index is what marks the segment as sealed, so it goes last
+        _write_synced(self.base + INDEX_SUFFIX, marshal.dumps({
+            'end': self.end,
+            'size': self.size,
+            'count': self.count,
+            'times': self.times.tostring(),
+            'offsets': self.offsets.tostring(),
+        }))
+        self.sealed = True
+        self.postings = None
+
+    def load(self):
+        """Load the time index of a sealed segment"""
+        with open(self.base + INDEX_SUFFIX, 'rb') as f:
+            index = marshal.load(f)
+        self.end = index['end']
+        self.size = index['size']
+        self.count = index['count']
+        self.times = array.array('d', index['times'])
+        self.offsets = array.array('I', index['offsets'])
+        self.sealed = True
+        self.postings = None
+
+    def snapshot(self, words):
+        """Return a frozen copy for searching `words` outside the reactor"""
+        if self.sealed:
+            return self # never changes again
+        copy = Segment(self.path, self.start, self.index_every)
+        copy.end = self.end
+        copy.size = self.size
+        copy.count = self.count
+        copy.times = array.array('d', self.times)
+        copy.offsets = array.array('I', self.offsets)
+        copy.postings = dict((word, array.array('I', self.postings[word]))
+            for word in words if word in self.postings)
+        return copy
+
+    def postings_for(self, word):
+        """Return the sorted offsets of the records containing `word`"""
+        if not self.sealed:
+            return self.postings.get(word, array.array('I'))
+        if self.words is None:
+            with open(self.base + WORDS_SUFFIX, 'rb') as f:
+                words, starts = marshal.load(f)
+            self.word_starts = array.array('I', starts)
+            self.words = words
+        i = bisect.bisect_left(self.words, word)
+        if i == len(self.words) or self.words[i] != word:
+            return array.array('I')
+        start, stop = self.word_starts[i], self.word_starts[i + 1]
+        postings = array.array('I')
+        with open(self.base + POSTINGS_SUFFIX, 'rb') as f:
+            f.seek(start * postings.itemsize)
+            postings.fromstring(f.read((stop - start) * postings.itemsize))
+        return postings
+
+    def offset_range(self, since=None, until=None):
+        """Return `(lo, hi)` offsets holding every record in the time range
+
+        """
+        lo, hi = 0, self.size
+        if since is not None:
+            i = bisect.bisect_left(self.times, since)
+            if i:
+                lo = self.offsets[i - 1]
+        if until is not None:
+            i = bisect.bisect_right(self.times, until)
+            if i < len(self.offsets):
+                hi = self.offsets[i]
+        return lo, hi
+
+    def _scan_back(self, f, lo, hi):
+        """Yield the records between offsets `lo` and `hi`, newest first"""
+        # walk back one time index block at a time
+        i = bisect.bisect_right(self.offsets, hi)
+        stop = hi
+        while stop > lo:
+            start = self.offsets[i - 1] if i else 0
+            start = max(start, lo)
+            block = [record for _offset, record in scan(f, start, stop)]
+            for record in reversed(block):
+                yield record
+            stop = start
+            i -= 1
+
+    def search(self, words, since=None, until=None, limit=None):
+        """Return matching records, newest first"""
+        lo, hi = self.offset_range(since, until)
+        with open(self.path, 'rb') as f:
+            if words:
+                lists = sorted((self.postings_for(word) for word in words),
+                    key=len)
+                first, others = lists[0], lists[1:]
+                candidates = first[
+                    bisect.bisect_left(first, lo):bisect.bisect_left(first, hi)]
+                records = (read_record(f, offset)
+                    for offset in reversed(candidates)
+                    if all(_contains(other, offset) for other in others))
+            else:
+                records = self._scan_back(f, lo, hi)
+
+            results = []
+            for record in records:
+                if until is not None and record.time > until:
+                    continue
+                if since is not None and record.time < since:
+                    break
+                results.append(record)
+                if limit is not None and len(results) >= limit:
+                    break
+            return results
+
+class TargetLog(object):
+    """The segments holding the history of one network and target"""
+    def __init__(self, directory, segment_size, index_every):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.index_every = index_every
+        self.segments = []
+        self.file = None
+        self.last_time = None
+        self.dirty = False
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        names = sorted(name for name in os.listdir(directory)
+            if name.endswith(SEGMENT_SUFFIX))
+        for name in names:
+            segment = self._segment(name)
+            if os.path.exists(segment.base + INDEX_SUFFIX):
+                segment.load()
+            else:
+                # not sealed: djirc stopped while writing it
+                size = segment.rebuild()
+                with open(segment.path, 'r+b') as f:
+                    f.truncate(size)
+                if name != names[-1]:
+                    segment.seal()
+            self.segments.append(segment)
+            self.last_time = segment.end
+
+    def _segment(self, name):
+        start = int(name[:-len(SEGMENT_SUFFIX)]) / 1000.0
+        return Segment(os.path.join(self.directory, name), start,
+            self.index_every)
+
+    def _active(self, time):
+        """Return the segment to append to, starting a new one if needed"""
+        if self.segments and not self.segments[-1].sealed:
+            segment = self.segments[-1]
+            if segment.size < self.segment_size:
+                if self.file is None:
+                    self.file = open(segment.path, 'ab')
+                return segment
+            self.rotate()
+
+        # segments are named after when they start, in milliseconds, and
+        # must sort after older segments
+        start = int(time * 1000)
+        if self.segments:
+            last = os.path.basename(self.segments[-1].path)
+            start = max(start, int(last[:-len(SEGMENT_SUFFIX)]) + 1)
+        segment = self._segment('%015d%s' % (start, SEGMENT_SUFFIX))
+        self.segments.append(segment)
+        self.file = open(segment.path, 'ab')
+        return segment
+
+    def append(self, time, event, fields):
+        # keep times in order even if the clock steps back
+        if self.last_time is not None and time < self.last_time:
+            time = self.last_time
+        self.last_time = time
+
+        segment = self._active(time)
+        fields = dict((_to_unicode(name), _to_unicode(value))
+            for name, value in fields.iteritems())
+        payload = encode_payload(event, fields)
+        offset = segment.size
+        self.file.write(HEADER.pack(time, len(payload)))
+        self.file.write(payload)
+        segment.size += HEADER.size + len(payload)
+        segment.add(offset, Record(time, event, fields))
+        self.dirty = True
+
+    def flush(self):
+        """Hand buffered records to the OS, so that other readers see them"""
+        if self.file is not None:
+            self.file.flush()
+
+    def sync(self):
+        """Make sure written records are on disk"""
+        if self.dirty and self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        self.dirty = False
+
+    def rotate(self):
+        """Seal the segment being written"""
+        self.sync()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.segments and not self.segments[-1].sealed:
+            self.segments[-1].seal()
+
+    def close(self):
+        """Seal the segment being written, so reopening needn't index it"""
+        self.rotate()
+
+    def snapshot(self, words, since=None, until=None):
+        """Return frozen copies of the segments that may match"""
+        self.flush()
+        return [segment.snapshot(words) for segment in self.segments
+            if (since is None or segment.end >= since) and
+                (until is None or segment.first <= until)]
+
+def search_segments(segments, words, since=None, until=None, limit=None):
+    """Search `segments` (oldest first) for records, newest first"""
+    results = []
+    for segment in reversed(segments):
+        remaining = None if limit is None else limit - len(results)
+        results.extend(segment.search(words, since, until, remaining))
+        if limit is not None and len(results) >= limit:
+            break
+    return results
+
+class LogStore(object):
+    """History of the events of every network and target, under `root`"""
+    def __init__(self, reactor, root, segment_size=16 * 1024 * 1024,
+            sync_interval=1.0, index_every=64, threadpool=None):
+        self.reactor = reactor
+        self.root = root
+        self.segment_size = segment_size
+        self.sync_interval = sync_interval
+        self.index_every = index_every
+        self.threadpool = threadpool
+        self.logs = {}
+        self._sync_call = None
+
+    def _log(self, network, target):
+        key = (network, target)
+        try:
+            return self.logs[key]
+        except KeyError:
+            directory = os.path.join(self.root,
+                urllib.quote(network, safe=''), urllib.quote(target, safe=''))
+            log = self.logs[key] = TargetLog(
+                directory, self.segment_size, self.index_every)
+            return log
+
+    def append(self, network, target, event, fields):
+        """Record `event` with the dict of `fields` for `network`/`target`"""
+        self._log(network, target).append(self.reactor.seconds(), event, fields)
+        if self._sync_call is None:
+            self._sync_call = self.reactor.callLater(
+                self.sync_interval, self.sync)
+
+    def sync(self):
+        """Sync every log with unsynced records to disk"""
+        if self._sync_call is not None and self._sync_call.active():
+            self._sync_call.cancel()
+        self._sync_call = None
+        for log in self.logs.itervalues():
+            log.sync()
+
+    def close(self):
+        self.sync()
+        for log in self.logs.itervalues():
+            log.close()
+
+    def _prepare(self, network, target, text, since, until):
+        words = tokenize(_to_unicode(text))
+        log = self._log(network, target)
+        return words, log.snapshot(words, since, until)
+
+    def search_now(self, network, target, text=u'', since=None, until=None,
+            limit=100):
+        """Return records of `network`/`target` with every word in `text`
+
+        Only records from `since` to `until` (in seconds since the epoch)
+        are returned, newest first, at most `limit` of them. This blocks;
+        use `search` from the reactor thread.
+
+        """
+        words, segments = self._prepare(network, target, text, since, until)
+        return search_segments(segments, words, since, until, limit)
+
+    def search(self, network, target, text=u'', since=None, until=None,
+            limit=100):
+        """Like `search_now`, but searches in a thread and returns a Deferred
+
+        """
+        words, segments = self._prepare(network, target, text, since, until)
+        threadpool = self.threadpool
+        if threadpool is None:
+            threadpool = self.reactor.getThreadPool()
+        return threads.deferToThreadPool(self.reactor, threadpool,
+            search_segments, segments, words, since, until, limit)
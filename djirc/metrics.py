@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""Timings and counts of the stages of the event pipeline
+
+Collecting is off unless an `IRCMetaClient` has a `Metrics`; each hook then
+costs a single attribute check. When on, every timed call adds one sample to
+a `Histogram` of power-of-two buckets, so recording is a couple of
+arithmetic operations and a list increment however many samples there are.
+
+"""
+import time
+
+# durations are bucketed by their bit length in microseconds: bucket i holds
+# samples of at least 2**(i-1) and less than 2**i microseconds, except the
+# last, which holds everything longer
+BUCKETS = 32
+
+# the stages of the pipeline, in the order a line goes through them:
+# `IRCClient.dataReceived` (parsing and everything it leads to), the
+# callback for each command, rendering the event template (substituting
+# into an `ElementTemplate`, or rendering with Jinja and parsing the XHTML),
+# and the view's `receive_xml`
+STAGES = ['receive', 'handle', 'render', 'display']
+
+def _stage_order(stage):
+    first = stage.split()[0].rstrip(':')
+    return (STAGES.index(first) if first in STAGES else len(STAGES), stage)
+
+class Histogram(object):
+    """Counts of durations in power-of-two buckets"""
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * BUCKETS
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        i = int(seconds * 1e6).bit_length()
+        self.buckets[min(i, BUCKETS - 1)] += 1
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p):
+        """Upper bound in seconds of the duration `p` percent of samples
+        are within
+
+        """
+        wanted = self.count * p / 100.0
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= wanted and i < BUCKETS - 1:
+                return min(2 ** i / 1e6, self.max)
+        return self.max
+
+class Metrics(object):
+    """Histograms of how long each stage takes, and counters"""
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.started = clock()
+        self.histograms = {} # stage -> Histogram
+        self.counters = {} # name -> count
+
+    def histogram(self, stage):
+        try:
+            return self.histograms[stage]
+        except KeyError:
+            histogram = self.histograms[stage] = Histogram()
+            return histogram
+
+    def add(self, stage, seconds):
+        """Record that `stage` took `seconds`"""
+        self.histogram(stage).add(seconds)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def time(self, stage, func, *args, **kwargs):
+        """Call `func` and record how long it took as a sample of `stage`"""
+        start = self.clock()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.histogram(stage).add(self.clock() - start)
+
+    def report(self):
+        """Return a line of text for each histogram and counter"""
+        elapsed = max(self.clock() - self.started, 1e-9)
+        lines = []
+        for stage in sorted(self.histograms, key=_stage_order):
+            h = self.histograms[stage]
+            lines.append('%s: %d in %.1f ms (%.1f/s), mean %.1f us, '
+                'p99 < %.1f us, max %.1f us' % (stage, h.count,
+                h.total * 1e3, h.count / elapsed, h.mean() * 1e6,
+                h.percentile(99) * 1e6, h.max * 1e6))
+        for name in sorted(self.counters):
+            n = self.counters[name]
+            lines.append('%s: %d (%.1f/s)' % (name, n, n / elapsed))
+        return lines
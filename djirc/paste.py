@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+"""Send multi-line pastes as lines that fit the protocol's limits
+
+IRC lines are at most 512 bytes including the CR LF, and servers relay our
+messages with our ``:nick!user@host`` prefix in front, so the text of each
+message has to be shorter still. `split_paste` breaks a paste into lines
+that fit, without splitting a UTF-8 character, and `Paste` feeds them to the
+outbound queue one at a time as flood control lets them go, so that anything
+typed meanwhile isn't stuck behind the rest of the paste.
+
+"""
+import collections
+
+from djirc.ui import common
+
+MAX_LINE = 512 # bytes, including the CR LF
+
+# the longest user and host names we assume the server may prefix us with
+MAX_USER = 10
+MAX_HOST = 63
+
+def text_limit(command, nick, user=None, host=None):
+    """Bytes of text that fit after `command` (e.g. ``'PRIVMSG #a :'``)
+
+    The user and host names in our prefix are assumed to be as long as they
+    can be unless they are given.
+
+    """
+    prefix = 1 + len(nick) + 1 + (MAX_USER if user is None else len(user)) \
+        + 1 + (MAX_HOST if host is None else len(host)) + 1
+    return MAX_LINE - 2 - prefix - len(command)
+
+def _char_start(data, i):
+    """Move `i` back to the start of the UTF-8 character it falls in"""
+    while i > 0 and 0x80 <= ord(data[i]) < 0xc0:
+        i -= 1
+    return i
+
+def split_line(data, limit):
+    """Split the UTF-8 line `data` into pieces of at most `limit` bytes
+
+    Pieces are broken after a space in their second half if there is one,
+    and otherwise between characters.
+
+    """
+    pieces = []
+    while len(data) > limit:
+        cut = data.rfind(' ', limit // 2, limit)
+        if cut == -1:
+            cut = _char_start(data, limit)
+            if cut == 0:
+                cut = limit # not UTF-8 after all
+        else:
+            cut += 1
+        pieces.append(data[:cut])
+        data = data[cut:]
+    pieces.append(data)
+    return pieces
+
+def split_paste(data, limit):
+    """Split `data` into lines and those into pieces of at most `limit` bytes
+
+    Empty lines are left out, as they can't be sent.
+
+    """
+    lines = []
+    for line in data.split('\n'):
+        line = line.rstrip('\r')
+        if line:
+            lines.extend(split_line(line, limit))
+    return lines
+
+class Paste(object):
+    """Send `lines` to `target` through an `OutboundQueue`
+
+    A line is only queued once the queue has sent everything else waiting
+    for it, so pastes go out at the rate flood control allows while other
+    lines can still get through. `echo(lines)` is called with the lines sent
+    in batches, every `echo_interval` seconds at most, and `done(paste)` once
+    the last has been sent or the paste is cancelled.
+
+    """
+    def __init__(self, outbound, target, lines, echo, done,
+            command='PRIVMSG', echo_interval=0.1):
+        self.outbound = outbound
+        self.target = target
+        self.lines = collections.deque(lines)
+        self.total = len(self.lines)
+        self.sent = 0
+        self.cancelled = False
+        self.finished = False
+        self._format = '%s %s :%%s' % (command, target)
+        self._queued = None # the line waiting in the queue
+        self._echo = common.Batcher(outbound.reactor, echo, echo_interval)
+        self._done = done
+
+    def start(self):
+        self._next()
+
+    def extend(self, lines):
+        """Send `lines` too, after the ones already waiting"""
+        self.lines.extend(lines)
+        self.total += len(lines)
+
+    def _sent(self, line):
+        self.sent += 1
+        self._echo.add(line)
+
+    def _next(self):
+        if self.finished:
+            return
+        outbound = self.outbound
+        if self._queued is not None:
+            self._sent(self._queued)
+            self._queued = None
+        while self.lines and not outbound.normal:
+            line = self.lines.popleft()
+            outbound.put(self._format % line)
+            if outbound.normal:
+                self._queued = line
+            else:
+                self._sent(line)
+        if self.lines or outbound.normal:
+            outbound.when_idle(self._next)
+        else:
+            self._finish()
+
+    def cancel(self):
+        """Send no more of the paste"""
+        if self.finished:
+            return
+        self.cancelled = True
+        self.lines.clear()
+        if self._queued is not None:
+            # too late to take it back
+            self._sent(self._queued)
+            self._queued = None
+        self._finish()
+
+    def _finish(self):
+        self.finished = True
+        self._echo.flush()
+        self._done(self)
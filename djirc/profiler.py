@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+"""A statistical profiler that can be started and stopped while running
+
+A `Sampler` thread looks at the reactor thread's stack every few
+milliseconds and counts how often each stack is seen, so the reactor thread
+runs at full speed between samples. Samples are tagged with what was being
+handled, found in the locals of functions on the stack (such as the `event`
+being shown), and written out in the collapsed-stack format that
+flamegraph.pl and speedscope read::
+
+    msg;twisted.internet.epollreactor:doPoll;...;djirc.ui.wx:receive_xml 42
+
+"""
+import os
+import sys
+import time
+import thread
+import threading
+
+UNTAGGED = '-'
+
+def _code(func):
+    return getattr(func, 'im_func', func).func_code
+
+class Sampler(object):
+    """Sample the stack of the thread `ident` every `interval` seconds
+
+    `tags` is a list of `(function, name)` or `(function, name, get)`: in a
+    sample that passes through `function`, the value of its local (or
+    argument) `name` tags the sample, or `get(value)` if given. The innermost
+    such function wins.
+
+    """
+    def __init__(self, ident=None, tags=(), interval=0.005):
+        if ident is None:
+            ident = thread.get_ident()
+        self.ident = ident
+        self.interval = interval
+        self.tags = {}
+        for tag in tags:
+            func, name = tag[:2]
+            get = tag[2] if len(tag) > 2 else None
+            self.tags[_code(func)] = (name, get)
+        self.samples = {} # (tag, (code, ...) from the root) -> count
+        self.count = 0
+        self.started = None
+        self.stopped = None
+        self._labels = {} # code -> 'module:function'
+        self._thread = None
+        self._running = False
+
+    @property
+    def running(self):
+        return self._running
+
+    def elapsed(self):
+        """Seconds spent sampling"""
+        if self.started is None:
+            return 0.0
+        return (self.stopped or time.time()) - self.started
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self.started = time.time()
+        self._thread = threading.Thread(target=self._run,
+            name='profiler sampler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling, once the sample being taken (if any) is done"""
+        if not self._running:
+            return
+        self._running = False
+        self.stopped = time.time()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while self._running:
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(self.ident)
+            if frame is not None:
+                self.sample(frame)
+            del frame
+
+    def sample(self, frame):
+        """Count the stack of `frame`"""
+        tags = self.tags
+        tag = None
+        codes = []
+        while frame is not None:
+            code = frame.f_code
+            codes.append(code)
+            if tag is None and code in tags:
+                name, get = tags[code]
+                tag = frame.f_locals.get(name)
+                if get is not None and tag is not None:
+                    try:
+                        tag = get(tag)
+                    except Exception:
+                        tag = None
+            frame = frame.f_back
+        codes.reverse()
+        key = (UNTAGGED if tag is None else str(tag), tuple(codes))
+        self.samples[key] = self.samples.get(key, 0) + 1
+        self.count += 1
+
+    def _labeller(self):
+        """Return a function giving the `'module:function'` label of a code"""
+        modules = {} # file name without extension -> module name
+        for name, module in sys.modules.items():
+            path = getattr(module, '__file__', None)
+            if path:
+                modules.setdefault(os.path.splitext(path)[0], name)
+        labels = self._labels
+        def label(code):
+            try:
+                return labels[code]
+            except KeyError:
+                path = os.path.splitext(code.co_filename)[0]
+                module = modules.get(path, os.path.basename(path))
+                result = labels[code] = '%s:%s' % (module, code.co_name)
+                return result
+        return label
+
+    def collapsed(self):
+        """Return the samples as collapsed-stack lines, most common first"""
+        label = self._labeller()
+        counts = {}
+        for (tag, codes), n in self.samples.items():
+            stack = ';'.join([tag] + [label(code) for code in codes])
+            counts[stack] = counts.get(stack, 0) + n
+        return ['%s %d' % (stack, n) for stack, n in
+            sorted(counts.iteritems(), key=lambda (stack, n): (-n, stack))]
+
+    def tag_counts(self):
+        """Return `[(tag, samples)]`, most common first"""
+        counts = {}
+        for (tag, _codes), n in self.samples.items():
+            counts[tag] = counts.get(tag, 0) + n
+        return sorted(counts.iteritems(), key=lambda (tag, n): (-n, tag))
+
+    def dump(self, directory):
+        """Write the samples to a new file in `directory`; returns its path"""
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        base = os.path.join(directory, 'profile-%s-%d' % (
+            time.strftime('%Y%m%d-%H%M%S'), os.getpid()))
+        path = base + '.txt'
+        i = 1
+        while os.path.exists(path):
+            path = '%s-%d.txt' % (base, i)
+            i += 1
+        with open(path, 'w') as f:
+            for line in self.collapsed():
+                f.write(line + '\n')
+        return path
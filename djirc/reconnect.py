@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""When to try reconnecting to a network after losing the connection
+
+Retries back off exponentially up to a maximum delay, so that a flapping
+server isn't hammered, and each delay is jittered so that many clients
+dropped by the same outage don't all come back at the same moment.
+
+"""
+import random
+
+class ReconnectPolicy(object):
+    """Schedule reconnection attempts with exponential backoff and jitter
+
+    The first retry waits about `initial_delay` seconds, and each following
+    one `factor` times longer, up to `max_delay`. Every delay is scaled by a
+    random factor within `jitter` (a fraction) either side of 1. `reset`
+    starts over from `initial_delay`; call it once a connection succeeds.
+
+    """
+    def __init__(self, reactor, initial_delay=1.0, max_delay=300.0,
+            factor=2.0, jitter=0.1, rng=None):
+        self.reactor = reactor
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.jitter = jitter
+        self.rng = rng or random.Random()
+
+        self.retries = 0
+        self._call = None
+
+    def next_delay(self):
+        """Return the delay before the next retry, without scheduling it"""
+        delay = self._backoff()
+        if self.jitter:
+            delay *= self.rng.uniform(1 - self.jitter, 1 + self.jitter)
+        return min(delay, self.max_delay)
+
+    def _backoff(self):
+        return min(self.initial_delay * self.factor ** self.retries,
+            self.max_delay)
+
+    @property
+    def pending(self):
+        """Whether a retry is scheduled"""
+        return self._call is not None and self._call.active()
+
+    def schedule(self, connect):
+        """Call `connect()` after the next delay; returns the delay
+
+        A retry that is already pending is replaced.
+
+        """
+        self.cancel()
+        delay = self.next_delay()
+        # stop counting once at the maximum, so the power can't overflow
+        if self._backoff() < self.max_delay:
+            self.retries += 1
+        self._call = self.reactor.callLater(delay, self._retry, connect)
+        return delay
+
+    def _retry(self, connect):
+        self._call = None
+        connect()
+
+    def cancel(self):
+        """Cancel the pending retry, if any"""
+        if self.pending:
+            self._call.cancel()
+        self._call = None
+
+    def reset(self):
+        """Start backing off from `initial_delay` again"""
+        self.retries = 0
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""Render lines on a pool of threads, off the reactor (and GUI) thread
+
+Under wxreactor the reactor thread is also the GUI thread, so while it
+renders templates and flattens markup for a burst of traffic, typing has to
+wait. A `RenderPool` renders each event and prepares it for its view (see
+`interfaces.IUIPreparedTab`) on a `ThreadPool`, and only hands the finished
+text and style runs to the view on the reactor thread.
+
+Lines finish in whatever order the threads get through them, so each view
+has a queue of the lines sent to it, and a line is only displayed once every
+line before it has been.
+
+"""
+import time
+import collections
+
+from twisted.internet import threads
+from twisted.python import log
+
+from djirc import interfaces
+
+class RenderPool(object):
+    """Render events on `threadpool` and display them in order per view
+
+    `render(event, **kwargs)` renders an event to an lxml element, and must
+    be safe to call from any thread. Views that can't prepare lines in
+    advance get theirs rendered on the reactor thread, still in order.
+
+    If given, `stats()` returns the `metrics.Metrics` to record the time
+    each line took to render and prepare in (or None). Lines are timed on
+    the pool, but the times are recorded on the reactor thread, as metrics
+    aren't safe to update from several threads.
+
+    """
+    def __init__(self, reactor, threadpool, render, stats=None):
+        self.reactor = reactor
+        self.threadpool = threadpool
+        self.render = render
+        self.stats = stats
+        # view -> deque of [display function, done] for its unshown lines
+        self._queues = {}
+
+    def pending(self, view):
+        """Number of lines sent to `view` not yet displayed"""
+        return len(self._queues.get(view, ()))
+
+    def show(self, view, event, kwargs):
+        """Render `event` with `kwargs` and display it in `view`"""
+        if not interfaces.IUIPreparedTab.providedBy(view):
+            self.call(view,
+                lambda: view.receive_xml(self.render(event, **kwargs)))
+            return
+        slot = [None, False]
+        self._queues.setdefault(view, collections.deque()).append(slot)
+        d = threads.deferToThreadPool(self.reactor, self.threadpool,
+            self._prepare, view, event, kwargs)
+        d.addCallbacks(self._prepared, self._failed,
+            callbackArgs=(view, slot), errbackArgs=(view, slot))
+
+    def call(self, view, func):
+        """Call `func` once every line sent to `view` so far is displayed"""
+        queue = self._queues.get(view)
+        if queue is None:
+            func()
+        else:
+            queue.append([func, True])
+
+    def _prepare(self, view, event, kwargs):
+        # in a pool thread
+        start = time.time()
+        prepared = view.prepare_xml(self.render(event, **kwargs))
+        return prepared, time.time() - start
+
+    def _prepared(self, result, view, slot):
+        prepared, seconds = result
+        stats = self.stats and self.stats()
+        if stats is not None:
+            stats.add('render: pool', seconds)
+        slot[0] = lambda: view.receive_prepared(prepared)
+        slot[1] = True
+        self._drain(view)
+
+    def _failed(self, failure, view, slot):
+        log.err(failure, 'Rendering for %r failed' % (view,))
+        slot[0] = lambda: None
+        slot[1] = True
+        self._drain(view)
+
+    def _drain(self, view):
+        queue = self._queues[view]
+        while queue and queue[0][1]:
+            func, _done = queue.popleft()
+            try:
+                func()
+            except Exception:
+                log.err(None, 'Displaying in %r failed' % (view,))
+        if not queue:
+            del self._queues[view]
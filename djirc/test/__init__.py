@@ -1,2 +1,16 @@
 #!/usr/bin/env python
+import os
 
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+def read_recording(name):
+    """Yield `(timestamp, line)` pairs from recorded IRC traffic `name`
+    
+    Recordings hold one received line per line, prefixed with the time it
+    arrived in seconds since the epoch.
+    
+    """
+    with open(os.path.join(DATA_DIR, name)) as f:
+        for line in f:
+            ts, line = line.rstrip('\n').split(' ', 1)
+            yield float(ts), line
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+import unittest
+
+from twisted.internet import task
+
+from djirc import coalesce
+
+SPLIT = 'hub.example.net leaf.example.net'
+
+class TestNetsplitServers(unittest.TestCase):
+    def test_split_reasons(self):
+        self.assertEqual(coalesce.netsplit_servers(SPLIT),
+            ('hub.example.net', 'leaf.example.net'))
+        self.assertEqual(coalesce.netsplit_servers('*.net *.split'),
+            ('*.net', '*.split'))
+
+    def test_other_reasons(self):
+        for reason in ['', 'Quit: bye', 'Ping timeout: 240 seconds',
+                'see you.later', 'a.b c.d e.f']:
+            self.assertEqual(coalesce.netsplit_servers(reason), None)
+
+class TestSummarize(unittest.TestCase):
+    def test_summarize(self):
+        self.assertEqual(coalesce.summarize(['a', 'b']), 'a, b')
+        self.assertEqual(coalesce.summarize(['a', 'b', 'c'], 2),
+            'a, b and 1 more')
+
+class TestCoalescer(unittest.TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.shown = []
+        self.coalescer = coalesce.Coalescer(self.clock, self.show)
+
+    def show(self, view, event, **kwargs):
+        self.shown.append((view, event, kwargs['count'], kwargs['nicks']))
+
+    def offer(self, view, event, **kwargs):
+        return self.coalescer.offer(view, event, kwargs)
+
+    def test_burst_shown_when_quiet(self):
+        for nick in ['a', 'b', 'c']:
+            self.assertTrue(self.offer('#x', 'quit', nick=nick, msg=SPLIT))
+            self.clock.advance(0.5)
+        self.assertEqual(self.shown, [])
+        self.clock.advance(0.5)
+        self.assertEqual(self.shown, [('#x', 'netsplit', 3, 'a, b, c')])
+
+    def test_one_summary_per_view(self):
+        self.offer('#x', 'quit', nick='a', msg=SPLIT)
+        self.offer('#y', 'quit', nick='a', msg=SPLIT)
+        self.offer('#y', 'quit', nick='b', msg=SPLIT)
+        self.clock.advance(1)
+        self.assertEqual(sorted(self.shown), [
+            ('#x', 'netsplit', 1, 'a'),
+            ('#y', 'netsplit', 2, 'a, b')])
+
+    def test_max_delay(self):
+        for _ in range(20):
+            self.offer('#x', 'quit', nick='a', msg=SPLIT)
+            self.clock.advance(0.5)
+        self.assertEqual(len(self.shown), 2)
+        self.assertEqual(self.shown[0][0:2], ('#x', 'netsplit'))
+
+    def test_other_events_pass(self):
+        self.assertFalse(self.offer('#x', 'quit', nick='a', msg='bye'))
+        self.assertFalse(self.offer('#x', 'join', nick='b', channel='#x'))
+        self.assertFalse(self.offer('#x', 'msg', nick='b', msg='hi'))
+        self.clock.advance(10)
+        self.assertEqual(self.shown, [])
+
+    def test_other_event_flushes_its_view(self):
+        self.offer('#x', 'quit', nick='a', msg=SPLIT)
+        self.offer('#y', 'quit', nick='b', msg=SPLIT)
+        self.assertFalse(self.offer('#x', 'msg', nick='c', msg='ouch'))
+        self.assertEqual(self.shown, [('#x', 'netsplit', 1, 'a')])
+
+    def test_netjoin(self):
+        self.offer('#x', 'quit', nick='a', msg=SPLIT)
+        self.clock.advance(30)
+        self.assertTrue(self.offer('#x', 'join', nick='a', channel='#x'))
+        self.assertFalse(self.offer('#x', 'join', nick='b', channel='#x'))
+        self.assertEqual(self.shown[-1], ('#x', 'netjoin', 1, 'a'))
+
+    def test_netjoin_window(self):
+        self.offer('#x', 'quit', nick='a', msg=SPLIT)
+        self.clock.advance(self.coalescer.netjoin_window + 1)
+        self.assertFalse(self.offer('#x', 'join', nick='a', channel='#x'))
+        self.assertEqual(self.coalescer.split_nicks, {})
+
+    def test_expired_when_shown(self):
+        for i in xrange(100):
+            self.offer('#x', 'quit', nick='old%d' % i, msg=SPLIT)
+        self.clock.advance(self.coalescer.netjoin_window - 10)
+        self.offer('#x', 'quit', nick='new', msg=SPLIT)
+        self.clock.advance(20)
+        self.assertEqual(len(self.shown), 2)
+        self.assertEqual(self.coalescer.split_nicks.keys(), ['new'])
+
+    def test_reset(self):
+        self.offer('#x', 'quit', nick='a', msg=SPLIT)
+        self.coalescer.reset()
+        self.assertEqual(self.shown, [('#x', 'netsplit', 1, 'a')])
+        self.assertEqual(self.coalescer.split_nicks, {})
+        self.assertFalse(self.offer('#x', 'join', nick='a', channel='#x'))
+
+    def test_part_forgets_split(self):
+        self.offer('#x', 'quit', nick='a', msg=SPLIT)
+        self.clock.advance(30)
+        self.offer('#x', 'join', nick='a', channel='#x')
+        self.offer('#x', 'part', nick='a', channel='#x', msg='')
+        self.assertFalse(self.offer('#x', 'join', nick='a', channel='#x'))
+
+if __name__ == '__main__':
+    unittest.main()
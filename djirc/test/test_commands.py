@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+import unittest
+
+from djirc import commands
+
+def handler(protocol, context, *args):
+    pass
+
+def table(*names):
+    return commands.CommandTable(
+        [commands.Command(name, handler) for name in names])
+
+class TestParsers(unittest.TestCase):
+    def test_text(self):
+        self.assertEqual(commands.text('hello there'), ('hello there',))
+        self.assertRaises(commands.UsageError, commands.text, '  ')
+        self.assertEqual(commands.optional_text(''), ('',))
+
+    def test_word(self):
+        self.assertEqual(commands.word(' #a '), ('#a',))
+        self.assertRaises(commands.UsageError, commands.word, '')
+        self.assertRaises(commands.UsageError, commands.word, 'a b')
+
+    def test_word_and_optional_word(self):
+        parse = commands.word_and_optional_word
+        self.assertEqual(parse('#a'), ('#a', None))
+        self.assertEqual(parse('#a key'), ('#a', 'key'))
+        self.assertRaises(commands.UsageError, parse, '')
+        self.assertRaises(commands.UsageError, parse, '#a key more')
+
+    def test_word_and_text(self):
+        parse = commands.word_and_text
+        self.assertEqual(parse('bob hi  there'), ('bob', 'hi  there'))
+        self.assertRaises(commands.UsageError, parse, '')
+        self.assertRaises(commands.UsageError, parse, 'bob')
+        self.assertRaises(commands.UsageError, parse, 'bob ')
+
+class TestSplit(unittest.TestCase):
+    def test_split(self):
+        self.assertEqual(commands.split('hello'), ('say', 'hello'))
+        self.assertEqual(commands.split('//etc/motd'), ('say', '/etc/motd'))
+        self.assertEqual(commands.split('/join #a'), ('join', '#a'))
+        self.assertEqual(commands.split('/join'), ('join', ''))
+        self.assertEqual(commands.split('/'), ('', ''))
+
+class TestCommandTable(unittest.TestCase):
+    def test_names_and_aliases(self):
+        t = commands.CommandTable([commands.Command('msg', handler,
+            aliases=['privmsg'])])
+        self.assertEqual(t.resolve('msg').name, 'msg')
+        self.assertEqual(t.resolve('PRIVMSG').name, 'msg')
+
+    def test_abbreviations(self):
+        t = table('join', 'me', 'msg', 'nick')
+        self.assertEqual(t.resolve('j').name, 'join')
+        self.assertEqual(t.resolve('ms').name, 'msg')
+        self.assertEqual(t.resolve('n').name, 'nick')
+        try:
+            t.resolve('m')
+        except commands.AmbiguousCommand, e:
+            self.assertEqual(e.candidates, ['me', 'msg'])
+        else:
+            self.fail('/m resolved')
+
+    def test_full_name_beats_abbreviation(self):
+        t = table('me', 'meet')
+        self.assertEqual(t.resolve('me').name, 'me')
+        self.assertEqual(t.resolve('mee').name, 'meet')
+
+    def test_unknown(self):
+        t = table('join')
+        for name in ['', 'part', 'joint']:
+            self.assertRaises(commands.UnknownCommand, t.resolve, name)
+
+    def test_register(self):
+        t = table('join')
+        t.register(commands.Command('jump', handler))
+        self.assertRaises(commands.AmbiguousCommand, t.resolve, 'j')
+        self.assertEqual(t.resolve('jum').name, 'jump')
+        self.assertRaises(ValueError, t.register,
+            commands.Command('other', handler, aliases=['jump']))
+        t.unregister('jump')
+        self.assertEqual(t.resolve('j').name, 'join')
+        self.assertEqual([command.name for command in t], ['join'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+import re
+import unittest
+
+from twisted.python import log
+
+from djirc import eventbus, events
+
+def record(network='net', target='#a', kind='msg', nick='bob'):
+    return events.make(network, target, kind, dict(nick=nick, msg=u'hi'), 0)
+
+class TestEventBus(unittest.TestCase):
+    def setUp(self):
+        self.bus = eventbus.EventBus()
+        self.calls = []
+
+    def subscriber(self, name, **filters):
+        return self.bus.subscribe(
+            lambda record: self.calls.append(name), **filters)
+
+    def published(self, *args, **kwargs):
+        self.calls = []
+        self.bus.publish(record(*args, **kwargs))
+        return self.calls
+
+    def test_filters(self):
+        self.subscriber('all')
+        self.subscriber('net', network='net')
+        self.subscriber('#a', network='net', target='#a')
+        self.subscriber('other #a', network='other', target='#a')
+        self.subscriber('joins', kinds=['join', 'part'])
+        self.subscriber('bots', nick='*bot')
+        self.assertEqual(self.published(), ['all', 'net', '#a'])
+        self.assertEqual(self.published('other', '#a', 'join'),
+            ['all', 'other #a', 'joins'])
+        self.assertEqual(self.published(target='#b', nick='hal-bot'),
+            ['all', 'net', 'bots'])
+
+    def test_order_of_subscription(self):
+        for i in xrange(10):
+            if i % 2:
+                self.subscriber(i)
+            else:
+                self.subscriber(i, target='#a', kinds=['msg'])
+        self.assertEqual(self.published(), range(10))
+        self.assertEqual(self.published(target='#b'), range(1, 10, 2))
+
+    def test_network_view(self):
+        self.subscriber('network', network='net', target='*')
+        self.assertEqual(self.published(target=None), ['network'])
+        self.assertEqual(self.published(target='#a'), [])
+
+    def test_case_insensitive(self):
+        self.subscriber('#a', target='#Chan[1]')
+        self.subscriber('bob', nick='BOB*')
+        self.assertEqual(self.published(target='#chan{1}', nick='x'), ['#a'])
+        self.assertEqual(self.published(target='#b', nick='Bobby'), ['bob'])
+
+    def test_nick_regex(self):
+        self.subscriber('digits', nick=re.compile(r'\w+\d$'))
+        self.assertEqual(self.published(nick='bob2'), ['digits'])
+        self.assertEqual(self.published(nick='bob'), [])
+        # events without a nick don't match a nick filter
+        self.calls = []
+        self.bus.publish(events.make('net', '#a', 'topic', {}, 0))
+        self.assertEqual(self.calls, [])
+
+    def test_unsubscribe(self):
+        sub = self.subscriber('joins', kinds=['join', 'part'])
+        self.subscriber('all')
+        self.bus.unsubscribe(sub)
+        self.bus.unsubscribe(sub)
+        self.assertEqual(self.published(kind='join'), ['all'])
+        self.assertEqual(self.bus._index.keys(), [(None, None, None)])
+        self.assertEqual(self.bus._shapes, {(False, False, False): 1})
+
+    def test_unsubscribe_while_publishing(self):
+        subs = []
+        def once(record):
+            self.calls.append('once')
+            self.bus.unsubscribe(subs[0])
+        subs.append(self.bus.subscribe(once))
+        self.subscriber('after')
+        self.assertEqual(self.published(), ['once', 'after'])
+        self.assertEqual(self.published(), ['after'])
+
+    def test_failing_subscriber(self):
+        def fail(record):
+            raise ValueError('broken')
+        self.bus.subscribe(fail)
+        self.subscriber('after')
+        errors = []
+        log.addObserver(errors.append)
+        self.addCleanup(log.removeObserver, errors.append)
+        self.assertEqual(self.published(), ['after'])
+        self.assertEqual([e['failure'].type for e in errors if e['isError']],
+            [ValueError])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+import unittest
+
+from djirc import events
+
+class TestRecords(unittest.TestCase):
+    def test_make_msg(self):
+        record = events.make('net', '#a', 'msg', dict(nick='bob', msg=u'hi'), 5)
+        self.assertTrue(isinstance(record, events.Msg))
+        self.assertEqual((record.nick, record.text, record.kind, record.ts),
+            ('bob', u'hi', 'msg', 5))
+        self.assertEqual(record.fields, dict(nick='bob', msg=u'hi'))
+
+    def test_make_other(self):
+        fields = dict(nick='bob', channel='#a')
+        record = events.make('net', '#a', 'join', fields, 5)
+        self.assertTrue(isinstance(record, events.Event))
+        self.assertEqual(record.fields, fields)
+        # a message with unusual fields keeps them all
+        fields = dict(nick='bob', msg=u'hi', extra=1)
+        self.assertEqual(events.make('net', '#a', 'msg', fields, 5).fields,
+            fields)
+
+    def test_slots(self):
+        record = events.Msg('net', '#a', 'bob', u'hi', 'msg', 5)
+        self.assertFalse(hasattr(record, '__dict__'))
+        self.assertRaises(AttributeError, setattr, record, 'other', 1)
+
+    def test_line_round_trip(self):
+        for kind, fields in [('msg', dict(nick=u'bob', msg=u'caf\xe9')),
+                ('disconnect', dict(msg=u'a\nb\\nc\\')),
+                ('quit', dict(nick=u'x', msg=u''))]:
+            line = events.to_line(events.make(None, None, kind, fields, 0))
+            self.assertTrue(events.is_line(line))
+            self.assertFalse('\n' in line)
+            record = events.from_line(line)
+            self.assertEqual((record.kind, record.fields), (kind, fields))
+        self.assertFalse(events.is_line('<li>hi</li>'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,173 @@
 #!/usr/bin/env python
+import os
+import shutil
+import tempfile
 import unittest
 
+import jinja2
+
+from lxml import etree
+from markupsafe import Markup
+
 from djirc import eventtemplates
 
+TEMPLATES_FILE = os.path.join(
+    os.path.dirname(__file__), '..', 'data', 'event_templates.yaml')
+
 class TestJinjaTemplateDict(unittest.TestCase):
     def test_escapes_html(self):
         d = eventtemplates.JinjaTemplateDict(dict(t="<b>{{foo}}</b>"))
         t = d['t']
         self.assertEqual(t.render(foo="<br/>"), "<b>&lt;br/&gt;</b>")
+    
+    def test_element_without_factories(self):
+        d = eventtemplates.JinjaTemplateDict(dict(t="<b>{{foo}}</b>"))
+        self.assertEqual(d.element_factories, {})
+        self.assertEqual(d.element('t', foo='<br/>').text, '<br/>')
+    
+    def test_compiled_up_front(self):
+        d = eventtemplates.JinjaTemplateDict(dict(a="<b>{{foo}}</b>", b="<i/>"))
+        self.assertEqual(sorted(d.templates), ['a', 'b'])
+        self.assertTrue(d['a'] is d['a'])
+        self.assertRaises(jinja2.TemplateNotFound, d.__getitem__, 'c')
+        self.assertRaises(jinja2.TemplateNotFound, d.element, 'c')
+    
+    def test_bad_template_fails_early(self):
+        self.assertRaises(jinja2.TemplateSyntaxError,
+            eventtemplates.JinjaTemplateDict, dict(t="<b>{% if %}</b>"))
+
+class TestCaching(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'templates.yaml')
+        self.cache_path = os.path.join(self.dir, 'templates.yaml.marshal')
+        self.write('t: "<b>{{ a }}</b>"\n')
+    
+    def write(self, source, mtime=1000000000):
+        with open(self.path, 'w') as f:
+            f.write(source)
+        os.utime(self.path, (mtime, mtime))
+    
+    def test_yaml_cached(self):
+        data = eventtemplates.load_yaml(self.path, self.cache_path)
+        self.assertEqual(data, {'t': '<b>{{ a }}</b>'})
+        self.assertTrue(os.path.exists(self.cache_path))
+        # same mtime and size: the cached copy is used
+        self.write('t: "<i>{{ a }}</i>"\n')
+        self.assertEqual(eventtemplates.load_yaml(self.path, self.cache_path),
+            data)
+    
+    def test_yaml_changed(self):
+        eventtemplates.load_yaml(self.path, self.cache_path)
+        self.write('t: "<i>{{ a }}</i>"\n', mtime=1000000001)
+        self.assertEqual(eventtemplates.load_yaml(self.path, self.cache_path),
+            {'t': '<i>{{ a }}</i>'})
+    
+    def test_corrupt_cache(self):
+        with open(self.cache_path, 'wb') as f:
+            f.write('garbage')
+        self.assertEqual(eventtemplates.load_yaml(self.path, self.cache_path),
+            {'t': '<b>{{ a }}</b>'})
+    
+    def test_unwritable_cache(self):
+        cache_path = os.path.join(self.dir, 'missing', 'templates.marshal')
+        self.assertEqual(eventtemplates.load_yaml(self.path, cache_path),
+            {'t': '<b>{{ a }}</b>'})
+    
+    def test_bytecode_cached(self):
+        cache_dir = os.path.join(self.dir, 'cache')
+        for _ in xrange(2):
+            d = eventtemplates.JinjaTemplateDict.from_yaml_file(
+                self.path, cache_dir)
+            self.assertEqual(d['t'].render(a='<x>'), '<b>&lt;x&gt;</b>')
+        cached = os.listdir(cache_dir)
+        self.assertTrue('templates.yaml.marshal' in cached)
+        self.assertTrue([name for name in cached if name.startswith('__jinja2_')])
+    
+    def test_unusable_cache_dir(self):
+        cache_dir = os.path.join(self.path, 'cache') # under a file
+        d = eventtemplates.JinjaTemplateDict.from_yaml_file(
+            self.path, cache_dir)
+        self.assertEqual(d['t'].render(a='x'), '<b>x</b>')
+
+class TestElementTemplate(unittest.TestCase):
+    values = [
+        'plain',
+        '<b>not bold</b> & "quoted" \'too\'',
+        u'\xfcnic\xf8de \u2603',
+        'tab\tand\r\nnewlines\rhere',
+        '',
+        None,
+        42,
+        u'\u3000non-breaking\xa0space',
+    ]
+    
+    def assertSameElement(self, source, **kwargs):
+        d = eventtemplates.JinjaTemplateDict(dict(t=source))
+        expected = etree.tostring(etree.fromstring(d['t'].render(**kwargs)))
+        factory = eventtemplates.ElementTemplate.compile(source)
+        self.assertNotEqual(factory, None)
+        self.assertEqual(etree.tostring(factory.render(kwargs)), expected)
+    
+    def test_bundled_templates_identical(self):
+        with open(TEMPLATES_FILE) as f:
+            d = eventtemplates.JinjaTemplateDict.from_yaml_f(
+                f, element_factories=True)
+        names = set(d.env.loader.mapping)
+        self.assertEqual(set(d.element_factories), names)
+        
+        for name in names:
+            for value in self.values:
+                kwargs = dict.fromkeys(
+                    ['nick', 'old_nick', 'new_nick', 'channel', 'msg', 'input'],
+                    value)
+                expected = etree.tostring(etree.fromstring(
+                    d[name].render(**kwargs)))
+                self.assertEqual(
+                    etree.tostring(d.element(name, **kwargs)), expected)
+    
+    def test_tail_and_nested(self):
+        for value in self.values:
+            self.assertSameElement(
+                '<li>&lt;<b>{{ a }}<i>{{a}}</i>{{ b }}</b>{{a}}-{{ b}}</li>',
+                a=value, b='x')
+    
+    def test_attribute(self):
+        for value in self.values:
+            self.assertSameElement('<a href="{{ a }}">{{ a }}</a>', a=value)
+    
+    def test_undefined_variable(self):
+        self.assertSameElement('<li>[{{ a }}]</li>')
+    
+    def test_factories_are_reusable(self):
+        factory = eventtemplates.ElementTemplate.compile('<b>{{ a }}</b>')
+        first = factory.render(dict(a='one'))
+        second = factory.render(dict(a='two'))
+        self.assertEqual(first.text, 'one')
+        self.assertEqual(second.text, 'two')
+    
+    def test_markup_falls_back(self):
+        d = eventtemplates.JinjaTemplateDict(
+            dict(t='<li>{{ a }}</li>'), element_factories=True)
+        e = d.element('t', a=Markup('<b>bold</b>'))
+        self.assertEqual(etree.tostring(e), '<li><b>bold</b></li>')
+    
+    def test_uncompilable(self):
+        for source in [
+                '<li>{{ a|upper }}</li>',
+                '<li>{% if a %}{{ a }}{% endif %}</li>',
+                '<li>{# comment #}</li>',
+                '<li>unclosed',
+                u'<li>\ue000</li>']:
+            self.assertEqual(
+                eventtemplates.ElementTemplate.compile(source), None)
+    
+    def test_uncompilable_falls_back(self):
+        d = eventtemplates.JinjaTemplateDict(
+            dict(t='<li>{{ a|upper }}</li>'), element_factories=True)
+        self.assertEqual(d.element_factories, {})
+        self.assertEqual(d.element('t', a='x').text, 'X')
+
+if __name__ == '__main__':
+    unittest.main()
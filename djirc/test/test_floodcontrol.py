@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+import unittest
+
+from twisted.internet import task
+
+from djirc import floodcontrol
+
+class TestHelpers(unittest.TestCase):
+    def test_command(self):
+        self.assertEqual(floodcontrol.command('pong :x'), 'PONG')
+        self.assertEqual(floodcontrol.command(':me!u@h PRIVMSG #a :b'),
+            'PRIVMSG')
+        self.assertEqual(floodcontrol.command('QUIT'), 'QUIT')
+    
+    def test_penalty(self):
+        self.assertEqual(floodcontrol.penalty('PRIVMSG #a :b'), 2)
+        self.assertEqual(floodcontrol.penalty('x' * 250), 4)
+    
+    def test_merge(self):
+        merge = floodcontrol.merge
+        self.assertEqual(merge('JOIN #a', 'JOIN #b,#c'), 'JOIN #a,#b,#c')
+        self.assertEqual(merge('PART #a', 'part #b'), 'PART #a,#b')
+        self.assertEqual(merge('JOIN #a', 'PART #a'), None)
+        self.assertEqual(merge('JOIN #a key', 'JOIN #b'), None)
+        self.assertEqual(merge('PART #a :bye', 'PART #b'), None)
+        self.assertEqual(merge('JOIN 0', 'JOIN #b'), None)
+        self.assertEqual(merge('PRIVMSG #a :x', 'PRIVMSG #a :y'), None)
+        self.assertEqual(merge('JOIN #' + 'a' * 300, 'JOIN #' + 'b' * 300),
+            None)
+
+class TestTokenBucket(unittest.TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.bucket = floodcontrol.TokenBucket(self.clock, 10, 1)
+    
+    def test_burst(self):
+        for _ in xrange(5):
+            self.assertTrue(self.bucket.consume(2))
+        self.assertFalse(self.bucket.consume(2))
+        self.assertEqual(self.bucket.delay(2), 2)
+    
+    def test_refill(self):
+        self.bucket.consume(10)
+        self.clock.advance(3)
+        self.assertTrue(self.bucket.consume(2))
+        self.assertFalse(self.bucket.consume(2))
+        self.clock.advance(1000)
+        self.assertEqual(self.bucket.delay(10), 0)
+        self.assertTrue(self.bucket.consume(10))
+        self.assertFalse(self.bucket.consume(1))
+    
+    def test_cost_over_capacity(self):
+        self.assertTrue(self.bucket.consume(50))
+        self.assertEqual(self.bucket.delay(50), 10)
+
+class TestOutboundQueue(unittest.TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.sent = []
+        self.queue = floodcontrol.OutboundQueue(self.clock, self.sent.append,
+            floodcontrol.TokenBucket(self.clock, 10, 1))
+    
+    def test_unlimited(self):
+        queue = floodcontrol.OutboundQueue(self.clock, self.sent.append)
+        for i in xrange(100):
+            queue.put('PRIVMSG #a :%d' % i)
+        self.assertEqual(len(self.sent), 100)
+        self.assertEqual(len(queue), 0)
+    
+    def test_paced(self):
+        times = []
+        self.queue.send = lambda line: times.append(self.clock.seconds())
+        for i in xrange(10):
+            self.queue.put('PRIVMSG #a :%d' % i)
+        self.assertEqual(self.queue.depth, 5)
+        self.clock.pump([1] * 20)
+        self.assertEqual(times, [0, 0, 0, 0, 0, 2, 4, 6, 8, 10])
+        self.assertEqual(self.queue.depth, 0)
+        self.assertEqual(self.queue.max_wait, 10)
+        self.assertEqual(self.queue.mean_wait(), 3)
+    
+    def test_order_kept(self):
+        lines = ['PRIVMSG #a :%d' % i for i in xrange(20)]
+        for line in lines:
+            self.queue.put(line)
+        self.clock.pump([1] * 60)
+        self.assertEqual(self.sent, lines)
+    
+    def test_priority(self):
+        for i in xrange(8):
+            self.queue.put('PRIVMSG #a :%d' % i)
+        self.queue.put('PONG :irc.example.net')
+        self.queue.put('PRIVMSG #a :8')
+        self.clock.advance(2)
+        self.assertEqual(self.sent[5], 'PONG :irc.example.net')
+        self.clock.pump([1] * 20)
+        self.assertEqual(self.sent[6:],
+            ['PRIVMSG #a :%d' % i for i in xrange(5, 9)])
+    
+    def test_oldest_wait(self):
+        self.assertEqual(self.queue.oldest_wait(), 0)
+        for i in xrange(7):
+            self.queue.put('PRIVMSG #a :%d' % i)
+        self.clock.advance(1.5)
+        self.assertEqual(self.queue.oldest_wait(), 1.5)
+    
+    def test_merge_queued(self):
+        for i in xrange(5):
+            self.queue.put('PRIVMSG #a :%d' % i)
+        for channel in ['#b', '#c', '#d']:
+            self.queue.put('JOIN %s' % channel)
+        self.queue.put('PRIVMSG #b :hi')
+        self.assertEqual(self.queue.depth, 2)
+        self.assertEqual(self.queue.merged, 2)
+        self.clock.pump([1] * 10)
+        self.assertEqual(self.sent[5:], ['JOIN #b,#c,#d', 'PRIVMSG #b :hi'])
+    
+    def test_no_merge_once_sent(self):
+        self.queue.put('JOIN #a')
+        self.queue.put('JOIN #b')
+        self.assertEqual(self.sent, ['JOIN #a', 'JOIN #b'])
+    
+    def test_clear(self):
+        for i in xrange(10):
+            self.queue.put('PRIVMSG #a :%d' % i)
+        self.queue.clear()
+        self.clock.advance(100)
+        self.assertEqual(len(self.sent), 5)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+    
+    def test_when_idle(self):
+        idle = []
+        self.queue.when_idle(lambda: idle.append(len(self.sent)))
+        self.assertEqual(idle, [0])
+        for i in xrange(7):
+            self.queue.put('PRIVMSG #a :%d' % i)
+        self.queue.when_idle(lambda: idle.append(len(self.sent)))
+        self.clock.pump([1] * 3)
+        self.assertEqual(idle, [0])
+        self.clock.pump([1] * 2)
+        self.assertEqual(idle, [0, 7])
+
+if __name__ == '__main__':
+    unittest.main()
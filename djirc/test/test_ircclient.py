@@ -0,0 +1,632 @@
+#!/usr/bin/env python
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import zope.interface
+from twisted.test import proto_helpers
+
+from djirc import ircclient, logstore, interfaces
+from djirc.test import read_recording
+from djirc.test.test_logstore import ImmediateThreadPool
+from djirc.ui import headless
+
+class ThreadlessReactor(proto_helpers.MemoryReactorClock):
+    def callFromThread(self, func, *args, **kwargs):
+        func(*args, **kwargs)
+
+class IRCClientTestCase(unittest.TestCase):
+    """Drive headless clients connected to simulated networks"""
+    def setUp(self):
+        self.reactor = ThreadlessReactor()
+        self.meta = headless.create_metaclient(
+            self.reactor, ircclient.IRCMetaClient)
+        self.meta.view_event_templates = ircclient.load_event_templates()
+        self.transports = {}
+    
+    def connect(self, name, port=6667, host=None):
+        factory = self.meta.connect_to_network(name, port, host)
+        proto = factory.buildProtocol(None)
+        proto.heartbeatInterval = None
+        transport = self.transports[name] = proto_helpers.StringTransport()
+        proto.makeConnection(transport)
+        self.receive(name, ':%s 001 testdjirc :Welcome' % name)
+        transport.clear()
+        return factory
+    
+    def receive(self, name, *lines):
+        proto = self.meta.factories[name].protocol_instance
+        proto.dataReceived(''.join(line + '\r\n' for line in lines))
+    
+    def sent(self, name):
+        # let flood control send everything queued
+        outbound = self.meta.factories[name].protocol_instance.outbound
+        while outbound:
+            self.reactor.advance(1)
+        lines = self.transports[name].value().splitlines()
+        self.transports[name].clear()
+        return lines
+    
+    def view(self, name, tab=None):
+        network = self.meta.factories[name].view
+        if tab is None:
+            return network
+        return network.tab_map[tab]
+
+class TestMultipleNetworks(IRCClientTestCase):
+    networks = ['irc.one.net', 'irc.two.net', 'irc.three.net']
+    
+    def setUp(self):
+        IRCClientTestCase.setUp(self)
+        for name in self.networks:
+            self.connect(name)
+            self.receive(name, ':testdjirc!u@h JOIN :#shared')
+    
+    def test_connects_each_network(self):
+        self.assertEqual(
+            [(host, port) for host, port, _f, _t, _b in self.reactor.tcpClients],
+            [(name, 6667) for name in self.networks])
+        self.assertEqual(sorted(self.meta.factories), sorted(self.networks))
+    
+    def test_host_differs_from_name(self):
+        self.connect('other', 7000, 'irc.other.net')
+        host, port = self.reactor.tcpClients[-1][:2]
+        self.assertEqual((host, port), ('irc.other.net', 7000))
+        self.assertTrue('other' in self.meta.factories)
+    
+    def test_duplicate_network(self):
+        subscriptions = dict(self.meta.bus._shapes)
+        self.assertRaises(ValueError,
+            self.meta.connect_to_network, 'irc.one.net', 6667)
+        self.assertEqual(len(self.meta.ui.networks), len(self.networks))
+        self.assertEqual(self.meta.bus._shapes, subscriptions)
+    
+    def test_input_routed_to_view_network(self):
+        for name in self.networks:
+            self.meta.ui.enter_message(self.view(name, '#shared'), u'hi ' + name)
+        
+        for name in self.networks:
+            self.assertEqual(self.sent(name), ['PRIVMSG #shared :hi ' + name])
+            self.assertEqual(self.view(name, '#shared').lines[-1],
+                '<testdjirc> hi ' + name)
+    
+    def test_output_routed_to_network_views(self):
+        self.receive('irc.two.net', ':a!u@h PRIVMSG #shared :only two')
+        self.assertEqual(self.view('irc.two.net', '#shared').lines[-1],
+            '<a> only two')
+        for name in ['irc.one.net', 'irc.three.net']:
+            self.assertEqual(self.view(name, '#shared').lines,
+                ['-- you have joined #shared'])
+    
+    def test_interleaved_traffic(self):
+        for i in xrange(30):
+            name = self.networks[i % len(self.networks)]
+            self.receive(name, ':a!u@h PRIVMSG #shared :%d' % i)
+            self.meta.ui.enter_message(self.view(name, '#shared'), u'r%d' % i)
+        
+        for n, name in enumerate(self.networks):
+            expected = ['PRIVMSG #shared :r%d' % i
+                for i in xrange(n, 30, len(self.networks))]
+            self.assertEqual(self.sent(name), expected)
+            self.assertEqual(len(self.view(name, '#shared').lines), 1 + 2 * 10)
+    
+    def test_network_view_commands(self):
+        self.meta.ui.enter_message(self.view('irc.three.net'), u'/join #new')
+        self.assertEqual(self.sent('irc.three.net'), ['JOIN #new'])
+        self.assertEqual(self.sent('irc.one.net'), [])
+    
+    def test_pong_ahead_of_chat(self):
+        view = self.view('irc.one.net', '#shared')
+        for i in xrange(20):
+            self.meta.ui.enter_message(view, u'line %d' % i)
+        self.receive('irc.one.net', 'PING :irc.one.net')
+        self.reactor.advance(2)
+        lines = self.transports['irc.one.net'].value().splitlines()
+        self.assertEqual(lines[-1], 'PONG irc.one.net')
+        self.assertEqual(self.sent('irc.one.net')[len(lines):],
+            ['PRIVMSG #shared :line %d' % i for i in xrange(len(lines) - 1, 20)])
+    
+    def test_unknown_network_dropped(self):
+        view = headless.HeadlessTabView('#x', network='nowhere')
+        self.meta.send_command(view, u'hello')
+        for name in self.networks:
+            self.assertEqual(self.sent(name), [])
+
+class TestUserLists(IRCClientTestCase):
+    def setUp(self):
+        IRCClientTestCase.setUp(self)
+        self.connect('irc.example.net')
+    
+    def replay(self, name, timed=False):
+        # when timed, replay in recorded time rather than all in one tick
+        proto = self.meta.factories['irc.example.net'].protocol_instance
+        start = None
+        for ts, line in read_recording(name):
+            if timed:
+                if start is None:
+                    start = ts - self.reactor.seconds()
+                self.reactor.advance(
+                    max(ts - start - self.reactor.seconds(), 0))
+            proto.lineReceived(line)
+        self.reactor.advance(0)
+        # let the netsplit summaries out
+        self.reactor.advance(60)
+    
+    def test_netsplit_recording(self):
+        self.replay('netsplit.log')
+        view = self.view('irc.example.net', '#djirc')
+        users = self.meta.factories['irc.example.net'].users['#djirc']
+        self.assertEqual(view.users, list(users))
+        # updated once for the whole recording, not once per line
+        self.assertEqual(view.user_list_updates, 1)
+        self.assertTrue('-- 900 users in #djirc' in view.lines)
+        
+        self.assertEqual(len(users), 900)
+        self.check_netsplit_summary(view)
+    
+    def test_netsplit_in_recorded_time(self):
+        self.replay('netsplit.log', timed=True)
+        self.check_netsplit_summary(self.view('irc.example.net', '#djirc'))
+    
+    def check_netsplit_summary(self, view):
+        # the split and the rejoin are shown as one line each
+        self.assertFalse([line for line in view.lines
+            if line.endswith('has joined #djirc') or 'has quit' in line])
+        split = [line for line in view.lines if line.startswith('-- netsplit')]
+        self.assertEqual(len(split), 2)
+        self.assertTrue(split[0].startswith(
+            '-- netsplit hub.example.net <-> leaf.example.net: 673 quit '
+            '(user0000, '))
+        self.assertTrue(split[0].endswith('and 653 more)'))
+        self.assertTrue(split[1].startswith(
+            '-- netsplit hub.example.net <-> leaf.example.net over: '
+            '673 rejoined (user0000, '))
+    
+    def test_join_part_quit(self):
+        self.receive('irc.example.net',
+            ':testdjirc!u@h JOIN :#a',
+            ':testdjirc!u@h JOIN :#b')
+        for channel in ['#a', '#b']:
+            self.receive('irc.example.net',
+                ':server 353 testdjirc = %s :@testdjirc bob +carol' % channel,
+                ':server 366 testdjirc %s :End of /NAMES list.' % channel)
+        self.receive('irc.example.net',
+            ':dave!u@h JOIN :#a',
+            ':bob!u@h PART #a :bye now',
+            ':carol!u@h QUIT :gone',
+            ':server MODE #b +o bob')
+        self.reactor.advance(0)
+        
+        a, b = self.view('irc.example.net', '#a'), self.view('irc.example.net', '#b')
+        self.assertEqual(a.users, [('@', 'testdjirc'), ('', 'dave')])
+        self.assertEqual(b.users, [('@', 'bob'), ('@', 'testdjirc')])
+        self.assertEqual(a.lines[-3:], [
+            '-- dave has joined #a',
+            '-- bob has left #a (bye now)',
+            '-- carol has quit (gone)'])
+        self.assertEqual(b.lines[-1], '-- carol has quit (gone)')
+    
+    def test_kick_and_part(self):
+        self.receive('irc.example.net',
+            ':testdjirc!u@h JOIN :#a',
+            ':server 353 testdjirc = #a :testdjirc bob',
+            ':server 366 testdjirc #a :End of /NAMES list.',
+            ':op!u@h KICK #a bob :behave',
+            ':testdjirc!u@h PART #a')
+        self.reactor.advance(0)
+        view = self.view('irc.example.net', '#a')
+        self.assertEqual(view.lines[-2:], [
+            '-- bob was kicked from #a by op (behave)',
+            '-- you have left #a ()'])
+        self.assertFalse('#a' in self.meta.factories['irc.example.net'].users)
+
+    def test_netsplit_kept_in_history(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        self.meta.log_store = logstore.LogStore(self.reactor, root,
+            threadpool=ImmediateThreadPool())
+        self.addCleanup(self.meta.log_store.close)
+        self.replay('netsplit.log')
+        
+        records = self.meta.log_store.search_now('irc.example.net', '#djirc',
+            limit=10000)
+        events = [record.event for record in records]
+        self.assertEqual((events.count('quit'), events.count('join')),
+            (673, 673))
+        self.assertFalse('netsplit' in events or 'netjoin' in events)
+    
+    def test_summary_before_later_lines(self):
+        self.receive('irc.example.net',
+            ':testdjirc!u@h JOIN :#a',
+            ':server 353 testdjirc = #a :testdjirc bob carol',
+            ':server 366 testdjirc #a :End of /NAMES list.',
+            ':bob!u@h QUIT :hub.example.net leaf.example.net',
+            ':carol!u@h QUIT :hub.example.net leaf.example.net',
+            ':dave!u@h JOIN :#a')
+        view = self.view('irc.example.net', '#a')
+        self.assertEqual(view.lines[-2:], [
+            '-- netsplit hub.example.net <-> leaf.example.net: 2 quit '
+                '(bob, carol)',
+            '-- dave has joined #a'])
+
+class TestCommands(IRCClientTestCase):
+    def setUp(self):
+        IRCClientTestCase.setUp(self)
+        self.connect('irc.one.net')
+        self.receive('irc.one.net', ':testdjirc!u@h JOIN :#a')
+        self.sent('irc.one.net')
+    
+    def enter(self, line, tab='#a'):
+        view = self.view('irc.one.net', tab)
+        self.meta.ui.enter_message(view, line)
+        return self.sent('irc.one.net'), view.lines[-1]
+    
+    def test_say(self):
+        self.assertEqual(self.enter(u'hello'),
+            (['PRIVMSG #a :hello'], '<testdjirc> hello'))
+        self.assertEqual(self.enter(u'/say /hello'),
+            (['PRIVMSG #a :/hello'], '<testdjirc> /hello'))
+        self.assertEqual(self.enter(u'//etc'),
+            (['PRIVMSG #a :/etc'], '<testdjirc> /etc'))
+        self.assertEqual(self.enter(u'/say'), ([], 'Usage: /say TEXT'))
+    
+    def test_say_needs_channel(self):
+        self.assertEqual(self.enter(u'hello', None), ([],
+            'You need to be in a channel to do that. Try /join #CHANNEL'))
+    
+    def test_paste(self):
+        lines = [u'line %d' % i for i in xrange(12)]
+        sent, _last = self.enter(u'\n'.join(lines))
+        self.assertEqual(sent, ['PRIVMSG #a :%s' % line for line in lines])
+        view = self.view('irc.one.net', '#a')
+        self.assertEqual(view.lines[-14], '-- pasting 12 lines to #a; '
+            '/paste cancel to stop')
+        self.assertEqual(view.lines[-13:-1],
+            ['<testdjirc> %s' % line for line in lines])
+        self.assertEqual(view.lines[-1], '-- pasted 12 lines to #a')
+    
+    def test_long_line_split(self):
+        text = u'\u20ac' * 400
+        sent, _last = self.enter(text)
+        self.assertTrue(len(sent) > 1)
+        self.assertTrue(all(len(':testdjirc!%s@%s %s\r\n' % (
+            'u' * 10, 'h' * 63, line)) <= 512 for line in sent))
+        self.assertEqual(''.join(line.split(' :', 1)[1] for line in sent),
+            text.encode('utf-8'))
+    
+    def test_paste_cancel(self):
+        self.reactor.advance(20) # let flood control allow a full burst
+        view = self.view('irc.one.net', '#a')
+        self.meta.ui.enter_message(view,
+            u'\n'.join(u'line %d' % i for i in xrange(12)))
+        self.meta.ui.enter_message(view, u'/paste')
+        self.assertEqual(view.lines[-1], '-- pasting to #a: 5 of 12 lines sent')
+        self.meta.ui.enter_message(view, u'/paste cancel')
+        self.assertEqual(view.lines[-1],
+            '-- paste to #a cancelled after 6 of 12 lines')
+        self.assertEqual(len(self.sent('irc.one.net')), 6)
+        self.meta.ui.enter_message(view, u'/paste')
+        self.assertEqual(view.lines[-1], '-- nothing is being pasted here')
+    
+    def test_me(self):
+        self.assertEqual(self.enter(u'/me waves'),
+            (['PRIVMSG #a :\x01ACTION waves\x01'], '* testdjirc waves'))
+        self.assertEqual(self.enter(u'/action waves')[0],
+            ['PRIVMSG #a :\x01ACTION waves\x01'])
+    
+    def test_msg(self):
+        self.assertEqual(self.enter(u'/msg bob hi there')[0],
+            ['PRIVMSG bob :hi there'])
+        self.assertEqual(self.view('irc.one.net', 'bob').lines[-1],
+            '<testdjirc> hi there')
+        self.assertEqual(self.enter(u'/msg bob'),
+            ([], 'Usage: /msg NICK TEXT'))
+    
+    def test_long_msg_to_channel_not_joined(self):
+        sent, _last = self.enter(u'/msg #elsewhere ' + u'x' * 1000)
+        self.assertTrue(len(sent) > 1)
+        self.assertTrue(all(line.startswith('PRIVMSG #elsewhere :')
+            for line in sent))
+        self.assertEqual(self.view('irc.one.net').lines[-1],
+            '<testdjirc> ' + sent[-1].split(' :', 1)[1])
+    
+    def test_join(self):
+        self.assertEqual(self.enter(u'/join #b')[0], ['JOIN #b'])
+        self.assertEqual(self.enter(u'/j #c secret')[0], ['JOIN #c secret'])
+        self.assertEqual(self.enter(u'/join'),
+            ([], 'Usage: /join #CHANNEL [KEY]'))
+    
+    def test_nick(self):
+        self.assertEqual(self.enter(u'/nick other', None)[0], ['NICK other'])
+        self.assertEqual(self.enter(u'/nick'), ([], 'Usage: /nick NICK'))
+    
+    def test_search(self):
+        self.assertEqual(self.enter(u'/search broken'),
+            ([], '-- history is disabled'))
+    
+    def test_stats(self):
+        view = self.view('irc.one.net', '#a')
+        self.assertEqual(self.enter(u'/stats'), ([],
+            "-- timings aren't being collected; /stats on to start"))
+        self.enter(u'/stats on')
+        self.receive('irc.one.net', ':bob!u@h PRIVMSG #a :hi',
+            ':bob!u@h PRIVMSG #a :\x01ACTION waves\x01')
+        del view.lines[:]
+        self.enter(u'/stats')
+        stages = [line.split(':')[0] for line in view.lines]
+        for stage in ['-- receive', '-- receive, excluding handlers',
+                '-- handle PRIVMSG', '-- render', '-- display',
+                '-- bytes received', '-- irc.one.net outbound']:
+            self.assertTrue(stage in stages, stage)
+        self.assertTrue(view.lines[0].startswith('-- receive: 1 in '))
+        self.assertTrue(
+            view.lines[2].startswith('-- handle PRIVMSG: 2 in '))
+        self.enter(u'/stats off')
+        self.assertEqual(self.meta.metrics, None)
+        self.assertEqual(self.enter(u'/stats bogus'),
+            ([], 'Usage: /stats [on|off|reset]'))
+
+    def test_profile(self):
+        self.meta.profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.meta.profile_dir)
+        self.assertEqual(self.enter(u'/profile')[1],
+            '-- not profiling; /profile start to start')
+        self.enter(u'/profile start')
+        self.addCleanup(self.meta.profiler.stop)
+        self.assertTrue(self.meta.profiler.running)
+        self.receive('irc.one.net', ':bob!u@h PRIVMSG #a :hi')
+        self.assertTrue(self.enter(u'/profile')[1].startswith(
+            '-- profiling for '))
+        _sent, line = self.enter(u'/profile stop')
+        self.assertFalse(self.meta.profiler.running)
+        self.assertTrue(line.startswith('-- stopped profiling; wrote '), line)
+        self.assertEqual(len(os.listdir(self.meta.profile_dir)), 1)
+        self.assertEqual(self.enter(u'/profile bogus')[1],
+            'Usage: /profile [start|stop|dump]')
+
+    def test_unknown_and_ambiguous(self):
+        self.assertEqual(self.enter(u'/bogus stuff'),
+            ([], 'No such command: bogus'))
+        self.assertEqual(self.enter(u'/m hi'),
+            ([], 'Ambiguous command m: could be me, msg'))
+    
+    def test_plugin_command(self):
+        calls = []
+        ircclient.COMMANDS.register(ircclient.commands.Command('slap',
+            lambda protocol, context, nick: calls.append((context, nick)),
+            ircclient.commands.word))
+        self.addCleanup(ircclient.COMMANDS.unregister, 'slap')
+        self.enter(u'/sl bob')
+        self.assertEqual(calls, [('#a', 'bob')])
+
+class EventView(object):
+    zope.interface.implements(interfaces.IUIEventTab)
+    def __init__(self, name, network):
+        self.name = name
+        self.network = network
+        self.records = []
+        self.showing = False
+    
+    def receive_event(self, record):
+        self.records.append(record)
+
+class SampledView(EventView):
+    """Take a profiler sample as each record is displayed"""
+    def __init__(self, name, network, sampler):
+        EventView.__init__(self, name, network)
+        self.sampler = sampler
+    
+    def receive_event(self, record):
+        self.sampler.sample(sys._getframe())
+
+class RecordingPool(object):
+    """A render pool that only records what it's sent"""
+    def __init__(self):
+        self.shown = []
+        self.waiting = 0
+    
+    def show(self, view, event, kwargs):
+        self.shown.append((view, event, kwargs['msg']))
+    
+    def pending(self, view):
+        return self.waiting
+
+class TestEventRecords(IRCClientTestCase):
+    def setUp(self):
+        IRCClientTestCase.setUp(self)
+        self.factory = self.connect('irc.one.net')
+        self.receive('irc.one.net', ':testdjirc!u@h JOIN :#a')
+        self.view = self.factory.add_view('#a',
+            EventView('#a', 'irc.one.net'))
+    
+    def test_records_not_rendered(self):
+        self.reactor.advance(5)
+        self.receive('irc.one.net', ':bob!u@h PRIVMSG #a :hi',
+            ':bob!u@h NOTICE #a :note', ':carol!u@h JOIN :#a')
+        msg, notice, join = self.view.records
+        self.assertTrue(isinstance(msg, ircclient.events.Msg))
+        self.assertEqual((msg.network, msg.target, msg.nick, msg.text,
+            msg.kind, msg.ts), ('irc.one.net', '#a', 'bob', 'hi', 'msg', 5))
+        self.assertEqual(notice.kind, 'notice')
+        self.assertEqual((join.kind, join.fields),
+            ('join', dict(nick='carol', channel='#a')))
+    
+    def test_render_pool_only_for_showing_views(self):
+        pool = self.meta.render_pool = RecordingPool()
+        self.receive('irc.one.net', ':bob!u@h PRIVMSG #a :hidden')
+        self.assertEqual([r.text for r in self.view.records], ['hidden'])
+        self.view.showing = True
+        self.receive('irc.one.net', ':bob!u@h PRIVMSG #a :shown')
+        self.assertEqual(pool.shown, [(self.view, 'msg', 'shown')])
+        # lines still on the pool come first, so later ones follow them
+        self.view.showing = False
+        pool.waiting = 1
+        self.receive('irc.one.net', ':bob!u@h PRIVMSG #a :after')
+        self.assertEqual(pool.shown[-1], (self.view, 'msg', 'after'))
+        self.assertEqual(len(self.view.records), 1)
+    
+    def test_profile_tags(self):
+        sampler = ircclient.profiler.Sampler(tags=ircclient.PROFILE_TAGS)
+        self.factory.add_view('#a', SampledView('#a', 'irc.one.net', sampler))
+        self.receive('irc.one.net', ':bob!u@h PRIVMSG #a :hi',
+            ':bob!u@h PRIVMSG #a :\x01ACTION waves\x01',
+            ':bob!u@h PRIVMSG #a :again', ':carol!u@h JOIN :#a')
+        self.assertEqual(sampler.tag_counts(),
+            [('msg', 2), ('action', 1), ('join', 1)])
+    
+    def test_local_feedback(self):
+        self.meta.ui.enter_message(
+            headless.HeadlessTabView('#a', network='irc.one.net'), u'/bogus')
+        [record] = self.view.records
+        self.assertEqual((record.kind, record.fields),
+            ('invalid-command', dict(input='bogus')))
+
+class TestEventBus(IRCClientTestCase):
+    def setUp(self):
+        IRCClientTestCase.setUp(self)
+        for name in 'irc.one.net', 'irc.two.net':
+            self.connect(name)
+            self.receive(name, ':testdjirc!u@h JOIN :#a')
+    
+    def test_nick_change_in_every_view(self):
+        self.receive('irc.one.net', ':bob!u@h PRIVMSG testdjirc :hi',
+            ':testdjirc!u@h NICK :newnick')
+        for tab in None, '#a', 'bob':
+            self.assertEqual(self.view('irc.one.net', tab).lines[-1],
+                '-- you are now known as newnick.')
+        self.assertEqual(self.view('irc.two.net', '#a').lines,
+            ['-- you have joined #a'])
+    
+    def test_subscribers_filtered(self):
+        seen = []
+        self.meta.bus.subscribe(seen.append, network='irc.two.net',
+            kinds=['msg', 'action'], nick='b*')
+        self.receive('irc.one.net', ':bob!u@h PRIVMSG #a :one')
+        self.receive('irc.two.net', ':bob!u@h PRIVMSG #a :two',
+            ':bob!u@h NOTICE #a :notice', ':carol!u@h PRIVMSG #a :carol',
+            ':Bill!u@h PRIVMSG #A :case')
+        self.assertEqual([record.text for record in seen], ['two', 'case'])
+        self.assertEqual(self.view('irc.two.net', '#a').lines[-1],
+            '<Bill> case')
+    
+    def test_rejoin_replaces_view(self):
+        factory = self.meta.factories['irc.one.net']
+        old = factory.views['#a']
+        self.receive('irc.one.net', ':testdjirc!u@h PART #a',
+            ':testdjirc!u@h JOIN :#a', ':bob!u@h PRIVMSG #a :hi')
+        self.assertFalse(factory.views['#a'] is old)
+        self.assertEqual(factory.views['#a'].lines[-1], '<bob> hi')
+        self.assertFalse('<bob> hi' in old.lines)
+
+    def test_convo_nick_case(self):
+        self.receive('irc.one.net', ':Bob!u@h PRIVMSG testdjirc :one',
+            ':bob!u@h PRIVMSG testdjirc :two')
+        network = self.view('irc.one.net')
+        self.assertEqual(sorted(network.tab_map), ['#a', 'Bob'])
+        self.assertEqual(network.tab_map['Bob'].lines,
+            ['<Bob> one', '<bob> two'])
+    
+class FakeConnector(object):
+    """Record when a factory asks to reconnect"""
+    def __init__(self, reactor):
+        self.reactor = reactor
+        self.attempts = []
+    
+    def connect(self):
+        self.attempts.append(self.reactor.seconds())
+
+class TestReconnect(IRCClientTestCase):
+    def setUp(self):
+        IRCClientTestCase.setUp(self)
+        self.factory = self.connect('irc.one.net')
+        self.factory.reconnect.jitter = 0
+        self.connector = FakeConnector(self.reactor)
+        self.attempts = self.connector.attempts
+    
+    def lose(self, times=1):
+        for _ in xrange(times):
+            self.factory.clientConnectionLost(self.connector, 'gone')
+            self.reactor.advance(self.factory.reconnect.max_delay)
+    
+    def test_no_immediate_reconnect(self):
+        self.factory.clientConnectionLost(self.connector, 'gone')
+        self.assertEqual(self.attempts, [])
+        self.assertEqual(self.view('irc.one.net').lines[-1],
+            '-- reconnecting in 1.0 seconds')
+        self.reactor.advance(1)
+        self.assertEqual(self.attempts, [1])
+    
+    def test_backs_off_while_flapping(self):
+        self.lose(3)
+        self.factory.clientConnectionFailed(self.connector, 'refused')
+        self.assertEqual(self.view('irc.one.net').lines[-1],
+            '-- reconnecting in 8.0 seconds')
+    
+    def test_signon_resets(self):
+        self.lose(3)
+        self.receive('irc.one.net', ':irc.one.net 001 testdjirc :Welcome')
+        self.factory.clientConnectionLost(self.connector, 'gone')
+        self.assertEqual(self.view('irc.one.net').lines[-1],
+            '-- reconnecting in 1.0 seconds')
+
+class TestHistory(IRCClientTestCase):
+    def setUp(self):
+        IRCClientTestCase.setUp(self)
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.meta.log_store = logstore.LogStore(self.reactor, self.root,
+            threadpool=ImmediateThreadPool())
+        self.addCleanup(self.meta.log_store.close)
+        self.reactor.advance(1000000)
+        self.connect('irc.one.net')
+        self.receive('irc.one.net',
+            ':testdjirc!u@h JOIN :#a',
+            ':bob!u@h PRIVMSG #a :the build is broken',
+            ':bob!u@h PRIVMSG #a :never mind')
+        self.reactor.advance(2 * 24 * 60 * 60)
+        self.receive('irc.one.net', ':bob!u@h PRIVMSG #a :broken again')
+    
+    def test_events_kept(self):
+        records = self.meta.log_store.search_now('irc.one.net', '#a')
+        self.assertEqual([(r.event, r.fields.get('msg')) for r in records], [
+            ('msg', 'broken again'),
+            ('msg', 'never mind'),
+            ('msg', 'the build is broken'),
+            ('you-join', None)])
+        network = self.meta.log_store.search_now('irc.one.net', '*')
+        self.assertEqual(network[0].event, 'signon')
+    
+    def test_only_views_kept(self):
+        self.receive('irc.one.net', 'NOTICE AUTH :*** Looking up your host',
+            ':bob!u@h PRIVMSG #elsewhere :not joined',
+            ':bob!u@h PRIVMSG #A :shouting')
+        self.meta.log_store.sync()
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(self.root, 'irc.one.net'))),
+            ['%23a', '%2A'])
+        records = self.meta.log_store.search_now('irc.one.net', '#a')
+        self.assertEqual(records[0].fields['msg'], 'shouting')
+    
+    def test_search_command(self):
+        view = self.view('irc.one.net', '#a')
+        self.meta.ui.enter_message(view, u'/search broken')
+        self.assertEqual([line.split('] ', 1)[-1] for line in view.lines[-3:]], [
+            '<bob> the build is broken',
+            '<bob> broken again',
+            '-- 2 results for broken'])
+    
+    def test_search_recent(self):
+        view = self.view('irc.one.net', '#a')
+        self.meta.ui.enter_message(view, u'/search -1d broken')
+        self.assertEqual(view.lines[-1], '-- 1 results for broken')
+    
+    def test_search_without_history(self):
+        self.meta.log_store = None
+        view = self.view('irc.one.net', '#a')
+        self.meta.ui.enter_message(view, u'/search broken')
+        self.assertEqual(view.lines[-1], '-- history is disabled')
+
+if __name__ == '__main__':
+    unittest.main()
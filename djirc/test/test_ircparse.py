@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+import unittest
+
+from twisted.words.protocols import irc
+
+from djirc import ircparse
+from djirc.test import read_recording
+
+def parse(line):
+    buf = bytearray(line)
+    return ircparse.parse(buf, 0, len(buf))
+
+def twisted_parse(line):
+    return irc.parsemsg(irc.lowDequote(line.replace('\r', '')))
+
+class TestParse(unittest.TestCase):
+    def assertSameAsTwisted(self, line):
+        self.assertEqual(parse(line), twisted_parse(line))
+
+    def test_recording(self):
+        for _ts, line in read_recording('netsplit.log'):
+            self.assertSameAsTwisted(line)
+
+    def test_shapes(self):
+        for line in [
+                'PING irc.one.net',
+                'PING :irc.one.net',
+                ':nick!u@h PRIVMSG #a :hello there',
+                ':nick!u@h PRIVMSG #a :',
+                ':nick!u@h PRIVMSG #a ::-)',
+                ':server 353 me = #a :@op +voice user ',
+                ':server MODE #a +ov  op  voiced',
+                'NOTICE  AUTH  :*** Looking up your hostname',
+                ':nick!u@h QUIT',
+                ':nick!u@h PRIVMSG #a :stray \r carriage return',
+                ':nick!u@h PRIVMSG #a :quoted \x10n newline',
+                ]:
+            self.assertSameAsTwisted(line)
+
+    def test_slice(self):
+        buf = bytearray('junk:nick!u@h JOIN :#a\r\nmore')
+        self.assertEqual(ircparse.parse(buf, 4, 22),
+            ('nick!u@h', 'JOIN', ['#a']))
+
+    def test_bad_messages(self):
+        for line in ['', '   ', ':prefix.only']:
+            self.assertRaises(irc.IRCBadMessage, parse, line)
+
+class TestMessageReader(unittest.TestCase):
+    def setUp(self):
+        self.messages = []
+        self.bad = []
+        self.exceeded = []
+        self.reader = ircparse.MessageReader(self.message_received,
+            self.bad_message, self.exceeded.append, max_length=20)
+
+    def message_received(self, command, prefix, params):
+        self.messages.append((command, prefix, params))
+
+    def bad_message(self, line, *exc_info):
+        self.bad.append(line)
+
+    def commands(self):
+        return [' '.join([command] + params)
+            for command, _prefix, params in self.messages]
+
+    def test_recording(self):
+        lines = [line for _ts, line in read_recording('netsplit.log')]
+        reader = ircparse.MessageReader(self.message_received,
+            self.bad_message, self.exceeded.append)
+        data = ''.join(line + '\r\n' for line in lines)
+        for i in xrange(0, len(data), 1000):
+            reader.feed(data[i:i + 1000])
+        self.assertEqual(self.messages, [
+            (command, prefix, params)
+            for prefix, command, params in map(twisted_parse, lines)])
+
+    def test_line_endings(self):
+        self.reader.feed('PING a\r\nPING b\nPING c\r\n')
+        self.assertEqual(self.commands(), ['PING a', 'PING b', 'PING c'])
+        self.assertEqual(len(self.reader.buffer), 0)
+
+    def test_partial_lines(self):
+        for chunk in ['PI', 'NG a\r', '\nPING b\r\nPI', 'NG c']:
+            self.reader.feed(chunk)
+        self.assertEqual(self.commands(), ['PING a', 'PING b'])
+        self.assertEqual(str(self.reader.buffer), 'PING c')
+        self.reader.feed('\n')
+        self.assertEqual(self.commands()[-1], 'PING c')
+
+    def test_quoted(self):
+        self.reader.feed(':n PRIVMSG #a :x\x10ny\r\nPING a\r\n')
+        self.assertEqual(self.messages, [
+            ('PRIVMSG', 'n', ['#a', 'x\ny']),
+            ('PING', '', ['a'])])
+
+    def test_bad_messages(self):
+        self.reader.feed('\r\n:prefix.only\r\nPING a\r\n')
+        self.assertEqual(self.bad, ['', ':prefix.only'])
+        self.assertEqual(self.commands(), ['PING a'])
+
+    def test_stop(self):
+        reader = ircparse.MessageReader(lambda *args: True, None, None)
+        reader.feed('PING a\r\nPING b\r\n')
+        self.assertEqual(str(reader.buffer), 'PING b\n')
+
+    def test_reentrant(self):
+        def message_received(command, prefix, params):
+            self.message_received(command, prefix, params)
+            if len(self.messages) == 1:
+                self.reader.feed('PING c\r\n')
+        self.reader.message_received = message_received
+        self.reader.feed('PING a\r\nPING b\r\n')
+        self.assertEqual(self.commands(), ['PING a', 'PING b', 'PING c'])
+
+    def test_too_long(self):
+        self.reader.feed('PING short\r\nPRIVMSG #a :' + 'x' * 20 + '\r\nPING')
+        self.assertEqual(self.commands(), ['PING short'])
+        self.assertEqual(self.exceeded, ['PRIVMSG #a :' + 'x' * 20 + '\nPING'])
+        self.assertEqual(len(self.reader.buffer), 0)
+
+    def test_too_long_unterminated(self):
+        self.reader.feed('x' * 20)
+        self.assertEqual(self.exceeded, [])
+        self.reader.feed('x')
+        self.assertEqual(self.exceeded, ['x' * 21])
+
+if __name__ == '__main__':
+    unittest.main()
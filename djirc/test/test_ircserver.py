@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+import unittest
+
+from twisted.internet import task
+from twisted.test import proto_helpers
+
+from djirc import ircclient
+from djirc.ui import headless
+from djirc.bench import ircserver
+
+class TestFakeIRCServer(unittest.TestCase):
+    def connect(self, profile, lines):
+        self.clock = task.Clock()
+        server_factory = ircserver.FakeIRCServerFactory(
+            self.clock, ircserver.PROFILES[profile], lines, chunk=10)
+        self.server = server_factory.buildProtocol(None)
+        self.server_transport = proto_helpers.StringTransport()
+        self.server.makeConnection(self.server_transport)
+        
+        meta = headless.create_metaclient(self.clock, ircclient.IRCMetaClient)
+        meta.view_event_templates = ircclient.load_event_templates()
+        self.network = meta.ui.add_network(profile)
+        factory = ircclient.IRCClientFactory(profile, meta, self.network)
+        self.client = factory.buildProtocol(None)
+        self.client.heartbeatInterval = None
+        self.client_transport = proto_helpers.StringTransport()
+        self.client.makeConnection(self.client_transport)
+    
+    def pump(self):
+        while True:
+            self.clock.advance(0)
+            to_server = self.client_transport.value()
+            to_client = self.server_transport.value()
+            if not (to_server or to_client or self.clock.getDelayedCalls()):
+                return
+            self.client_transport.clear()
+            self.server_transport.clear()
+            self.server.dataReceived(to_server)
+            self.client.dataReceived(to_client)
+    
+    def test_chatty(self):
+        self.connect('chatty', 25)
+        self.pump()
+        self.assertTrue(self.server.stats.finished)
+        self.assertEqual(len(self.server.stats.sent), 25 + 2)
+        channel = self.network.tab_map[ircserver.CHANNEL]
+        self.assertEqual(len(channel.lines), 1 + 25)
+    
+    def test_motd(self):
+        self.connect('motd', 12)
+        self.pump()
+        self.assertEqual(len(self.network.lines), 2 + 10)
+        self.assertTrue(self.network.lines[-1].startswith('- '))
+    
+    def test_profiles_are_deterministic(self):
+        for profile in ircserver.PROFILES.values():
+            self.assertEqual(list(profile('me', 50)), list(profile('me', 50)))
+            self.assertEqual(len(list(profile('me', 50))), 50)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from twisted.internet import task
+
+from djirc import logstore
+
+DAY = 24 * 60 * 60
+
+class ImmediateThreadPool(object):
+    """Run "threaded" calls at once, in the calling thread"""
+    def callInThreadWithCallback(self, onResult, func, *args, **kwargs):
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            from twisted.python import failure
+            onResult(False, failure.Failure())
+        else:
+            onResult(True, result)
+
+class ThreadlessClock(task.Clock):
+    def callFromThread(self, func, *args, **kwargs):
+        func(*args, **kwargs)
+
+class LogStoreTestCase(unittest.TestCase):
+    segment_size = 16 * 1024 * 1024
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.clock = ThreadlessClock()
+        self.clock.advance(1000 * DAY)
+        self.store = self.open()
+    
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.root)
+    
+    def open(self):
+        return logstore.LogStore(self.clock, self.root,
+            segment_size=self.segment_size, index_every=4,
+            threadpool=ImmediateThreadPool())
+    
+    def reopen(self):
+        self.store.close()
+        self.store = self.open()
+    
+    def say(self, msg, nick='someone', target='#djirc', network='net'):
+        self.store.append(network, target, 'msg', {'nick': nick, 'msg': msg})
+    
+    def messages(self, *args, **kwargs):
+        return [record.fields['msg']
+            for record in self.store.search_now('net', '#djirc', *args, **kwargs)]
+
+class TestRecords(unittest.TestCase):
+    def test_payload(self):
+        payload = logstore.encode_payload('msg',
+            {'nick': 'me', 'msg': u'héllo'})
+        self.assertEqual(logstore.decode_payload(payload),
+            (u'msg', {u'nick': u'me', u'msg': u'héllo'}))
+    
+    def test_tokenize(self):
+        self.assertEqual(logstore.tokenize(u'Hello, hello WORLD! x_y'),
+            set([u'hello', u'world', u'x_y']))
+
+class TestLogStore(LogStoreTestCase):
+    def test_search_words(self):
+        self.say('the build is broken')
+        self.say('who broke the build?')
+        self.say('not me')
+        self.assertEqual(self.messages(u'build'),
+            [u'who broke the build?', u'the build is broken'])
+        self.assertEqual(self.messages(u'BUILD broken'),
+            [u'the build is broken'])
+        self.assertEqual(self.messages(u'nothing'), [])
+    
+    def test_search_nick(self):
+        self.say('hi', nick='alice')
+        self.say('hi', nick='bob')
+        records = self.store.search_now('net', '#djirc', u'alice')
+        self.assertEqual([r.fields['nick'] for r in records], [u'alice'])
+    
+    def test_targets_separate(self):
+        self.say('one', target='#one')
+        self.say('two', target='#two')
+        self.say('elsewhere', network='other', target='#one')
+        records = self.store.search_now('net', '#one')
+        self.assertEqual([r.fields['msg'] for r in records], [u'one'])
+    
+    def test_time_range(self):
+        for day in xrange(40):
+            self.say('day %d' % day)
+            self.clock.advance(DAY)
+        recent = self.messages(u'day', since=self.clock.seconds() - 30 * DAY)
+        self.assertEqual(recent, [u'day %d' % d for d in xrange(39, 9, -1)])
+        window = self.messages(since=self.clock.seconds() - 30 * DAY,
+            until=self.clock.seconds() - 25 * DAY)
+        self.assertEqual(window, [u'day %d' % d for d in xrange(15, 9, -1)])
+    
+    def test_limit(self):
+        for i in xrange(50):
+            self.say('spam %d' % i)
+        self.assertEqual(self.messages(u'spam', limit=3),
+            [u'spam 49', u'spam 48', u'spam 47'])
+        self.assertEqual(self.messages(limit=2), [u'spam 49', u'spam 48'])
+    
+    def test_unicode(self):
+        self.say(u'café ouvert')
+        self.say('caf\xc3\xa9 ferm\xc3\xa9')
+        self.assertEqual(self.messages(u'CAFÉ'),
+            [u'café fermé', u'café ouvert'])
+    
+    def test_other_fields(self):
+        self.store.append('net', '*', 'disconnect', {'msg': ValueError('x')})
+        records = self.store.search_now('net', '*')
+        self.assertEqual(records[0].event, u'disconnect')
+        self.assertEqual(records[0].fields, {u'msg': u'x'})
+    
+    def test_survives_restart(self):
+        for i in xrange(10):
+            self.say('before %d' % i)
+        self.reopen()
+        self.say('after')
+        self.assertEqual(self.messages(u'before', limit=1), [u'before 9'])
+        self.assertEqual(self.messages(limit=2), [u'after', u'before 9'])
+    
+    def test_truncated_record(self):
+        for i in xrange(3):
+            self.say('line %d' % i)
+        # stop without closing the store, part way through a record
+        self.store.sync()
+        directory = os.path.join(self.root, 'net', '%23djirc')
+        [name] = os.listdir(directory)
+        with open(os.path.join(directory, name), 'ab') as f:
+            f.write('\x00\x01\x02')
+        self.store = self.open()
+        self.say('line 3')
+        self.assertEqual(self.messages(u'line'),
+            [u'line 3', u'line 2', u'line 1', u'line 0'])
+    
+    def test_batched_sync(self):
+        for i in xrange(100):
+            self.say('line %d' % i)
+        log = self.store.logs['net', '#djirc']
+        self.assertTrue(log.dirty)
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+        self.clock.advance(self.store.sync_interval)
+        self.assertFalse(log.dirty)
+    
+    def test_search_deferred(self):
+        self.say('hello there')
+        results = []
+        self.store.search('net', '#djirc', u'hello').addCallback(
+            results.append)
+        self.assertEqual([[r.fields['msg'] for r in rs] for rs in results],
+            [[u'hello there']])
+    
+    def test_snapshot_unaffected_by_appends(self):
+        self.say('first match')
+        words, segments = self.store._prepare(
+            'net', '#djirc', u'match', None, None)
+        self.say('second match')
+        records = logstore.search_segments(segments, words)
+        self.assertEqual([r.fields['msg'] for r in records], [u'first match'])
+
+class TestSegments(LogStoreTestCase):
+    segment_size = 2000
+    
+    def test_rotation(self):
+        for i in xrange(300):
+            self.say('message number %d %s' % (i, 'even' if i % 2 else 'odd'))
+            self.clock.advance(60)
+        log = self.store.logs['net', '#djirc']
+        self.assertTrue(len(log.segments) > 5)
+        self.assertTrue(all(s.sealed for s in log.segments[:-1]))
+        self.assertFalse(log.segments[-1].sealed)
+        
+        self.assertEqual(self.messages(u'number 123'),
+            [u'message number 123 even'])
+        self.assertEqual(len(self.messages(u'odd')), 100)
+        self.assertEqual(self.messages(u'odd', limit=2),
+            [u'message number 298 odd', u'message number 296 odd'])
+        since = self.clock.seconds() - 60 * 10
+        self.assertEqual(len(self.messages(since=since)), 10)
+    
+    def test_sealed_after_restart(self):
+        for i in xrange(300):
+            self.say('message number %d' % i)
+        self.reopen()
+        log = self.store._log('net', '#djirc')
+        self.assertTrue(all(s.sealed for s in log.segments[:-1]))
+        self.assertEqual(self.messages(u'message', limit=1000),
+            [u'message number %d' % i for i in xrange(299, -1, -1)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+import unittest
+
+from djirc import metrics
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestHistogram(unittest.TestCase):
+    def test_add(self):
+        h = metrics.Histogram()
+        for seconds in [0.000001, 0.000003, 0.000003, 0.001]:
+            h.add(seconds)
+        self.assertEqual(h.count, 4)
+        self.assertAlmostEqual(h.total, 0.001007)
+        self.assertEqual(h.max, 0.001)
+        self.assertEqual(h.buckets[1], 1)
+        self.assertEqual(h.buckets[2], 2)
+        self.assertEqual(h.buckets[10], 1)
+
+    def test_percentile(self):
+        h = metrics.Histogram()
+        for _ in xrange(99):
+            h.add(0.000010)
+        h.add(0.5)
+        self.assertEqual(h.percentile(50), 16e-6)
+        self.assertEqual(h.percentile(99), 16e-6)
+        self.assertEqual(h.percentile(100), 0.5)
+
+    def test_huge_sample(self):
+        h = metrics.Histogram()
+        h.add(1e6)
+        self.assertEqual(h.buckets[-1], 1)
+        self.assertEqual(h.percentile(99), 1e6)
+
+    def test_empty(self):
+        h = metrics.Histogram()
+        self.assertEqual((h.mean(), h.percentile(99)), (0.0, 0.0))
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.metrics = metrics.Metrics(self.clock)
+
+    def test_time(self):
+        def work(a, b=0):
+            self.clock.now += 0.002
+            return a + b
+        self.assertEqual(self.metrics.time('render', work, 1, b=2), 3)
+        h = self.metrics.histograms['render']
+        self.assertEqual(h.count, 1)
+        self.assertAlmostEqual(h.total, 0.002)
+
+    def test_time_exception(self):
+        def fail():
+            self.clock.now += 1
+            raise ValueError()
+        self.assertRaises(ValueError, self.metrics.time, 'display', fail)
+        self.assertEqual(self.metrics.histograms['display'].count, 1)
+
+    def test_report_in_pipeline_order(self):
+        for stage in ['display', 'render: jinja', 'handle PRIVMSG', 'receive',
+                'other']:
+            self.metrics.add(stage, 0.001)
+        self.metrics.count('bytes received', 300)
+        self.clock.now = 10
+        lines = self.metrics.report()
+        self.assertEqual([line.split(':')[0] for line in lines],
+            ['receive', 'handle PRIVMSG', 'render', 'display', 'other',
+                'bytes received'])
+        self.assertEqual(lines[-1], 'bytes received: 300 (30.0/s)')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+import unittest
+
+from twisted.internet import task
+
+from djirc import floodcontrol, paste
+
+class TestSplitting(unittest.TestCase):
+    def test_text_limit(self):
+        # :nick!<10>@<63> PRIVMSG #a :text\r\n
+        self.assertEqual(paste.text_limit('PRIVMSG #a :', 'nick'),
+            512 - 2 - len(':nick!@ ') - 10 - 63 - len('PRIVMSG #a :'))
+        self.assertEqual(paste.text_limit('PRIVMSG #a :', 'nick', 'u', 'h'),
+            512 - 2 - len(':nick!u@h PRIVMSG #a :'))
+
+    def test_short_line(self):
+        self.assertEqual(paste.split_line('hello', 10), ['hello'])
+
+    def test_split_at_space(self):
+        self.assertEqual(paste.split_line('aaaa bbbb cccc', 10),
+            ['aaaa bbbb ', 'cccc'])
+
+    def test_split_long_word(self):
+        self.assertEqual(paste.split_line('a' * 25, 10),
+            ['a' * 10, 'a' * 10, 'a' * 5])
+
+    def test_utf8_boundaries(self):
+        text = u'\xe9\u20ac' * 20
+        data = text.encode('utf-8')
+        pieces = paste.split_line(data, 16)
+        self.assertTrue(all(len(piece) <= 16 for piece in pieces))
+        self.assertEqual(u''.join(piece.decode('utf-8') for piece in pieces),
+            text)
+
+    def test_split_paste(self):
+        self.assertEqual(paste.split_paste('one\r\n\ntwo  \n' + 'x' * 12, 10),
+            ['one', 'two  ', 'x' * 10, 'xx'])
+
+    def test_indentation_kept(self):
+        self.assertEqual(paste.split_paste('def f():\n    pass', 100),
+            ['def f():', '    pass'])
+
+class TestPaste(unittest.TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.sent = []
+        self.outbound = floodcontrol.OutboundQueue(self.clock, self.sent.append,
+            floodcontrol.TokenBucket(self.clock, 10, 1))
+        self.echoed = []
+        self.done = []
+
+    def paste(self, lines):
+        pasting = paste.Paste(self.outbound, '#a', lines,
+            self.echoed.append, self.done.append)
+        pasting.start()
+        return pasting
+
+    def test_paced(self):
+        pasting = self.paste(['%d' % i for i in xrange(10)])
+        self.assertEqual(self.sent, ['PRIVMSG #a :%d' % i for i in xrange(5)])
+        self.clock.pump([1] * 20)
+        self.assertEqual(len(self.sent), 10)
+        self.assertEqual(self.done, [pasting])
+        self.assertEqual((pasting.sent, pasting.total), (10, 10))
+        self.assertFalse(pasting.cancelled)
+
+    def test_echoed_in_batches(self):
+        self.paste(['%d' % i for i in xrange(10)])
+        self.clock.pump([0.1] * 200)
+        self.assertEqual(self.echoed[0], ['0', '1', '2', '3', '4'])
+        self.assertEqual(sum(self.echoed, []), ['%d' % i for i in xrange(10)])
+
+    def test_other_lines_not_held_up(self):
+        self.paste(['%d' % i for i in xrange(10)])
+        self.clock.advance(1)
+        self.outbound.put('PRIVMSG #b :typed')
+        self.clock.pump([1] * 4)
+        self.assertEqual(self.sent[5:7], ['PRIVMSG #a :5', 'PRIVMSG #b :typed'])
+
+    def test_cancel(self):
+        pasting = self.paste(['%d' % i for i in xrange(10)])
+        self.clock.advance(2)
+        pasting.cancel()
+        self.clock.pump([1] * 20)
+        # the line already queued still goes
+        self.assertEqual(len(self.sent), 7)
+        self.assertTrue(pasting.cancelled)
+        self.assertEqual(self.done, [pasting])
+        self.assertEqual(sum(self.echoed, []), ['%d' % i for i in xrange(7)])
+
+    def test_extend(self):
+        pasting = self.paste(['a'] * 6)
+        pasting.extend(['b'])
+        self.clock.pump([1] * 20)
+        self.assertEqual(self.sent[-1], 'PRIVMSG #a :b')
+        self.assertEqual(pasting.total, 7)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from djirc import profiler
+
+def handle(sampler, event):
+    return show(sampler, 'inner-' + event)
+
+def show(sampler, event):
+    sampler.sample(sys._getframe())
+
+def untagged(sampler):
+    sampler.sample(sys._getframe())
+
+class TestSampler(unittest.TestCase):
+    def test_tags(self):
+        sampler = profiler.Sampler(tags=[(handle, 'event')])
+        handle(sampler, 'msg')
+        handle(sampler, 'msg')
+        untagged(sampler)
+        self.assertEqual(sampler.count, 3)
+        self.assertEqual(sampler.tag_counts(), [('msg', 2), ('-', 1)])
+
+    def test_innermost_tag_wins(self):
+        sampler = profiler.Sampler(tags=[(handle, 'event'), (show, 'event')])
+        handle(sampler, 'msg')
+        self.assertEqual(sampler.tag_counts(), [('inner-msg', 1)])
+
+    def test_getter(self):
+        sampler = profiler.Sampler(tags=[(handle, 'event', str.upper),
+            (untagged, 'sampler', lambda sampler: sampler.missing)])
+        handle(sampler, 'msg')
+        # a getter that fails leaves the sample untagged
+        untagged(sampler)
+        self.assertEqual(sampler.tag_counts(), [('-', 1), ('MSG', 1)])
+
+    def test_collapsed(self):
+        sampler = profiler.Sampler(tags=[(handle, 'event')])
+        handle(sampler, 'msg')
+        handle(sampler, 'msg')
+        untagged(sampler)
+        lines = sampler.collapsed()
+        self.assertEqual(len(lines), 2)
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertEqual(count, '2')
+        frames = stack.split(';')
+        self.assertEqual(frames[0], 'msg')
+        self.assertEqual(frames[-2:], [__name__ + ':handle',
+            __name__ + ':show'])
+        self.assertTrue(lines[1].startswith('-;'))
+
+    def test_samples_thread(self):
+        sampler = profiler.Sampler(interval=0.001)
+        sampler.start()
+        deadline = time.time() + 5
+        while not sampler.count and time.time() < deadline:
+            sum(xrange(1000))
+        sampler.stop()
+        self.assertFalse(sampler.running)
+        self.assertTrue(sampler.count > 0)
+        count = sampler.count
+        time.sleep(0.01)
+        self.assertEqual(sampler.count, count)
+
+    def test_dump(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        sampler = profiler.Sampler(tags=[(handle, 'event')])
+        handle(sampler, 'msg')
+        path = sampler.dump(os.path.join(directory, 'profiles'))
+        with open(path) as f:
+            self.assertEqual(f.read().splitlines(), sampler.collapsed())
+        self.assertNotEqual(sampler.dump(os.path.join(directory, 'profiles')),
+            path)
+
+if __name__ == '__main__':
+    unittest.main()
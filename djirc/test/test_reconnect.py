@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+import random
+import unittest
+
+from twisted.internet import task
+
+from djirc import reconnect
+
+class TestReconnectPolicy(unittest.TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.attempts = []
+    
+    def connect(self):
+        self.attempts.append(self.clock.seconds())
+    
+    def policy(self, **kwargs):
+        kwargs.setdefault('jitter', 0)
+        return reconnect.ReconnectPolicy(self.clock, **kwargs)
+    
+    def test_backoff(self):
+        policy = self.policy(initial_delay=1, factor=2, max_delay=1000)
+        delays = []
+        for _ in xrange(5):
+            delays.append(policy.schedule(self.connect))
+            self.clock.advance(delays[-1])
+        self.assertEqual(delays, [1, 2, 4, 8, 16])
+        self.assertEqual(self.attempts, [1, 3, 7, 15, 31])
+    
+    def test_max_delay(self):
+        policy = self.policy(initial_delay=1, factor=10, max_delay=60)
+        delays = [policy.schedule(self.connect) for _ in xrange(5)]
+        self.assertEqual(delays, [1, 10, 60, 60, 60])
+    
+    def test_long_outage(self):
+        policy = self.policy(jitter=0.1, rng=random.Random(1))
+        for _ in xrange(5000):
+            delay = policy.schedule(self.connect)
+            self.clock.advance(delay)
+        self.assertEqual(len(self.attempts), 5000)
+        self.assertTrue(270 <= delay <= 300)
+        self.assertTrue(policy.retries < 20)
+    
+    def test_nothing_until_delay(self):
+        policy = self.policy(initial_delay=5)
+        policy.schedule(self.connect)
+        self.assertTrue(policy.pending)
+        self.clock.advance(4.9)
+        self.assertEqual(self.attempts, [])
+        self.clock.advance(0.1)
+        self.assertEqual(self.attempts, [5])
+        self.assertFalse(policy.pending)
+    
+    def test_reset(self):
+        policy = self.policy(initial_delay=1, factor=2)
+        for _ in xrange(4):
+            policy.schedule(self.connect)
+        policy.reset()
+        self.assertEqual(policy.next_delay(), 1)
+    
+    def test_schedule_replaces_pending(self):
+        policy = self.policy(initial_delay=1)
+        policy.schedule(self.connect)
+        policy.schedule(self.connect)
+        self.clock.advance(100)
+        self.assertEqual(len(self.attempts), 1)
+    
+    def test_cancel(self):
+        policy = self.policy()
+        policy.schedule(self.connect)
+        policy.cancel()
+        self.clock.advance(1000)
+        self.assertEqual(self.attempts, [])
+        self.assertFalse(policy.pending)
+        policy.cancel() # nothing pending is fine
+    
+    def test_jitter_bounds(self):
+        policy = self.policy(initial_delay=10, factor=1, max_delay=11,
+            jitter=0.2, rng=random.Random(1))
+        delays = [policy.schedule(self.connect) for _ in xrange(200)]
+        self.assertTrue(min(delays) >= 8)
+        self.assertTrue(max(delays) <= 11)
+        # the herd is spread out rather than all retrying together
+        self.assertTrue(len(set(delays)) > 100)
+
+if __name__ == '__main__':
+    unittest.main()
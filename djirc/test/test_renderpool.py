@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+import Queue
+import random
+import threading
+import time
+import unittest
+
+from lxml import etree
+from twisted.python import threadpool
+
+from djirc import renderpool, metrics
+from djirc.ui import headless
+
+class ThreadedReactor(object):
+    """Just enough of a reactor for deferToThreadPool, run by `run_until`"""
+    def __init__(self):
+        self.calls = Queue.Queue()
+
+    def callFromThread(self, func, *args, **kwargs):
+        self.calls.put((func, args, kwargs))
+
+    def run_until(self, done, timeout=10):
+        deadline = time.time() + timeout
+        while not done():
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise AssertionError('timed out')
+            try:
+                func, args, kwargs = self.calls.get(timeout=remaining)
+            except Queue.Empty:
+                continue
+            func(*args, **kwargs)
+
+class PlainView(object):
+    """A view that can only display elements"""
+    def __init__(self):
+        self.lines = []
+
+    def receive_xml(self, element):
+        self.lines.append(element.text)
+
+class TestRenderPool(unittest.TestCase):
+    def setUp(self):
+        self.reactor = ThreadedReactor()
+        self.threadpool = threadpool.ThreadPool(4, 4)
+        self.threadpool.start()
+        self.addCleanup(self.threadpool.stop)
+        self.threads = set()
+        self.pool = renderpool.RenderPool(
+            self.reactor, self.threadpool, self.render)
+
+    def render(self, event, text, delay=0):
+        self.threads.add(threading.current_thread().name)
+        if event == 'broken':
+            raise ValueError(text)
+        time.sleep(delay)
+        li = etree.Element('li')
+        li.text = text
+        return li
+
+    def run_pool(self, views):
+        self.reactor.run_until(
+            lambda: not any(self.pool.pending(view) for view in views))
+
+    def test_order_kept_per_view(self):
+        random.seed(23)
+        views = [headless.HeadlessTabView(name) for name in '#a', '#b', '#c']
+        for i in xrange(200):
+            view = views[i % 3]
+            self.pool.show(view, 'msg',
+                dict(text='%d' % i, delay=random.random() * 0.002))
+        self.run_pool(views)
+        for n, view in enumerate(views):
+            self.assertEqual(view.lines,
+                ['%d' % i for i in xrange(n, 200, 3)])
+        self.assertFalse(threading.current_thread().name in self.threads)
+        self.assertTrue(len(self.threads) > 1)
+
+    def test_plain_view_rendered_in_order(self):
+        view = PlainView()
+        self.pool.show(view, 'msg', dict(text='one'))
+        self.assertEqual(view.lines, ['one'])
+
+    def test_call_waits_for_earlier_lines(self):
+        view = headless.HeadlessTabView('#a')
+        self.pool.show(view, 'msg', dict(text='slow', delay=0.05))
+        self.pool.call(view, lambda: view.lines.append('after'))
+        self.assertEqual(view.lines, [])
+        self.run_pool([view])
+        self.assertEqual(view.lines, ['slow', 'after'])
+
+    def test_timed_on_reactor_thread(self):
+        stats = metrics.Metrics()
+        added = []
+        def add(stage, seconds):
+            added.append((stage, threading.current_thread().name))
+            metrics.Metrics.add(stats, stage, seconds)
+        stats.add = add
+        self.pool.stats = lambda: stats
+        view = headless.HeadlessTabView('#a')
+        for i in xrange(20):
+            self.pool.show(view, 'msg', dict(text='%d' % i))
+        self.run_pool([view])
+        reactor_thread = threading.current_thread().name
+        self.assertEqual(added, [('render: pool', reactor_thread)] * 20)
+        self.assertEqual(stats.histograms['render: pool'].count, 20)
+        # no metrics while /stats is off
+        self.pool.stats = lambda: None
+        self.pool.show(view, 'msg', dict(text='off'))
+        self.run_pool([view])
+        self.assertEqual(len(added), 20)
+
+    def test_failure_skipped(self):
+        view = headless.HeadlessTabView('#a')
+        self.pool.show(view, 'msg', dict(text='one', delay=0.01))
+        self.pool.show(view, 'broken', dict(text='two'))
+        self.pool.show(view, 'msg', dict(text='three'))
+        self.run_pool([view])
+        self.assertEqual(view.lines, ['one', 'three'])
+
+if __name__ == '__main__':
+    unittest.main()
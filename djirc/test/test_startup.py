@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# slow to import, and not needed until the window is showing
+DEFERRED_MODULES = ['yaml', 'jinja2', 'cssutils']
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+
+def run_python(args, **kwargs):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [os.path.abspath(ROOT)] + env.get('PYTHONPATH', '').split(os.pathsep))
+    return subprocess.Popen([sys.executable] + args, env=env, **kwargs)
+
+class TestStartup(unittest.TestCase):
+    def test_imports_deferred(self):
+        process = run_python(['-c',
+            'import sys\n'
+            'import djirc.ircclient, djirc.ui.headless, djirc.ui.css\n'
+            'print " ".join(sorted(set(sys.modules) & set(%r)))'
+                % DEFERRED_MODULES],
+            stdout=subprocess.PIPE)
+        out, _ = process.communicate()
+        self.assertEqual(process.returncode, 0)
+        self.assertEqual(out.split(), [])
+
+    def test_window_before_templates(self):
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        server.settimeout(30)
+        port = server.getsockname()[1]
+        # -v reports each import as it happens, the closest Python 2 has to
+        # -X importtime
+        with tempfile.TemporaryFile() as out:
+            process = run_python(['-u', '-v', '-m', 'djirc.ircclient',
+                '--ui', 'headless', '--server', '127.0.0.1:%d' % port,
+                '--no-history', '--no-cache', '--log'],
+                stdout=out, stderr=subprocess.STDOUT)
+            try:
+                connection, _ = server.accept()
+                connection.close()
+            finally:
+                process.terminate()
+                process.wait()
+                server.close()
+            out.seek(0)
+            lines = out.read().splitlines()
+
+        def first(text):
+            for i, line in enumerate(lines):
+                if text in line:
+                    return i
+            self.fail('%r not in output' % text)
+        shown = first('startup: window shown')
+        for name in ['yaml', 'jinja2']:
+            self.assertTrue(first('import %s ' % name) > shown, name)
+        self.assertTrue(first('startup: connecting') > shown)
+
+if __name__ == '__main__':
+    unittest.main()
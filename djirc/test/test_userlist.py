@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+import time
+import unittest
+
+from djirc import userlist
+
+class TestHelpers(unittest.TestCase):
+    def test_irc_lower(self):
+        self.assertEqual(userlist.irc_lower('Nick[A]\\~'), 'nick{a}|^')
+    
+    def test_split_prefix(self):
+        self.assertEqual(userlist.split_prefix('@+nick'), ('@+', 'nick'))
+        self.assertEqual(userlist.split_prefix('nick'), ('', 'nick'))
+    
+    def test_prefix_changes(self):
+        self.assertEqual(userlist.add_prefix('+', '@'), '@+')
+        self.assertEqual(userlist.add_prefix('@', '@'), '@')
+        self.assertEqual(userlist.remove_prefix('@+', '@'), '+')
+    
+    def test_irc_dict(self):
+        views = userlist.IRCDict()
+        views['Bob[1]'] = 'convo'
+        self.assertEqual(views['bob{1}'], 'convo')
+        self.assertTrue('BOB[1]' in views)
+        self.assertEqual(views.get('#a', 'none'), 'none')
+        self.assertEqual(views.pop('bob[1]'), 'convo')
+        self.assertFalse('Bob[1]' in views)
+
+class TestChannel(unittest.TestCase):
+    def setUp(self):
+        self.channel = userlist.Channel('#djirc')
+    
+    def test_display_order(self):
+        for prefix, nick in [('', 'zed'), ('+', 'Voiced'), ('@', 'op'),
+                ('', 'Alice'), ('%', 'half'), ('@+', 'boss')]:
+            self.channel.add(nick, prefix)
+        self.assertEqual(list(self.channel), [('@+', 'boss'), ('@', 'op'),
+            ('%', 'half'), ('+', 'Voiced'), ('', 'Alice'), ('', 'zed')])
+    
+    def test_add_returns_position(self):
+        self.assertEqual(self.channel.add('b'), 0)
+        self.assertEqual(self.channel.add('a'), 0)
+        self.assertEqual(self.channel.add('c'), 2)
+        self.assertEqual(self.channel.add('op', '@'), 0)
+    
+    def test_readd_changes_prefix(self):
+        self.channel.add('nick')
+        self.channel.add('other')
+        self.channel.add('Nick', '@')
+        self.assertEqual(list(self.channel), [('@', 'Nick'), ('', 'other')])
+        self.assertEqual(len(self.channel), 2)
+    
+    def test_remove(self):
+        self.channel.add('a')
+        self.channel.add('b', '+')
+        self.assertEqual(self.channel.remove('B'), 0)
+        self.assertEqual(self.channel.remove('b'), None)
+        self.assertEqual(list(self.channel), [('', 'a')])
+        self.assertFalse('b' in self.channel)
+        self.assertTrue('A' in self.channel)
+    
+    def test_load(self):
+        self.channel.add('gone')
+        self.channel.load([('', 'b'), ('@', 'c'), ('', 'a')])
+        self.assertEqual(list(self.channel), [('@', 'c'), ('', 'a'), ('', 'b')])
+        self.assertFalse('gone' in self.channel)
+    
+    def test_load_large(self):
+        entries = [('@' if i % 50 == 0 else '', 'user%05d' % i)
+            for i in xrange(10000, 0, -1)]
+        start = time.time()
+        self.channel.load(entries)
+        self.assertTrue(time.time() - start < 1)
+        users = list(self.channel)
+        self.assertEqual(len(users), 10000)
+        self.assertEqual(users[0], ('@', 'user00050'))
+        self.assertEqual(users[-1], ('', 'user09999'))
+
+class TestMembership(unittest.TestCase):
+    def setUp(self):
+        self.users = userlist.Membership()
+        for channel in ['#a', '#b', '#c']:
+            self.users.joined(channel)
+            self.users.names(channel, ['@me', 'bob', '+carol'])
+            self.users.names(channel, [channel[1:] + '_only', ''])
+            self.users.end_of_names(channel)
+    
+    def nicks(self, channel):
+        return [nick for _prefix, nick in self.users[channel]]
+    
+    def test_names(self):
+        self.assertEqual(list(self.users['#A']),
+            [('@', 'me'), ('+', 'carol'), ('', 'a_only'), ('', 'bob')])
+        self.assertEqual(
+            sorted(c.name for c in self.users.channels_of('bob')),
+            ['#a', '#b', '#c'])
+        self.assertEqual([c.name for c in self.users.channels_of('b_only')],
+            ['#b'])
+    
+    def test_names_replaces(self):
+        self.users.names('#a', ['me', 'dave'])
+        self.users.end_of_names('#a')
+        self.assertEqual(self.nicks('#a'), ['dave', 'me'])
+        self.assertEqual(self.users.channels_of('a_only'), [])
+        self.assertEqual(len(self.users.channels_of('dave')), 1)
+    
+    def test_names_for_other_channel(self):
+        self.users.names('#elsewhere', ['x'])
+        self.assertEqual(self.users.end_of_names('#elsewhere'), None)
+    
+    def test_quit_fans_out(self):
+        models = self.users.user_quit('Bob')
+        self.assertEqual(sorted(c.name for c in models), ['#a', '#b', '#c'])
+        for channel in ['#a', '#b', '#c']:
+            self.assertFalse('bob' in self.users[channel])
+        self.assertEqual(self.users.user_quit('bob'), [])
+    
+    def test_join_part(self):
+        self.users.user_joined('#a', 'dave')
+        self.assertEqual(len(self.users.channels_of('dave')), 1)
+        self.users.user_left('#a', 'dave')
+        self.assertEqual(self.users.channels_of('dave'), [])
+        self.assertEqual(self.users.user_joined('#notin', 'dave'), None)
+    
+    def test_rename(self):
+        models = self.users.user_renamed('carol', 'Caroline')
+        self.assertEqual(len(models), 3)
+        self.assertEqual(self.users['#b'].prefix('caroline'), '+')
+        self.assertEqual(self.users.channels_of('carol'), [])
+        self.assertEqual(len(self.users.channels_of('CAROLINE')), 3)
+    
+    def test_mode(self):
+        self.assertEqual(self.users.mode_changed('#a', 'bob', 'o', True).name,
+            '#a')
+        self.assertEqual(self.nicks('#a'), ['bob', 'me', 'carol', 'a_only'])
+        self.assertEqual(self.users.mode_changed('#a', 'bob', 'o', True), None)
+        self.assertEqual(self.users.mode_changed('#a', 'bob', 'k', True), None)
+        self.users.mode_changed('#a', 'carol', 'v', False)
+        self.assertEqual(self.users['#a'].prefix('carol'), '')
+    
+    def test_left(self):
+        self.users.left('#a')
+        self.assertFalse('#a' in self.users)
+        self.assertEqual(sorted(c.name for c in self.users.channels_of('bob')),
+            ['#b', '#c'])
+        self.assertEqual(self.users.channels_of('a_only'), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,14 @@
 #!/usr/bin/env python
 # import webcolors # - optional dependency (see below)
 import os
+import array
+import tempfile
+import collections
+
+from lxml import etree
+from twisted.python import log
+
+from djirc import events
 
 DATA_DIR = os.path.join(__file__, '..', '..', 'data')
 
@@ -65,6 +73,647 @@ def etree_tostring(e):
     """
     return ''.join(_etree_to_strings(e))
 
+def closable(func):
+    """Make a method of a view raise ValueError once the view is closed"""
+    def wrapped(self, *args, **kwargs):
+        if self.closed:
+            raise ValueError("%r is closed" % self)
+        else:
+            return func(self, *args, **kwargs)
+    return wrapped
+
+def flatten(e, key=None, root_key=None, offset=0):
+    """Flatten an etree Element to its text and style runs in a single pass
+
+    Returns `(text, runs)`, where `text` is what `etree_tostring` returns and
+    `runs` lists a `(start, end, depth, key)` tuple for every node, in
+    document order. `start` and `end` are positions in `text` plus `offset`,
+    and `depth` is 0 for `e` itself.
+
+    `key` is the node itself, unless a `key(node, parent_key)` function is
+    given (`parent_key` is `root_key` for `e`), e.g. to build style paths.
+
+    >>> flatten(etree.fromstring('<p>Hello <b><i>wor</i>ld</b>!</p>'))[1]
+    [(0, 12, 0, <Element p>), (6, 11, 1, <Element b>), (6, 9, 2, <Element i>)]
+
+    """
+    texts = []
+    runs = []
+
+    pos = offset
+    # (node, iterator over its children, index in runs, start, key)
+    stack = []
+    node, parent_key = e, root_key
+    while node is not None:
+        node_key = node if key is None else key(node, parent_key)
+        stack.append((node, iter(node), len(runs), pos, node_key))
+        runs.append(None)
+        text = node.text
+        if text:
+            texts.append(text)
+            pos += len(text)
+
+        # find the next node to enter, leaving finished nodes on the way
+        node = None
+        while stack:
+            current, children, i, start, current_key = stack[-1]
+            node = next(children, None)
+            if node is not None:
+                parent_key = current_key
+                break
+            stack.pop()
+            runs[i] = (start, pos, len(stack), current_key)
+            if stack:
+                tail = current.tail
+                if tail:
+                    texts.append(tail)
+                    pos += len(tail)
+
+    return ''.join(texts), runs
+
+def merge_runs(runs):
+    """Merge style runs so that fewer of them have to be applied
+
+    `runs` is a sequence of `(start, end, depth, key)` tuples, as produced for
+    several lines of text joined by newlines. Runs with the same `key` and
+    `depth` that touch are merged; top-level runs (depth 0) may also be joined
+    across the single newline that separates lines. Returns a list of
+    `(start, end, key)` in an order that applies parents before children.
+
+    >>> merge_runs([(0, 5, 0, 'li'), (1, 3, 1, 'b'), (6, 9, 0, 'li')])
+    [(0, 9, 'li'), (1, 3, 'b')]
+
+    """
+    merged = []
+    last = {} # depth -> index in merged of the last run at that depth
+    for start, end, depth, key in sorted(runs, key=lambda run: (run[2], run[0])):
+        gap = 1 if depth == 0 else 0
+        i = last.get(depth)
+        if i is not None:
+            prev_start, prev_end, prev_key = merged[i]
+            if prev_key == key and prev_end <= start <= prev_end + gap:
+                merged[i] = (prev_start, end, key)
+                continue
+        last[depth] = len(merged)
+        merged.append((start, end, key))
+    return merged
+
+class Batcher(object):
+    """Collect items and pass them on in batches
+
+    `flush` is called with a list of the pending items at most once per
+    `interval` seconds (an interval of 0 means once per reactor tick), or as
+    soon as `max_batch` items are pending.
+
+    """
+    def __init__(self, reactor, flush, interval=0, max_batch=500):
+        self.reactor = reactor
+        self._flush = flush
+        self.interval = interval
+        self.max_batch = max_batch
+        self.pending = []
+        self._call = None
+
+    def add(self, item):
+        self.pending.append(item)
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+        elif self._call is None:
+            self._call = self.reactor.callLater(self.interval, self.flush)
+
+    def flush(self):
+        """Pass on all pending items now"""
+        if self._call is not None:
+            if self._call.active():
+                self._call.cancel()
+            self._call = None
+
+        pending, self.pending = self.pending, []
+        if pending:
+            self._flush(pending)
+
+class IntRing(object):
+    """Double-ended queue of integers kept in a growable circular array"""
+    def __init__(self, capacity=64):
+        self._items = array.array('l', [0]) * capacity
+        self._head = 0
+        self._size = 0
+    
+    def __len__(self):
+        return self._size
+    
+    def __iter__(self):
+        items = self._items
+        for i in xrange(self._size):
+            yield items[(self._head + i) % len(items)]
+    
+    def _grow(self):
+        items = array.array('l', self)
+        items.extend(array.array('l', [0]) * max(len(self._items), 1))
+        self._items = items
+        self._head = 0
+    
+    def append(self, n):
+        if self._size == len(self._items):
+            self._grow()
+        self._items[(self._head + self._size) % len(self._items)] = n
+        self._size += 1
+    
+    def appendleft(self, n):
+        if self._size == len(self._items):
+            self._grow()
+        self._head = (self._head - 1) % len(self._items)
+        self._items[self._head] = n
+        self._size += 1
+    
+    def popleft(self):
+        if not self._size:
+            raise IndexError("pop from empty IntRing")
+        n = self._items[self._head]
+        self._head = (self._head + 1) % len(self._items)
+        self._size -= 1
+        return n
+
+class Scrollback(object):
+    """Track the lengths of the lines shown in a view to bound its size
+    
+    Once the view holds more than `max_lines` lines or `max_chars` characters
+    (either may be None for no limit), `trim` evicts the oldest lines until
+    the view is back down to `low_water` of its limits, so that text is
+    removed rarely and in large chunks.
+    
+    Once older lines are put back with `prepend`, nothing is evicted until
+    `unpin`, so that the lines being read aren't removed from under the
+    reader.
+    
+    """
+    def __init__(self, max_lines=None, max_chars=None, low_water=0.75):
+        self.max_lines = max_lines
+        self.max_chars = max_chars
+        self.low_water = low_water
+        
+        self.lengths = IntRing()
+        self.chars = 0
+        self.evicted = 0 # lines evicted so far
+        self.pinned = False
+    
+    def __len__(self):
+        return len(self.lengths)
+    
+    def append(self, length):
+        """Record a new line of `length` characters (including newline)"""
+        self.lengths.append(length)
+        self.chars += length
+    
+    def _over(self, lines, chars):
+        return ((self.max_lines is not None and len(self) > lines) or
+            (self.max_chars is not None and self.chars > chars))
+    
+    def trim(self):
+        """Evict the oldest lines if over the limits
+        
+        Returns the number of characters evicted from the start of the view.
+        
+        """
+        if self.pinned or not self._over(self.max_lines, self.max_chars):
+            return 0
+        
+        lines = chars = None
+        if self.max_lines is not None:
+            lines = int(self.max_lines * self.low_water)
+        if self.max_chars is not None:
+            chars = int(self.max_chars * self.low_water)
+        
+        removed = 0
+        while self.lengths and self._over(lines, chars):
+            length = self.lengths.popleft()
+            self.chars -= length
+            removed += length
+            self.evicted += 1
+        return removed
+    
+    def prepend(self, lengths):
+        """Record new lines of `lengths` before the first line, and pin"""
+        for length in reversed(lengths):
+            self.lengths.appendleft(length)
+            self.chars += length
+        self.pinned = True
+    
+    def unpin(self):
+        """Let `trim` evict lines again"""
+        self.pinned = False
+
+class ScrollbackFile(object):
+    """Append-only temporary file holding lines of any number of views
+    
+    Views share one, so that a client with hundreds of views doesn't keep a
+    file open for each (see `ScrollbackLog`).
+    
+    """
+    def __init__(self, f=None):
+        if f is None:
+            f = tempfile.TemporaryFile()
+        self.file = f
+        self._end = 0
+        self._reading = False
+    
+    def append(self, line):
+        """Append `line`, a str ending with a newline; returns its offset"""
+        if self._reading:
+            self.file.seek(self._end)
+            self._reading = False
+        offset = self._end
+        self.file.write(line)
+        self._end += len(line)
+        return offset
+    
+    def read(self, offset, length):
+        """Return the `length` bytes at `offset`"""
+        self.file.flush()
+        self.file.seek(offset)
+        self._reading = True
+        return self.file.read(length)
+    
+    def close(self):
+        self.file.close()
+
+class ScrollbackLog(object):
+    """Append-only on-disk store of a view's lines
+    
+    Lines are numbered from 0 in the order they were appended, and can be read
+    back by number to restore history that was evicted from the view. They
+    are written to `store`, a `ScrollbackFile` that may be shared with other
+    views; by default, one of its own.
+    
+    """
+    def __init__(self, store=None):
+        self.own_store = store is None
+        if store is None:
+            store = ScrollbackFile()
+        self.store = store
+        self.offsets = array.array('l')
+        self.lengths = array.array('i') # including the newline
+    
+    def __len__(self):
+        return len(self.offsets)
+    
+    def append(self, line):
+        """Append `line`, a str without newlines"""
+        self.offsets.append(self.store.append(line + '\n'))
+        self.lengths.append(len(line) + 1)
+    
+    def read(self, start, stop):
+        """Return the list of lines numbered `start` up to `stop`"""
+        stop = min(stop, len(self))
+        offsets = self.offsets
+        lengths = self.lengths
+        result = []
+        i = start
+        while i < stop:
+            # read lines that follow one another in the file at once
+            end = offsets[i] + lengths[i]
+            j = i + 1
+            while j < stop and offsets[j] == end:
+                end += lengths[j]
+                j += 1
+            result.extend(
+                self.store.read(offsets[i], end - offsets[i]).split('\n')[:-1])
+            i = j
+        return result
+    
+    def close(self):
+        if self.own_store:
+            self.store.close()
+
+def layout_lines(lines, start=0):
+    """Join flattened lines into one text, one line after another
+    
+    `lines` holds `(text, runs)` pairs as returned by `flatten` (with an
+    offset of 0). Returns `(text, runs, lengths)`: the joined text with a
+    newline after every line, the runs moved to where their line starts (plus
+    `start`), and the length of each line including its newline.
+    
+    """
+    texts = []
+    runs = []
+    lengths = []
+    pos = start
+    for text, line_runs in lines:
+        texts.append(text)
+        texts.append('\n')
+        if pos:
+            runs.extend((run_start + pos, run_end + pos, depth, key)
+                for run_start, run_end, depth, key in line_runs)
+        else:
+            runs.extend(line_runs)
+        lengths.append(len(text) + 1)
+        pos += len(text) + 1
+    return ''.join(texts), runs, lengths
+
+class LineBuffer(object):
+    """The lines received by a view, flattened, whether it's shown or not
+    
+    Only the latest `max_lines` lines are kept in memory, as `(text, runs)`
+    pairs from `flatten` (called with `key` and `root_key`). If `history` (a
+    `ScrollbackLog`) is given, every line is also written to it, so that older
+    lines can be read back from disk.
+    
+    Lines can also be appended as event records (see `djirc.events`), which
+    are kept as they are until they are read, and only then rendered to an
+    element with `render(record)`.
+    
+    Lines are numbered from 0 in the order they were appended.
+    
+    """
+    def __init__(self, max_lines=500, history=None, key=None, root_key=None,
+            render=None):
+        self.lines = collections.deque(maxlen=max_lines)
+        self.history = history
+        self.key = key
+        self.root_key = root_key
+        self.render = render
+        self.count = 0
+    
+    def __len__(self):
+        return self.count
+    
+    @property
+    def first(self):
+        """Number of the oldest line kept in memory"""
+        return self.count - len(self.lines)
+    
+    @property
+    def available(self):
+        """Number of the oldest line that can still be read"""
+        if self.history is not None:
+            return 0
+        return self.first
+    
+    def _flatten(self, element):
+        return flatten(element, self.key, self.root_key)
+    
+    def append(self, element):
+        """Append an etree Element as a line; returns it flattened"""
+        return self.append_prepared(self.prepare(element))
+    
+    def prepare(self, element):
+        """Do the work of appending `element` that needs no other state
+        
+        Returns what `append_prepared` takes: the flattened line, and the
+        line for the history (if any). Safe to call from any thread, as long
+        as `key` is.
+        
+        """
+        history_line = None
+        if self.history is not None:
+            history_line = element_to_line(element)
+        return self._flatten(element), history_line
+    
+    def append_prepared(self, prepared):
+        """Append a line returned by `prepare`; returns it flattened"""
+        line, history_line = prepared
+        self.lines.append(line)
+        self.count += 1
+        if history_line is not None:
+            self.history.append(history_line)
+        return line
+    
+    def append_event(self, record):
+        """Append an event record as a line, to be rendered when it's read"""
+        self.lines.append(record)
+        self.count += 1
+        if self.history is not None:
+            self.history.append(events.to_line(record))
+    
+    def _from_history(self, line):
+        if events.is_line(line):
+            return self._flatten(self.render(events.from_line(line)))
+        return self._flatten(line_to_element(line))
+    
+    def read(self, start, stop):
+        """Return the flattened lines numbered `start` up to `stop`
+        
+        Lines that are no longer available are left out.
+        
+        """
+        start = max(start, self.available)
+        stop = min(stop, self.count)
+        if start >= stop:
+            return []
+        
+        first = self.first
+        result = []
+        if start < first:
+            result.extend(self._from_history(line)
+                for line in self.history.read(start, min(stop, first)))
+            start = first
+        lines = self.lines
+        for i in xrange(start - first, stop - first):
+            line = lines[i]
+            if not isinstance(line, tuple):
+                # an event record: render it, once
+                line = lines[i] = self._flatten(self.render(line))
+            result.append(line)
+        return result
+    
+    def close(self):
+        if self.history is not None:
+            self.history.close()
+
+class ControlView(object):
+    """A view of a `LineBuffer`, shown in a text control while attached
+    
+    The control is shared by all views and shows the selected one; it is a
+    wx.TextCtrl in the wx UI, but anything with the same methods will do.
+    Style runs are applied with the style `text_attrs(key)` gives for their
+    key.
+    
+    If given, `batcher_factory` is called with the function that appends
+    prepared lines, and should return a `Batcher` (or None to append every
+    line as soon as it's received).
+    
+    If `scrollback_factory` is given, it's called on every `attach` for a
+    `Scrollback`, and the oldest lines are removed from the control once it's
+    over its limits.
+    
+    """
+    def __init__(self, name, buffer, batcher_factory=None,
+            scrollback_factory=None, text_attrs=None):
+        self.name = name
+        self.network = None
+        self.closed = False
+        self.buffer = buffer
+        self.scrollback_factory = scrollback_factory
+        self.text_attrs = text_attrs
+        
+        # while attached: the control, what it holds, and the number of its
+        # first line
+        self.control = None
+        self.scrollback = None
+        self.first_shown = None
+        
+        self.batcher = None
+        if batcher_factory is not None:
+            self.batcher = batcher_factory(self._append_prepared)
+    
+    @closable
+    def receive_xml(self, element):
+        self.receive_prepared(self.prepare_xml(element))
+    
+    def prepare_xml(self, element):
+        return self.buffer.prepare(element)
+    
+    @property
+    def showing(self):
+        """Whether lines received now are displayed (or waiting to be)"""
+        return self.control is not None or (
+            self.batcher is not None and bool(self.batcher.pending))
+    
+    @closable
+    def receive_event(self, record):
+        if not self.showing:
+            # the record is only rendered if the view is shown (or its line
+            # read back) later
+            self.buffer.append_event(record)
+        else:
+            self.receive_xml(self.buffer.render(record))
+    
+    @closable
+    def receive_prepared(self, prepared):
+        if self.batcher is None:
+            self._append_prepared([prepared])
+        else:
+            self.batcher.add(prepared)
+    
+    def _apply_runs(self, runs):
+        for start, end, key in merge_runs(runs):
+            attr = self.text_attrs(key)
+            success = self.control.SetStyle(start, end, attr)
+            if not success:
+                log.err("SetStyle failed for %s over (%d, %d)" %
+                    (' > '.join(key), start, end))
+    
+    def _append_prepared(self, prepared):
+        """Append prepared lines, to the control with a single append"""
+        lines = [self.buffer.append_prepared(line) for line in prepared]
+        if self.control is not None:
+            self._write_lines(lines)
+    
+    def _write_lines(self, lines):
+        text, runs, lengths = layout_lines(
+            lines, self.control.GetLastPosition())
+        
+        self.control.Freeze()
+        try:
+            self.control.AppendText(text)
+            self._apply_runs(runs)
+            
+            if self.scrollback is not None:
+                for length in lengths:
+                    self.scrollback.append(length)
+                self._trim()
+        finally:
+            self.control.Thaw()
+    
+    def _trim(self):
+        evicted = self.scrollback.evicted
+        removed = self.scrollback.trim()
+        if removed:
+            self.control.Remove(0, removed)
+            self.first_shown += self.scrollback.evicted - evicted
+    
+    def scrolled_to_end(self):
+        """Trim the control again, now that the newest lines are in view
+        
+        Lines paged in with `page_older` are kept until this is called.
+        
+        """
+        if self.scrollback is None or not self.scrollback.pinned:
+            return
+        self.scrollback.unpin()
+        self.control.Freeze()
+        try:
+            self._trim()
+            self.control.ShowPosition(self.control.GetLastPosition())
+        finally:
+            self.control.Thaw()
+    
+    @closable
+    def attach(self, control, window=500):
+        """Show the view in `control`
+        
+        The control is cleared and filled with the last `window` lines.
+        
+        """
+        self.control = control
+        self.scrollback = None
+        if self.scrollback_factory is not None:
+            self.scrollback = self.scrollback_factory()
+        
+        lines = self.buffer.read(len(self.buffer) - window, len(self.buffer))
+        self.first_shown = len(self.buffer) - len(lines)
+        
+        control.Freeze()
+        try:
+            control.Clear()
+            self._write_lines(lines)
+            control.ShowPosition(control.GetLastPosition())
+        finally:
+            control.Thaw()
+    
+    def detach(self):
+        """Stop showing the view; lines are still kept in the buffer"""
+        self.control = None
+        self.scrollback = None
+        self.first_shown = None
+    
+    @closable
+    def page_older(self, n=200):
+        """Insert up to `n` older lines at the top of the attached control
+        
+        The control keeps showing what it showed before. Returns the number of
+        lines inserted.
+        
+        """
+        if self.control is None:
+            return 0
+        stop = self.first_shown
+        lines = self.buffer.read(stop - n, stop)
+        if not lines:
+            return 0
+        text, runs, lengths = layout_lines(lines)
+        
+        self.control.Freeze()
+        try:
+            self.control.SetInsertionPoint(0)
+            self.control.WriteText(text)
+            self._apply_runs(runs)
+            self.control.SetInsertionPointEnd()
+            self.control.ShowPosition(len(text))
+        finally:
+            self.control.Thaw()
+        
+        if self.scrollback is not None:
+            self.scrollback.prepend(lengths)
+        self.first_shown -= len(lines)
+        return len(lines)
+    
+    @closable
+    def close(self):
+        if self.batcher is not None:
+            self.batcher.flush()
+        self.buffer.close()
+        self.detach()
+        self.closed = True
+
+def element_to_line(e):
+    """Serialize an etree Element to a UTF-8 str without newlines"""
+    return etree.tostring(e, encoding='utf-8').replace('\n', '&#10;')
+
+def line_to_element(line):
+    """Parse a line created by `element_to_line` back to an Element"""
+    return etree.fromstring(line)
+
 try:
     import webcolors
 except ImportError:
@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+"""CSS cascade for styling rendered events
+
+A stylesheet is compiled once into a `Cascade`, which resolves the style of an
+element from its path (the steps from the root ``body`` down to it). Resolved
+styles are memoized per path, so styling a rendered event is a dictionary
+lookup per node once the cascade is warm.
+
+"""
+import re
+
+# cssutils is imported when a stylesheet is first parsed, as it is slow to
+# import and only needed once the UI is showing
+from twisted.python import log
+
+from djirc.ui import common
+
+ROOT = 'body'
+
+# properties that stack (later values are fallbacks tried first) rather than
+# replace each other
+STACKED_PROPERTIES = frozenset(['font-family'])
+
+_COMPOUND_RE = re.compile(r'^(\*|[A-Za-z][\w-]*)?((?:[.#][\w-]+)*)$')
+_QUALIFIER_RE = re.compile(r'([.#])([\w-]+)')
+
+def css_urlFetch(url):
+    """Disable CSS URLs for now"""
+    raise NotImplementedError("URL loading is forbidden")
+
+def _parser():
+    import cssutils
+    parser = cssutils.CSSParser()
+    parser.setFetcher(css_urlFetch)
+    return parser
+
+def parse_stylesheet(path):
+    return _parser().parseFile(path)
+
+def parse_string(text):
+    """Parse the stylesheet `text`"""
+    return _parser().parseString(text)
+
+def verify_minimum_style(style):
+    """Verify minimum required style rules exist"""
+    # FIXME: doesn't need to all be defined at root, but all defined eventually
+    props = ['color', 'background-color', 'font-family']
+    problems = [prop for prop in props if prop not in style]
+
+    if problems:
+        raise ValueError("Missing styles: %s" % ', '.join(problems))
+
+def declarations(style):
+    """Convert a `cssutils.css.CSSStyleDeclaration` to `(name, value)` pairs
+
+    Colors are converted with `common.css_color_to_rgb`.
+
+    """
+    result = []
+    for prop in style.getProperties():
+        if 'color' in prop.name: #todo: better method
+            value = common.css_color_to_rgb(prop.value)
+        else:
+            value = prop.value
+        result.append((prop.name, value))
+    return result
+
+def apply_declarations(style_d, decls):
+    """Cascade `(name, value)` pairs `decls` onto the style dict `style_d`"""
+    for name, value in decls:
+        if name in STACKED_PROPERTIES:
+            style_d.setdefault(name, []).append(value)
+        else:
+            style_d[name] = value
+
+def copy_style(style_d):
+    """Copy a style dict, including the lists of stacked properties"""
+    copied = dict(style_d)
+    for name in STACKED_PROPERTIES:
+        if name in copied:
+            copied[name] = list(copied[name])
+    return copied
+
+def freeze_style(style_d):
+    """Return a hashable version of the style dict `style_d`"""
+    return tuple(sorted(
+        (name, tuple(value) if isinstance(value, list) else value)
+        for name, value in style_d.iteritems()))
+
+def styles2dict(styles):
+    """Create a style dict from a list of `cssutils.css.CSSStyleDeclaration`s
+
+    Later styles override earlier ones, except that font families stack.
+
+    """
+    if len(styles) < 1:
+        raise ValueError("must use at least one style")
+
+    style_d = {}
+    for style in styles:
+        apply_declarations(style_d, declarations(style))
+
+    verify_minimum_style(style_d)
+
+    return style_d
+
+def element_step(element):
+    """Return the path step for an etree Element
+
+    A step is written like a compound selector: ``tag``, ``tag.class`` or
+    ``tag#id.class1.class2``.
+
+    """
+    step = element.tag
+    element_id = element.get('id')
+    if element_id:
+        step += '#' + element_id
+    classes = element.get('class')
+    if classes:
+        step += ''.join(sorted('.' + c for c in classes.split()))
+    return step
+
+ROOT_PATH = (ROOT,)
+
+# every distinct path, so that equal paths are shared rather than copied
+_paths = {}
+
+def element_path(element, parent_path):
+    """Return the path of `element`, a child of the element at `parent_path`
+
+    Suitable as the key function for `common.flatten`, with a root key of
+    `ROOT_PATH`. Equal paths are the same object.
+
+    """
+    path = parent_path + (element_step(element),)
+    return _paths.setdefault(path, path)
+
+class Compound(object):
+    """A compound selector: optional tag, id and classes"""
+    __slots__ = ['tag', 'id', 'classes']
+
+    def __init__(self, tag, id, classes):
+        self.tag = tag
+        self.id = id
+        self.classes = classes
+
+    @classmethod
+    def parse(cls, text):
+        """Parse a compound selector (or path step), or raise ValueError"""
+        match = _COMPOUND_RE.match(text)
+        if match is None or not text:
+            raise ValueError("Unsupported selector: %r" % text)
+        tag, qualifiers = match.groups()
+        if tag == '*':
+            tag = None
+
+        id = None
+        classes = set()
+        for kind, name in _QUALIFIER_RE.findall(qualifiers):
+            if kind == '#':
+                id = name
+            else:
+                classes.add(name)
+        return cls(tag, id, frozenset(classes))
+
+    def specificity(self):
+        return (int(self.id is not None), len(self.classes),
+            int(self.tag is not None))
+
+    def matches(self, step):
+        """Whether this selector matches the parsed path step `step`"""
+        return ((self.tag is None or self.tag == step.tag) and
+            (self.id is None or self.id == step.id) and
+            self.classes <= step.classes)
+
+class Selector(object):
+    """A complex selector of compounds joined by descendant/child combinators
+
+    """
+    def __init__(self, text):
+        tokens = text.replace('>', ' > ').split()
+        if not tokens or tokens[0] == '>' or tokens[-1] == '>':
+            raise ValueError("Unsupported selector: %r" % text)
+
+        # (compound, combinator joining it to the compound on its right),
+        # stored right to left
+        self.parts = []
+        combinator = None
+        for token in reversed(tokens):
+            if token == '>':
+                if combinator == '>':
+                    raise ValueError("Unsupported selector: %r" % text)
+                combinator = '>'
+                continue
+            self.parts.append((Compound.parse(token), combinator))
+            combinator = ' '
+
+        ids, classes, tags = 0, 0, 0
+        for compound, _combinator in self.parts:
+            i, c, t = compound.specificity()
+            ids += i
+            classes += c
+            tags += t
+        self.specificity = (ids, classes, tags)
+        self.subject_tag = self.parts[0][0].tag
+
+    def matches(self, steps):
+        """Whether this selector matches the last of the parsed `steps`"""
+        return self._matches(steps, len(steps) - 1, 0)
+
+    def _matches(self, steps, i, part):
+        compound, _combinator = self.parts[part]
+        if not compound.matches(steps[i]):
+            return False
+        if part + 1 == len(self.parts):
+            return True
+
+        # the combinator between this part and the next one (to the left)
+        combinator = self.parts[part + 1][1]
+        if combinator == '>':
+            return i > 0 and self._matches(steps, i - 1, part + 1)
+        return any(self._matches(steps, j, part + 1)
+            for j in xrange(i - 1, -1, -1))
+
+class Cascade(object):
+    """A stylesheet compiled into a lookup table from element paths to styles
+
+    A path is a tuple of steps (see `element_step`) starting at ``body``. The
+    style for a path is the style of its parent with the declarations of every
+    rule matching it applied in order of specificity, then source order.
+
+    """
+    def __init__(self, stylesheet):
+        import cssutils
+        # subject tag (None for any) -> [(specificity, order, selector, decls)]
+        self._rules = {}
+        order = 0
+        for rule in stylesheet.cssRules.rulesOfType(
+                cssutils.css.CSSRule.STYLE_RULE):
+            decls = declarations(rule.style)
+            for selector in rule.selectorList:
+                try:
+                    compiled = Selector(selector.selectorText)
+                except ValueError:
+                    log.err("Ignoring unsupported selector: %s" %
+                        selector.selectorText)
+                    continue
+                self._rules.setdefault(compiled.subject_tag, []).append(
+                    (compiled.specificity, order, compiled, decls))
+                order += 1
+
+        self._steps = {}
+        self._styles = {}
+        self._frozen = {}
+
+        verify_minimum_style(self.lookup((ROOT,)))
+
+    def _parse_step(self, step):
+        try:
+            return self._steps[step]
+        except KeyError:
+            parsed = self._steps[step] = Compound.parse(step)
+            return parsed
+
+    def lookup(self, path):
+        """Return the resolved style dict for `path`
+
+        The returned dict is shared and must not be modified.
+
+        """
+        try:
+            return self._styles[path]
+        except KeyError:
+            pass
+
+        if len(path) > 1:
+            style_d = copy_style(self.lookup(path[:-1]))
+        else:
+            style_d = {}
+
+        steps = [self._parse_step(step) for step in path]
+        subject = steps[-1].tag
+        matching = [
+            (specificity, order, decls)
+            for tag in (subject, None)
+            for specificity, order, selector, decls in self._rules.get(tag, ())
+            if selector.matches(steps)]
+        for _specificity, _order, decls in sorted(matching):
+            apply_declarations(style_d, decls)
+
+        self._styles[path] = style_d
+        return style_d
+
+    def lookup_key(self, path):
+        """Return a hashable form of the resolved style for `path`"""
+        try:
+            return self._frozen[path]
+        except KeyError:
+            key = self._frozen[path] = freeze_style(self.lookup(path))
+            return key
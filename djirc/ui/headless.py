@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""User interface without a display, for bots and load testing
+
+Views flatten every line they receive the way a graphical UI would, then
+either record the text or discard it. Runs on the default Twisted reactor,
+so any number of clients can share one process.
+
+"""
+import zope.interface
+
+from djirc import interfaces
+from djirc.ui import common
+
+closable = common.closable
+
+class HeadlessUI(object):
+    zope.interface.implements(interfaces.IUserInterface)
+    def __init__(self, record=True):
+        """Create a headless UI
+
+        If `record` is true, views keep the flattened text of every line they
+        receive in `lines`; otherwise they only count them.
+
+        """
+        self.record = record
+        self.networks = []
+        self.metaclient = None # set by create_metaclient
+
+    def add_network(self, name):
+        view = HeadlessNetworkView(self, name)
+        self.networks.append(view)
+        return view
+
+    def enter_message(self, view, line):
+        """Act as though `line` was typed into `view`"""
+        self.metaclient.send_command(view, line)
+
+class HeadlessTabView(object):
+    zope.interface.implements(interfaces.IUIPreparedTab)
+    def __init__(self, name, record=True, network=None):
+        self.name = name
+        self.network = network
+        self.record = record
+        self.closed = False
+        self.highlighted = False
+        self.received = 0
+        self.lines = []
+
+    def __repr__(self):
+        return '<%s %r>' % (type(self).__name__, self.name)
+
+    @closable
+    def receive_xml(self, element):
+        self.receive_prepared(self.prepare_xml(element))
+
+    def prepare_xml(self, element):
+        text, _runs = common.flatten(element)
+        return text
+
+    @closable
+    def receive_prepared(self, text):
+        self.received += 1
+        if self.record:
+            self.lines.append(text)
+
+    @closable
+    def highlight(self):
+        self.highlighted = True
+
+    @closable
+    def unhighlight(self):
+        self.highlighted = False
+
+    @closable
+    def close(self):
+        self.closed = True
+
+class HeadlessChannelView(HeadlessTabView):
+    zope.interface.implements(interfaces.IUIChannel, interfaces.IUIUserList)
+    topic = None
+
+    def __init__(self, *args, **kwargs):
+        super(HeadlessChannelView, self).__init__(*args, **kwargs)
+        self.users = [] # (prefix, nick), in display order
+        self.user_list_updates = 0
+
+    @closable
+    def set_topic(self, topic):
+        self.topic = topic
+
+    @closable
+    def add_user(self, nick):
+        self.users.append(('', nick))
+
+    @closable
+    def remove_user(self, nick):
+        self.users = [user for user in self.users if user[1] != nick]
+
+    @closable
+    def set_users(self, users):
+        self.user_list_updates += 1
+        self.users = list(users)
+
+class HeadlessConvoView(HeadlessTabView):
+    zope.interface.implements(interfaces.IUIConvo)
+
+class HeadlessNetworkView(HeadlessTabView):
+    zope.interface.implements(interfaces.IUINetwork)
+    def __init__(self, ui, name):
+        super(HeadlessNetworkView, self).__init__(None, ui.record, name)
+        self.ui = ui
+        self.tab_map = {}
+
+    def _add_tab(self, cls, tab_name):
+        view = self.tab_map[tab_name] = cls(
+            tab_name, self.record, self.network)
+        return view
+
+    @closable
+    def add_channel(self, channel_name):
+        return self._add_tab(HeadlessChannelView, channel_name)
+
+    @closable
+    def add_convo(self, nick):
+        return self._add_tab(HeadlessConvoView, nick)
+
+def install_reactor():
+    """Use the default Twisted reactor"""
+
+def create_metaclient(reactor, metaclient_factory, record=True):
+    ui = HeadlessUI(record)
+    metaclient = ui.metaclient = metaclient_factory(reactor, ui)
+    return metaclient
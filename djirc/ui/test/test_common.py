@@ -1,8 +1,13 @@
 #!/usr/bin/env python
+import random
 import unittest
 
 from lxml import etree # mock ... ?
+from twisted.internet import task
+
+from djirc import events
 from djirc.ui import common
+from djirc.test import read_recording
 
 class Test_dfs(unittest.TestCase):
     def test_singleton(self):
@@ -64,5 +69,554 @@ class Test__etree_to_strings2(AbstractTest__etree_to_strings):
     def setUp(self):
         self.func = common._etree_to_strings2
 
+def random_tree(rng, size):
+    root = etree.Element('root')
+    root.text = rng.choice(['', 'r'])
+    nodes = [root]
+    for i in xrange(size):
+        node = etree.SubElement(rng.choice(nodes), rng.choice('abi'))
+        node.text = rng.choice(['', None, 'text%d' % i])
+        node.tail = rng.choice(['', None, 'tail%d' % i])
+        nodes.append(node)
+    return root
+
+def dfs_runs(e):
+    """Compute runs the old way: one dfs for text, one for offsets"""
+    starts = {}
+    runs = []
+    pos = 0
+    depth = -1
+    for node, seen in common.dfs(e):
+        if not seen:
+            depth += 1
+            starts[node] = pos
+            pos += len(node.text or '')
+        else:
+            runs.append((starts[node], pos, depth, node))
+            depth -= 1
+            if node is not e:
+                pos += len(node.tail or '')
+    order = dict((node, i) for i, node in enumerate(e.iter()))
+    runs.sort(key=lambda run: order[run[3]])
+    return common.etree_tostring(e), runs
+
+class Test_flatten(unittest.TestCase):
+    def test_empty(self):
+        e = etree.fromstring('<empty/>')
+        self.assertEqual(common.flatten(e), ('', [(0, 0, 0, e)]))
+    
+    def test_ignores_root_tail(self):
+        e = etree.fromstring('<full><empty/> test</full>')[0]
+        self.assertEqual(common.flatten(e), ('', [(0, 0, 0, e)]))
+    
+    def test_nested(self):
+        e = etree.fromstring('<p>Hello <b><i>wor</i>ld</b>! &lt;3</p>')
+        b = e[0]
+        i = b[0]
+        self.assertEqual(common.flatten(e), ('Hello world! <3', [
+            (0, 15, 0, e),
+            (6, 11, 1, b),
+            (6, 9, 2, i)]))
+    
+    def test_offset(self):
+        e = etree.fromstring('<p>ab<b>c</b></p>')
+        self.assertEqual(common.flatten(e, offset=10)[1],
+            [(10, 13, 0, e), (12, 13, 1, e[0])])
+    
+    def test_keys(self):
+        e = etree.fromstring('<p><b><i>x</i></b><i/></p>')
+        def path(node, parent):
+            return parent + (node.tag,)
+        self.assertEqual(
+            [run[3] for run in common.flatten(e, path, ('body',))[1]],
+            [('body', 'p'), ('body', 'p', 'b'), ('body', 'p', 'b', 'i'),
+                ('body', 'p', 'i')])
+    
+    def test_matches_dfs(self):
+        rng = random.Random(0)
+        for size in [0, 1, 2, 5, 20, 100]:
+            for _ in xrange(20):
+                e = random_tree(rng, size)
+                self.assertEqual(common.flatten(e), dfs_runs(e))
+    
+    def test_deep(self):
+        root = node = etree.Element('a')
+        for _ in xrange(5000):
+            node = etree.SubElement(node, 'a')
+            node.tail = 'x'
+        text, runs = common.flatten(root)
+        self.assertEqual(text, 'x' * 5000)
+        self.assertEqual(len(runs), 5001)
+        self.assertEqual(runs[-1], (0, 0, 5000, node))
+
+class Test_merge_runs(unittest.TestCase):
+    def test_empty(self):
+        self.assertEqual(common.merge_runs([]), [])
+    
+    def test_lines_merge_across_newline(self):
+        self.assertEqual(
+            common.merge_runs([(0, 4, 0, 'li'), (5, 9, 0, 'li')]),
+            [(0, 9, 'li')])
+    
+    def test_nested_not_merged_across_gap(self):
+        runs = [(0, 9, 0, 'li'), (1, 3, 1, 'b'), (4, 6, 1, 'b')]
+        self.assertEqual(common.merge_runs(runs),
+            [(0, 9, 'li'), (1, 3, 'b'), (4, 6, 'b')])
+    
+    def test_nested_adjacent_merged(self):
+        runs = [(0, 9, 0, 'li'), (1, 3, 1, 'b'), (3, 6, 1, 'b')]
+        self.assertEqual(common.merge_runs(runs),
+            [(0, 9, 'li'), (1, 6, 'b')])
+    
+    def test_different_keys_not_merged(self):
+        runs = [(0, 4, 0, 'li'), (5, 9, 0, 'p')]
+        self.assertEqual(common.merge_runs(runs), [(0, 4, 'li'), (5, 9, 'p')])
+    
+    def test_parents_before_children(self):
+        runs = [(1, 3, 1, 'b'), (0, 4, 0, 'li'), (6, 8, 1, 'b'),
+            (5, 9, 0, 'li')]
+        self.assertEqual(common.merge_runs(runs),
+            [(0, 9, 'li'), (1, 3, 'b'), (6, 8, 'b')])
+
+class TestBatcher(unittest.TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.batches = []
+    
+    def batcher(self, interval, max_batch):
+        return common.Batcher(
+            self.clock, self.batches.append, interval, max_batch)
+    
+    def test_flushes_after_interval(self):
+        b = self.batcher(0.1, 10)
+        b.add(1)
+        b.add(2)
+        self.assertEqual(self.batches, [])
+        self.clock.advance(0.1)
+        self.assertEqual(self.batches, [[1, 2]])
+    
+    def test_flushes_next_tick(self):
+        b = self.batcher(0, 10)
+        b.add(1)
+        self.clock.advance(0)
+        self.assertEqual(self.batches, [[1]])
+    
+    def test_flushes_at_max_batch(self):
+        b = self.batcher(0.1, 2)
+        b.add(1)
+        b.add(2)
+        self.assertEqual(self.batches, [[1, 2]])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+    
+    def test_manual_flush(self):
+        b = self.batcher(0.1, 10)
+        b.add(1)
+        b.flush()
+        b.flush()
+        self.assertEqual(self.batches, [[1]])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+    
+    def test_replay_flood(self):
+        interval = 1.0 / 30
+        max_batch = 200
+        b = self.batcher(interval, max_batch)
+        
+        recording = list(read_recording('netsplit.log'))
+        start = recording[0][0]
+        for ts, line in recording:
+            self.clock.advance(ts - start - self.clock.seconds())
+            b.add(line)
+        b.flush()
+        
+        lines = [line for _ts, line in recording]
+        self.assertEqual(sum(self.batches, []), lines)
+        self.assertTrue(all(len(batch) <= max_batch for batch in self.batches))
+        
+        # at most one timed flush per interval, plus the ones forced by
+        # full batches
+        duration = recording[-1][0] - start
+        self.assertTrue(len(self.batches) <=
+            duration / interval + len(lines) / max_batch + 2)
+        self.assertTrue(len(self.batches) < len(lines) / 2)
+
+class TestIntRing(unittest.TestCase):
+    def test_fifo_with_growth(self):
+        ring = common.IntRing(capacity=2)
+        for i in xrange(10):
+            ring.append(i)
+        self.assertEqual(list(ring), range(10))
+        self.assertEqual([ring.popleft() for _ in xrange(4)], range(4))
+        self.assertEqual(len(ring), 6)
+    
+    def test_wraparound(self):
+        ring = common.IntRing(capacity=4)
+        for i in xrange(20):
+            ring.append(i)
+            if len(ring) > 3:
+                ring.popleft()
+        self.assertEqual(list(ring), [17, 18, 19])
+        self.assertEqual(len(ring._items), 4)
+    
+    def test_appendleft(self):
+        ring = common.IntRing(capacity=1)
+        ring.append(2)
+        ring.appendleft(1)
+        ring.appendleft(0)
+        self.assertEqual(list(ring), [0, 1, 2])
+    
+    def test_pop_empty(self):
+        self.assertRaises(IndexError, common.IntRing().popleft)
+
+class TestScrollback(unittest.TestCase):
+    def test_unlimited(self):
+        sb = common.Scrollback()
+        for _ in xrange(1000):
+            sb.append(10)
+        self.assertEqual(sb.trim(), 0)
+        self.assertEqual(len(sb), 1000)
+    
+    def test_trim_lines_in_chunks(self):
+        sb = common.Scrollback(max_lines=100, low_water=0.5)
+        for _ in xrange(100):
+            sb.append(3)
+        self.assertEqual(sb.trim(), 0)
+        sb.append(3)
+        self.assertEqual(sb.trim(), 51 * 3)
+        self.assertEqual(len(sb), 50)
+        self.assertEqual(sb.evicted, 51)
+        self.assertEqual(sb.chars, 150)
+        # no more trimming until the limit is passed again
+        for _ in xrange(50):
+            sb.append(3)
+            self.assertEqual(sb.trim(), 0)
+    
+    def test_trim_chars(self):
+        sb = common.Scrollback(max_chars=100, low_water=0.5)
+        for length in [40, 30, 20, 20]:
+            sb.append(length)
+        self.assertEqual(sb.trim(), 70)
+        self.assertEqual(sb.chars, 40)
+    
+    def test_prepend(self):
+        sb = common.Scrollback(max_lines=4, low_water=0.5)
+        sb.append(5)
+        sb.prepend([1, 2])
+        self.assertEqual(list(sb.lengths), [1, 2, 5])
+        self.assertEqual(sb.evicted, 0)
+        self.assertEqual(sb.chars, 8)
+        # pinned: nothing is evicted until unpinned
+        for length in [3, 4, 5]:
+            sb.append(length)
+        self.assertEqual(sb.trim(), 0)
+        sb.unpin()
+        self.assertEqual(sb.trim(), 1 + 2 + 5 + 3)
+        self.assertEqual(list(sb.lengths), [4, 5])
+
+class TestScrollbackLog(unittest.TestCase):
+    def test_read_ranges(self):
+        log = common.ScrollbackLog()
+        lines = ['line %d' % i for i in xrange(10)]
+        for line in lines:
+            log.append(line)
+        self.assertEqual(log.read(0, 10), lines)
+        self.assertEqual(log.read(3, 5), lines[3:5])
+        self.assertEqual(log.read(8, 100), lines[8:])
+        self.assertEqual(log.read(5, 5), [])
+    
+    def test_append_after_read(self):
+        log = common.ScrollbackLog()
+        log.append('a')
+        self.assertEqual(log.read(0, 1), ['a'])
+        log.append('b')
+        self.assertEqual(log.read(0, 2), ['a', 'b'])
+    
+    def test_shared_file(self):
+        store = common.ScrollbackFile()
+        logs = [common.ScrollbackLog(store) for _ in xrange(3)]
+        for i in xrange(30):
+            logs[i % 3].append('%d' % i)
+        logs[0].append('last')
+        self.assertEqual(logs[1].read(0, 10),
+            ['%d' % i for i in xrange(1, 30, 3)])
+        self.assertEqual(logs[0].read(9, 11), ['27', 'last'])
+        logs[2].append('after read')
+        self.assertEqual(logs[2].read(10, 11), ['after read'])
+        # closing a view doesn't close the shared file
+        logs[0].close()
+        self.assertEqual(logs[1].read(0, 1), ['1'])
+        store.close()
+    
+    def test_element_round_trip(self):
+        e = etree.fromstring(
+            u'<li>&lt;<b>nick</b>&gt; multi\nline \xfcnicode\r</li>')
+        line = common.element_to_line(e)
+        self.assertFalse('\n' in line)
+        log = common.ScrollbackLog()
+        log.append(line)
+        restored = common.line_to_element(log.read(0, 1)[0])
+        self.assertEqual(etree.tostring(restored), etree.tostring(e))
+
+class Test_layout_lines(unittest.TestCase):
+    def test_layout(self):
+        lines = [common.flatten(etree.fromstring(line))
+            for line in ['<li>ab</li>', '<li><b>c</b>d</li>']]
+        text, runs, lengths = common.layout_lines(lines, 10)
+        self.assertEqual(text, 'ab\ncd\n')
+        self.assertEqual(lengths, [3, 3])
+        self.assertEqual([(start, end, depth) for start, end, depth, _ in runs],
+            [(10, 12, 0), (13, 15, 0), (13, 14, 1)])
+
+class TestLineBuffer(unittest.TestCase):
+    def element(self, i):
+        return etree.fromstring('<li><b>%d</b> line</li>' % i)
+    
+    def fill(self, buf, n):
+        for i in xrange(n):
+            buf.append(self.element(i))
+    
+    def texts(self, lines):
+        return [text for text, _runs in lines]
+    
+    def test_append(self):
+        buf = common.LineBuffer(10)
+        text, runs = buf.append(self.element(0))
+        self.assertEqual(text, '0 line')
+        self.assertEqual(len(runs), 2)
+        self.assertEqual(len(buf), 1)
+    
+    def test_bounded(self):
+        buf = common.LineBuffer(10)
+        self.fill(buf, 1000)
+        self.assertEqual(len(buf.lines), 10)
+        self.assertEqual(buf.first, 990)
+        self.assertEqual(buf.available, 990)
+        self.assertEqual(self.texts(buf.read(0, 992)), ['990 line', '991 line'])
+        self.assertEqual(buf.read(2000, 3000), [])
+    
+    def test_read_from_history(self):
+        buf = common.LineBuffer(10, common.ScrollbackLog())
+        self.fill(buf, 100)
+        self.assertEqual(buf.available, 0)
+        self.assertEqual(self.texts(buf.read(85, 95)),
+            ['%d line' % i for i in xrange(85, 95)])
+        self.assertEqual(self.texts(buf.read(-10, 2)), ['0 line', '1 line'])
+    
+    def test_keys(self):
+        keys = lambda node, parent: parent + (node.tag,)
+        buf = common.LineBuffer(10, common.ScrollbackLog(), keys, ('body',))
+        self.fill(buf, 20)
+        for lines in [buf.read(19, 20), buf.read(0, 1)]:
+            [(_text, runs)] = lines
+            self.assertEqual([key for _s, _e, _d, key in runs],
+                [('body', 'li'), ('body', 'li', 'b')])
+    
+    def test_events_rendered_when_read(self):
+        rendered = []
+        def render(record):
+            rendered.append(record.text)
+            return etree.fromstring('<li><b>%s</b> %s</li>'
+                % (record.nick, record.text))
+        buf = common.LineBuffer(10, common.ScrollbackLog(), render=render)
+        buf.append(self.element(0))
+        for i in xrange(1, 20):
+            buf.append_event(events.Msg('net', '#a', 'bob', u'%d' % i, 'msg', i))
+        self.assertEqual(rendered, [])
+        self.assertEqual(len(buf), 20)
+        self.assertEqual(self.texts(buf.read(18, 20)), ['bob 18', 'bob 19'])
+        self.assertEqual(rendered, [u'18', u'19'])
+        # rendered once, then kept flattened
+        buf.read(18, 20)
+        self.assertEqual(rendered, [u'18', u'19'])
+        # older lines come back from the history
+        self.assertEqual(self.texts(buf.read(0, 2)), ['0 line', 'bob 1'])
+
+class FakeTextCtrl(object):
+    """Just enough of a wx.TextCtrl to show a `common.ControlView` in"""
+    def __init__(self):
+        self.text = ''
+        self.styles = [] # (start, end, attr), in the order they were set
+        self.insertion = 0
+        self.shown = None
+        self.frozen = 0
+    
+    def lines(self):
+        return self.text.splitlines()
+    
+    def style_at(self, pos):
+        """The attr last set over `pos`"""
+        for start, end, attr in reversed(self.styles):
+            if start <= pos < end:
+                return attr
+    
+    def _shift(self, at, by):
+        self.styles = [(start + by if start >= at else start,
+                end + by if end > at else end, attr)
+            for start, end, attr in self.styles]
+    
+    def Freeze(self):
+        self.frozen += 1
+    
+    def Thaw(self):
+        self.frozen -= 1
+    
+    def GetLastPosition(self):
+        return len(self.text)
+    
+    def Clear(self):
+        self.text = ''
+        self.styles = []
+    
+    def AppendText(self, text):
+        self.text += text
+        self.insertion = len(self.text)
+    
+    def WriteText(self, text):
+        self._shift(self.insertion, len(text))
+        self.text = self.text[:self.insertion] + text + \
+            self.text[self.insertion:]
+        self.insertion += len(text)
+    
+    def Remove(self, start, end):
+        assert start == 0
+        self.text = self.text[end:]
+        self.styles = [(s - end, e - end, attr)
+            for s, e, attr in self.styles if e > end]
+    
+    def SetStyle(self, start, end, attr):
+        assert 0 <= start <= end <= len(self.text)
+        self.styles.append((start, end, attr))
+        return True
+    
+    def SetInsertionPoint(self, pos):
+        self.insertion = pos
+    
+    def SetInsertionPointEnd(self):
+        self.insertion = len(self.text)
+    
+    def ShowPosition(self, pos):
+        self.shown = pos
+
+class TestControlView(unittest.TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.control = FakeTextCtrl()
+    
+    def element(self, i):
+        return etree.fromstring('<li><b>%d</b> line</li>' % i)
+    
+    def view(self, n=0, max_lines=500, scrollback_lines=None, batch=False):
+        keys = lambda node, parent: parent + (node.tag,)
+        render = lambda record: self.element(record.ts)
+        buf = common.LineBuffer(max_lines, common.ScrollbackLog(), keys,
+            ('body',), render)
+        batcher_factory = scrollback_factory = None
+        if batch:
+            batcher_factory = lambda flush: common.Batcher(self.clock, flush)
+        if scrollback_lines is not None:
+            scrollback_factory = lambda: common.Scrollback(
+                scrollback_lines, low_water=0.5)
+        view = common.ControlView('#a', buf, batcher_factory,
+            scrollback_factory, lambda key: key[-1])
+        for i in xrange(n):
+            view.receive_xml(self.element(i))
+        return view
+    
+    def assertShows(self, view, numbers):
+        control = self.control
+        self.assertEqual(control.lines(), ['%d line' % i for i in numbers])
+        # every number is bold
+        pos = 0
+        for line in control.lines():
+            self.assertEqual(control.style_at(pos), 'b')
+            self.assertEqual(control.style_at(pos + len(line) - 1), 'li')
+            pos += len(line) + 1
+        self.assertEqual(view.first_shown, numbers[0])
+        self.assertEqual(control.frozen, 0)
+    
+    def test_attach_shows_window(self):
+        view = self.view(100)
+        view.attach(self.control, 10)
+        self.assertShows(view, range(90, 100))
+        self.assertEqual(self.control.shown, len(self.control.text))
+    
+    def test_written_only_while_attached(self):
+        view = self.view(5)
+        view.attach(self.control, 10)
+        view.receive_xml(self.element(5))
+        self.assertShows(view, range(6))
+        self.assertTrue(view.showing)
+        view.detach()
+        self.assertFalse(view.showing)
+        view.receive_xml(self.element(6))
+        view.receive_event(events.Msg('net', '#a', 'bob', u'', 'msg', 7))
+        self.assertEqual(len(self.control.lines()), 6)
+        other = FakeTextCtrl()
+        view.attach(other, 10)
+        self.assertEqual(other.lines(), ['%d line' % i for i in xrange(8)])
+    
+    def test_trimmed(self):
+        view = self.view(5, scrollback_lines=10)
+        view.attach(self.control, 10)
+        for i in xrange(5, 11):
+            view.receive_xml(self.element(i))
+        # over the limit: trimmed down to half of it
+        self.assertShows(view, range(6, 11))
+        for i in xrange(11, 15):
+            view.receive_xml(self.element(i))
+        self.assertShows(view, range(6, 15))
+    
+    def test_page_older(self):
+        view = self.view(50, max_lines=20, scrollback_lines=20)
+        view.attach(self.control, 10)
+        end = len(self.control.text)
+        self.assertEqual(view.page_older(15), 15)
+        self.assertShows(view, range(25, 50))
+        # the control stays where it was
+        self.assertEqual(self.control.shown,
+            len(self.control.text) - end)
+        # older than the buffer keeps in memory: read from the history
+        self.assertEqual(view.page_older(100), 25)
+        self.assertShows(view, range(50))
+        self.assertEqual(view.page_older(100), 0)
+    
+    def test_paged_in_lines_kept_until_scrolled_to_end(self):
+        view = self.view(50, max_lines=20, scrollback_lines=20)
+        view.attach(self.control, 10)
+        view.page_older(15)
+        # past the limit, but the lines being read stay
+        for i in xrange(50, 60):
+            view.receive_xml(self.element(i))
+        self.assertShows(view, range(25, 60))
+        view.scrolled_to_end()
+        self.assertShows(view, range(50, 60))
+        self.assertEqual(self.control.shown, len(self.control.text))
+        # and trimmed as usual from then on
+        for i in xrange(60, 71):
+            view.receive_xml(self.element(i))
+        self.assertShows(view, range(61, 71))
+        view.scrolled_to_end() # nothing to do
+        self.assertShows(view, range(61, 71))
+    
+    def test_batched(self):
+        view = self.view(batch=True)
+        view.attach(self.control, 10)
+        view.receive_xml(self.element(0))
+        view.detach()
+        self.assertTrue(view.showing)
+        # the record follows the pending line, in order
+        view.receive_event(events.Msg('net', '#a', 'bob', u'', 'msg', 1))
+        view.attach(self.control, 10)
+        self.assertEqual(self.control.lines(), [])
+        self.clock.advance(0)
+        self.assertShows(view, range(2))
+    
+    def test_close(self):
+        view = self.view(batch=True)
+        view.receive_xml(self.element(0))
+        view.close()
+        self.assertEqual(len(view.buffer), 1)
+        self.assertRaises(ValueError, view.receive_xml, self.element(1))
+        self.assertRaises(ValueError, view.attach, self.control)
+
 if __name__ == '__main__':
     unittest.main()
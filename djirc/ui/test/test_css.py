@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+import unittest
+
+import cssutils
+from lxml import etree
+
+from djirc.ui import css
+
+BASE = (
+    "body {color: #000000; "
+    "background-color: #ffffff; "
+    "font-family: monospace;}\n")
+
+def cascade(css_text):
+    return css.Cascade(cssutils.parseString(BASE + css_text))
+
+class Test_styles2dict(unittest.TestCase):
+    def test_invalid_args(self):
+        self.assertRaises(ValueError, css.styles2dict, [])
+    
+    def test_cascade(self):
+        style1 = cssutils.parseString(BASE).cssRules[0].style
+        style2 = cssutils.parseString(
+            "b {color: #0000ff; font-family: arial;}").cssRules[0].style
+        
+        self.assertEqual(css.styles2dict([style1, style2]),
+            {
+                'color': (0, 0, 255),
+                'background-color': (255, 255, 255),
+                'font-family': ['monospace', 'arial']})
+
+class Test_element_step(unittest.TestCase):
+    def test_tag(self):
+        self.assertEqual(css.element_step(etree.fromstring('<b/>')), 'b')
+    
+    def test_id_and_classes(self):
+        e = etree.fromstring('<b id="x" class="z y"/>')
+        self.assertEqual(css.element_step(e), 'b#x.y.z')
+
+class Test_element_path(unittest.TestCase):
+    def test_path(self):
+        e = etree.fromstring('<li><b class="nick"/></li>')
+        li = css.element_path(e, css.ROOT_PATH)
+        self.assertEqual(li, ('body', 'li'))
+        self.assertEqual(css.element_path(e[0], li),
+            ('body', 'li', 'b.nick'))
+    
+    def test_shared(self):
+        e = etree.fromstring('<li/>')
+        self.assertTrue(css.element_path(e, css.ROOT_PATH) is
+            css.element_path(e, ('body',)))
+
+class TestSelector(unittest.TestCase):
+    def steps(self, *steps):
+        return [css.Compound.parse(step) for step in steps]
+    
+    def test_specificity(self):
+        for text, specificity in [
+                ('*', (0, 0, 0)),
+                ('b', (0, 0, 1)),
+                ('li b', (0, 0, 2)),
+                ('li > b.nick', (0, 1, 2)),
+                ('#x .y', (1, 1, 0))]:
+            self.assertEqual(css.Selector(text).specificity, specificity)
+    
+    def test_descendant(self):
+        selector = css.Selector('li b')
+        self.assertTrue(selector.matches(self.steps('body', 'li', 'b')))
+        self.assertTrue(selector.matches(self.steps('body', 'li', 'i', 'b')))
+        self.assertFalse(selector.matches(self.steps('body', 'p', 'b')))
+        self.assertFalse(selector.matches(self.steps('body', 'li')))
+    
+    def test_child(self):
+        selector = css.Selector('li > b')
+        self.assertTrue(selector.matches(self.steps('body', 'li', 'b')))
+        self.assertFalse(selector.matches(self.steps('body', 'li', 'i', 'b')))
+    
+    def test_mixed_combinators(self):
+        selector = css.Selector('body li > b')
+        self.assertTrue(selector.matches(self.steps('body', 'li', 'b')))
+        self.assertFalse(selector.matches(self.steps('li', 'b')))
+    
+    def test_classes(self):
+        selector = css.Selector('b.nick')
+        self.assertTrue(selector.matches(self.steps('body', 'b.me.nick')))
+        self.assertFalse(selector.matches(self.steps('body', 'b')))
+    
+    def test_unsupported(self):
+        for text in ['a[href]', 'a:hover', 'li + b', '> b', 'li >']:
+            self.assertRaises(ValueError, css.Selector, text)
+
+class TestCascade(unittest.TestCase):
+    def test_minimum_style(self):
+        self.assertRaises(ValueError, css.Cascade,
+            cssutils.parseString("body {color: red;}"))
+    
+    def test_inherits_root(self):
+        c = cascade("")
+        self.assertEqual(c.lookup(('body', 'li', 'b')), {
+            'color': (0, 0, 0),
+            'background-color': (255, 255, 255),
+            'font-family': ['monospace']})
+    
+    def test_font_family_stacks_down_the_path(self):
+        c = cascade("li {font-family: arial} b {font-family: serif}")
+        self.assertEqual(c.lookup(('body', 'li', 'b'))['font-family'],
+            ['monospace', 'arial', 'serif'])
+        self.assertEqual(c.lookup(('body', 'li'))['font-family'],
+            ['monospace', 'arial'])
+    
+    def test_color_conversion(self):
+        c = cascade("b {color: #ff0000}")
+        self.assertEqual(c.lookup(('body', 'b'))['color'], (255, 0, 0))
+    
+    def test_specificity_beats_order(self):
+        c = cascade(
+            "li > b {color: #00ff00}\n"
+            "b {color: #ff0000}\n")
+        self.assertEqual(c.lookup(('body', 'li', 'b'))['color'], (0, 255, 0))
+        self.assertEqual(c.lookup(('body', 'p', 'b'))['color'], (255, 0, 0))
+    
+    def test_class_beats_tags(self):
+        c = cascade(
+            ".nick {color: #0000ff}\n"
+            "body li b {color: #ff0000}\n")
+        self.assertEqual(c.lookup(('body', 'li', 'b.nick'))['color'],
+            (0, 0, 255))
+    
+    def test_id_beats_classes(self):
+        c = cascade(
+            "#me {color: #0000ff}\n"
+            "b.nick.self {color: #ff0000}\n")
+        self.assertEqual(c.lookup(('body', 'b#me.nick.self'))['color'],
+            (0, 0, 255))
+    
+    def test_later_rule_wins_on_equal_specificity(self):
+        c = cascade(
+            "li b {color: #ff0000}\n"
+            "body b {color: #00ff00}\n")
+        self.assertEqual(c.lookup(('body', 'li', 'b'))['color'], (0, 255, 0))
+    
+    def test_universal(self):
+        c = cascade("* {font-style: italic}")
+        self.assertEqual(c.lookup(('body', 'li'))['font-style'], 'italic')
+    
+    def test_selector_list(self):
+        c = cascade("i, b {font-weight: bold}")
+        self.assertEqual(c.lookup(('body', 'i'))['font-weight'], 'bold')
+        self.assertEqual(c.lookup(('body', 'b'))['font-weight'], 'bold')
+    
+    def test_unsupported_selectors_ignored(self):
+        c = cascade("a:hover {color: #ff0000} b {color: #00ff00}")
+        self.assertEqual(c.lookup(('body', 'b'))['color'], (0, 255, 0))
+    
+    def test_lookup_is_memoized(self):
+        c = cascade("b {font-weight: bold}")
+        path = ('body', 'li', 'b')
+        self.assertTrue(c.lookup(path) is c.lookup(path))
+    
+    def test_lookup_key(self):
+        c = cascade("b {font-weight: bold}")
+        self.assertEqual(c.lookup_key(('body', 'li')),
+            c.lookup_key(('body', 'p')))
+        self.assertNotEqual(c.lookup_key(('body', 'li')),
+            c.lookup_key(('body', 'b')))
+        hash(c.lookup_key(('body', 'b')))
+
+if __name__ == '__main__':
+    unittest.main()
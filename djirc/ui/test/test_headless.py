@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+import unittest
+
+from lxml import etree
+from zope.interface.verify import verifyObject
+from twisted.internet import task
+from twisted.test import proto_helpers
+
+from djirc import interfaces, ircclient
+from djirc.ui import headless
+
+class TestHeadlessViews(unittest.TestCase):
+    def setUp(self):
+        self.ui = headless.HeadlessUI()
+        self.network = self.ui.add_network('irc.example.net')
+    
+    def test_interfaces(self):
+        verifyObject(interfaces.IUserInterface, self.ui)
+        verifyObject(interfaces.IUINetwork, self.network)
+        verifyObject(interfaces.IUIChannel, self.network.add_channel('#c'))
+        verifyObject(interfaces.IUIConvo, self.network.add_convo('nick'))
+    
+    def test_records_text(self):
+        channel = self.network.add_channel('#c')
+        channel.receive_xml(etree.fromstring('<li>&lt;<b>a</b>&gt; hi</li>'))
+        self.assertEqual(channel.lines, ['<a> hi'])
+        self.assertEqual(channel.received, 1)
+        self.assertEqual(self.network.tab_map, {'#c': channel})
+    
+    def test_discards_text(self):
+        network = headless.HeadlessUI(record=False).add_network('n')
+        network.receive_xml(etree.fromstring('<li>hi</li>'))
+        self.assertEqual(network.lines, [])
+        self.assertEqual(network.received, 1)
+    
+    def test_topic(self):
+        channel = self.network.add_channel('#c')
+        channel.set_topic('a topic')
+        self.assertEqual(channel.topic, 'a topic')
+    
+    def test_closed(self):
+        channel = self.network.add_channel('#c')
+        channel.close()
+        self.assertRaises(ValueError, channel.receive_xml,
+            etree.fromstring('<li/>'))
+        self.assertRaises(ValueError, channel.close)
+
+class TestHeadlessSession(unittest.TestCase):
+    def test_session(self):
+        clock = task.Clock()
+        meta = headless.create_metaclient(clock, ircclient.IRCMetaClient)
+        meta.view_event_templates = ircclient.load_event_templates()
+        
+        network = meta.ui.add_network('irc.example.net')
+        factory = ircclient.IRCClientFactory('irc.example.net', meta, network)
+        meta.register_factory(factory)
+        proto = factory.buildProtocol(None)
+        proto.heartbeatInterval = None
+        transport = proto_helpers.StringTransport()
+        proto.makeConnection(transport)
+        
+        proto.dataReceived(
+            ':irc.example.net 001 testdjirc :Welcome\r\n'
+            ':testdjirc!u@h JOIN :#djirc\r\n'
+            ':someone!u@h PRIVMSG #djirc :hello <there>\r\n')
+        channel = network.tab_map['#djirc']
+        
+        meta.ui.enter_message(channel, u'hi yourself')
+        
+        self.assertEqual(network.lines[-1], '-- signed on.')
+        self.assertEqual(channel.lines, [
+            '-- you have joined #djirc',
+            '<someone> hello <there>',
+            '<testdjirc> hi yourself'])
+        self.assertTrue(
+            'PRIVMSG #djirc :hi yourself' in transport.value())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -69,3 +69,22 @@ class Test__styles2dict(unittest.TestCase):
     
 class Test__dict2TextAttr(object):
     pass
+
+class TestTextAttrCache(unittest.TestCase):
+    def setUp(self):
+        self.app = wx.wx.App(False)
+    
+    def test_reuses_attrs(self):
+        cache = wx.TextAttrCache()
+        self.assertTrue(cache(('body', 'b')) is cache(('body', 'b')))
+        self.assertFalse(cache(('body', 'b')) is cache(('body', 'li')))
+    
+    def test_shared_between_equal_styles(self):
+        cache = wx.TextAttrCache()
+        self.assertTrue(cache(('body', 'li')) is cache(('body', 'p')))
+    
+    def test_set_stylesheet_invalidates(self):
+        cache = wx.TextAttrCache()
+        bold = cache(('body', 'b'))
+        cache.set_stylesheet(cssutils.parseString(wx.DEFAULT_CSS))
+        self.assertFalse(cache(('body', 'b')) is bold)
@@ -3,25 +3,19 @@
 # generated by wxGlade 0.6.3 on Tue Aug 24 22:54:32 2010
 from __future__ import absolute_import
 
-import operator
-
 from twisted.python import log
+from twisted.internet import task
 
 import wx
 import zope.interface
 from lxml import etree
-import cssutils
 import os
 
-from djirc import interfaces
-from djirc.ui import common
+from djirc import interfaces, userlist
+from djirc.ui import common, css
 
 CSS_FILE = os.path.join(common.DATA_DIR, 'style.css')
 
-def css_urlFetch(url):
-    """Disable CSS URLs for now"""
-    raise NotImplementedError("URL loading is forbidden")
-
 def set_fontfamily_css(font, fontfamily):
     """Apply css `fontfamily` comma-delimited list to wx `font`"""
     for name in fontfamily.split(','):
@@ -33,72 +27,25 @@ def set_fontfamily_css(font, fontfamily):
     raise ValueError("No font family could be applied "
         "(searched for '%s')" % fontfamily)
 
-def element2TextAttr(element):
-    tag = element.tag
-    attr = wx.TextAttr()
-    font = attr.GetFont()
-    if tag == 'b':
-        
-        font.SetWeight(wx.FONTWEIGHT_BOLD)
-        font.SetFamily(wx.FONTFAMILY_DEFAULT) # fix a nonsense bug in wx
-    else:
-        font.SetWeight(wx.FONTWEIGHT_NORMAL)
-        font.SetFamily(wx.FONTFAMILY_DEFAULT) # fix a nonsense bug in wx
-    attr.SetFont(font)
-    attr.SetFlags(wx.TEXT_ATTR_FONT_WEIGHT)
-    
-    if not font.IsOk():
-        log.err("Font change failed for element: %s" %
-            etree.tostring(element))
-    
-    return attr
+# used when no stylesheet is given
+DEFAULT_CSS = """
+body {
+    color: black;
+    background-color: white;
+    font-family: monospace;
+}
 
-def _verify_minimum_style(style):
-    """Verify minimum required style rules exist"""
-    # FIXME: doesn't need to all be defined at root, but all defined eventually
-    props = ['color', 'background-color', 'font-family']
-    problems = [prop for prop in props if prop not in style]
-    
-    if problems:
-        raise ValueError("Missing styles: %s" % ', '.join(problems))
+b {
+    font-weight: bold;
+}
+"""
 
-def _styles2dict(styles):
-    """Create a `TextAttr` from a list of `cssutils.css.CSSStyleDeclaration`s
-    
-    """
-    if len(styles) < 1:
-        raise ValueError("must use at least one style")
-    
-    # root (body) style is required to set all the main things
-    root = styles[0]
-    style_d = {}
-    
-    
-    def append(d, k, v):
-        d.setdefault(k, []).append(v)
-    
-    def replace(d, k, v):
-        d[k] = v
-    
-    for style in styles:
-        for prop in style.getProperties():
-            if prop.name == 'font-family':
-                method = append
-            else:
-                method = replace
-            
-            if 'color' in prop.name: #todo: better method
-                value = common.css_color_to_rgb(prop.value)
-            else:
-                value = prop.value
-            
-            method(style_d, prop.name, value)
-    
-    _verify_minimum_style(style_d)
-    
-    return style_d
+_verify_minimum_style = css.verify_minimum_style
+_styles2dict = css.styles2dict
 
 def _dict2TextAttr(style):
+    """Create a `wx.TextAttr` from a resolved style dict"""
+    style = dict(style)
     font = wx.SystemSettings.GetFont(wx.SYS_DEFAULT_GUI_FONT)
     font_family = style.pop('font-family')
     for familyset in reversed(font_family):
@@ -111,6 +58,17 @@ def _dict2TextAttr(style):
     else:
         raise ValueError("No font family found (%s)" % (font_family,))
     
+    weight = style.pop('font-weight', 'normal')
+    if weight in ('bold', 'bolder') or (weight.isdigit() and int(weight) >= 600):
+        font.SetWeight(wx.FONTWEIGHT_BOLD)
+    else:
+        font.SetWeight(wx.FONTWEIGHT_NORMAL)
+    
+    if style.pop('font-style', 'normal') in ('italic', 'oblique'):
+        font.SetStyle(wx.FONTSTYLE_ITALIC)
+    else:
+        font.SetStyle(wx.FONTSTYLE_NORMAL)
+    
     fgcol = style.pop('color')
     bgcol = style.pop('background-color')
     align = wx.TEXT_ALIGNMENT_DEFAULT
@@ -123,26 +81,96 @@ def _dict2TextAttr(style):
     return wx.TextAttr(fgcol, bgcol, font, align)
 
 def styles2TextAttr(styles):
-    return _dict2TextAttr(_CSSStyle_list_to_dict(styles))
+    return _dict2TextAttr(_styles2dict(styles))
+
+class TextAttrCache(object):
+    """Prebuilt `wx.TextAttr`s for element paths
+    
+    Calling the cache with an element path (see `css.Cascade`) returns the
+    `wx.TextAttr` for its resolved style; paths that resolve to the same style
+    share one. Setting a new stylesheet with `set_stylesheet` invalidates the
+    cache. Without a stylesheet, `DEFAULT_CSS` is parsed when first needed.
     
+    """
+    def __init__(self, stylesheet=None):
+        self.set_stylesheet(stylesheet)
+    
+    def set_stylesheet(self, stylesheet):
+        self.stylesheet = stylesheet
+        self.cascade = None # compiled when first needed
+        self._by_path = {} # path -> TextAttr
+        self._attrs = {} # resolved style -> TextAttr
+    
+    def __call__(self, path):
+        try:
+            return self._by_path[path]
+        except KeyError:
+            pass
+        
+        if self.cascade is None:
+            if self.stylesheet is None:
+                self.stylesheet = css.parse_string(DEFAULT_CSS)
+            self.cascade = css.Cascade(self.stylesheet)
+        key = self.cascade.lookup_key(path)
+        try:
+            attr = self._attrs[key]
+        except KeyError:
+            attr = self._attrs[key] = _dict2TextAttr(self.cascade.lookup(path))
+            if not attr.GetFont().IsOk():
+                log.err("Font change failed for element: %s" % (path,))
+        self._by_path[path] = attr
+        return attr
 
 class WxUI(wx.Frame):
     zope.interface.implements(interfaces.IUserInterface)
+    
+    # output batching: views write to their controls at most once per
+    # `flush_interval` seconds (0: once per reactor tick), or whenever
+    # `max_batch` lines are waiting. None disables batching.
+    flush_interval = 0
+    max_batch = 500
+    
+    # every view keeps its latest `buffer_lines` lines in memory as text and
+    # style runs, and all of them on disk (in one temporary file for all
+    # views) if `keep_history` is set. Only the selected view is shown, in a
+    # control shared by all views: selecting a view fills the control with its
+    # last `window_lines` lines, and `page_lines` older ones are paged in
+    # whenever it's scrolled to the top.
+    buffer_lines = 500
+    window_lines = 500
+    page_lines = 200
+    keep_history = True
+    
+    # limits on what the control holds (None for no limit)
+    scrollback_lines = 5000
+    scrollback_chars = None
+    
+    # seconds between checks for changes to the stylesheet file
+    stylesheet_poll_interval = 2
+    
+    # set by create_metaclient; batching needs it to schedule flushes
+    reactor = None
+    
     def __init__(self, *args, **kwds):
         self.current_view = None
+        self.scrollback_file = None # a common.ScrollbackFile, once needed
         
-        #styling support
-        self.css_parser = cssutils.CSSParser()
-        self.css_parser.setFetcher(css_urlFetch)
-        self.stylesheet = self.css_parser.parseFile(CSS_FILE)
+        # styling support; the stylesheet is loaded once the window is shown
+        # (see create_metaclient), as parsing it is slow
+        self.text_attrs = TextAttrCache()
+        self.stylesheet_path = CSS_FILE
+        self.stylesheet_mtime = None
+        self.stylesheet = None
         
         # begin wxGlade: MainWindow.__init__
         kwds["style"] = wx.DEFAULT_FRAME_STYLE
         wx.Frame.__init__(self, *args, **kwds)
         self.channel_splitter = wx.SplitterWindow(self, -1, style=wx.SP_3D|wx.SP_BORDER | wx.SP_LIVE_UPDATE)
         self.window_1_pane_2 = wx.Panel(self.channel_splitter, -1)
-        self.channel_list = wx.TreeCtrl(self.channel_splitter, -1, style=wx.TR_HAS_BUTTONS|wx.TR_LINES_AT_ROOT|wx.TR_DEFAULT_STYLE|wx.SUNKEN_BORDER)
+        self.channel_list = wx.TreeCtrl(self.channel_splitter, -1, style=wx.TR_HAS_BUTTONS|wx.TR_LINES_AT_ROOT|wx.TR_DEFAULT_STYLE|wx.SUNKEN_BORDER|wx.TR_HIDE_ROOT)
         self.input = wx.TextCtrl(self.window_1_pane_2, -1, "", style=wx.TE_PROCESS_ENTER|wx.TE_PROCESS_TAB)
+        self.chatlog = self._chatlog_ctrl()
+        self.user_list = wx.ListBox(self.window_1_pane_2, -1)
     
         self.__set_properties()
         self.__do_layout()
@@ -151,43 +179,96 @@ class WxUI(wx.Frame):
         self.Bind(wx.EVT_TEXT_ENTER, self.enter_message, self.input)
         # end wxGlade
         
-        #self.current_network = self.channel_list.AddRoot('Freenode', -1, -1, None)
+        # networks hang off a hidden root, since a tree has only one root
+        self.tree_root = self.channel_list.AddRoot('')
+    
+    def load_stylesheet(self, path):
+        """Load the stylesheet at `path`, replacing any cached styles"""
+        self.stylesheet_path = path
+        self.stylesheet_mtime = os.path.getmtime(path)
+        self.stylesheet = css.parse_stylesheet(path)
+        self.text_attrs.set_stylesheet(self.stylesheet)
+    
+    def check_stylesheet(self):
+        """Reload the stylesheet if its file has changed since it was loaded
+        
+        Styles already applied to text are left as they are.
+        
+        """
+        try:
+            mtime = os.path.getmtime(self.stylesheet_path)
+        except OSError:
+            log.err()
+            return
+        if mtime != self.stylesheet_mtime:
+            self.load_stylesheet(self.stylesheet_path)
     
     def set_view(self, new):
         if self.current_view is not None:
-            self.current_view.control.Hide()
+            self.current_view.detach()
         self.current_view = new
-        self.current_view.control.Show()
+        self.current_view.attach(self.chatlog, self.window_lines)
+        self.user_list.Show(interfaces.IUIUserList.providedBy(new))
     
     def add_network(self, name):
-        root = self.channel_list.AddRoot(name)
-        view = WxNetworkView(self, root, self._channel_ctrl())
-        self.channel_list.GetItemData(root).SetData(view)
+        root = self.channel_list.AppendItem(self.tree_root, name)
+        view = WxNetworkView(self, name, root)
+        self.channel_list.SetItemData(root, wx.TreeItemData(view))
         if self.current_view is None:
             self._tab_change(view)
         return view
         
-    def _channel_ctrl(self):
-        """Create new (hidden) channel control"""
+    def _chatlog_ctrl(self):
+        """Create the control showing the selected view"""
         control = wx.TextCtrl(self.window_1_pane_2, -1, "", style=wx.TE_MULTILINE|wx.TE_READONLY|wx.TE_RICH|wx.TE_AUTO_URL)
         control.Bind(wx.EVT_SET_FOCUS, self.chatlog_focus)
-        control.Hide()
+        for event in [wx.EVT_SCROLLWIN_TOP, wx.EVT_SCROLLWIN_LINEUP,
+                wx.EVT_SCROLLWIN_PAGEUP, wx.EVT_SCROLLWIN_THUMBRELEASE,
+                wx.EVT_MOUSEWHEEL]:
+            control.Bind(event, self.chatlog_scroll)
         
         def op(*args, **kwargs): print args, kwargs
         control.Paste = op
         
         return control
     
+    def _buffer(self):
+        history = None
+        if self.keep_history:
+            # one file for every view's history
+            if self.scrollback_file is None:
+                self.scrollback_file = common.ScrollbackFile()
+            history = common.ScrollbackLog(self.scrollback_file)
+        return common.LineBuffer(self.buffer_lines, history, style_path,
+            ROOT_PATH, self._render_record)
+    
+    def _render_record(self, record):
+        return self.metaclient.render_record(record)
+    
+    def _batcher(self, flush):
+        """Create a batcher for a view's output, or None if it's disabled"""
+        if self.reactor is None or self.flush_interval is None:
+            return None
+        return common.Batcher(
+            self.reactor, flush, self.flush_interval, self.max_batch)
+    
+    def _scrollback(self):
+        if self.scrollback_lines is None and self.scrollback_chars is None:
+            return None
+        return common.Scrollback(self.scrollback_lines, self.scrollback_chars)
+    
     def __set_properties(self):
         # begin wxGlade: MainWindow.__set_properties
         self.SetTitle("Test IRC Window")
         # end wxGlade
     
     def __do_chatlog_layout(self):
-        if self.current_view is not None:
-            self.sizer_1.Clear()
-            self.sizer_1.Add(self.current_view.control, 1, wx.EXPAND, 0)
-            self.sizer_1.Add(self.input, 0, wx.EXPAND, 0)
+        self.sizer_1.Clear()
+        chat_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        chat_sizer.Add(self.chatlog, 1, wx.EXPAND, 0)
+        chat_sizer.Add(self.user_list, 0, wx.EXPAND, 0)
+        self.sizer_1.Add(chat_sizer, 1, wx.EXPAND, 0)
+        self.sizer_1.Add(self.input, 0, wx.EXPAND, 0)
     
     def __do_layout(self):
         # begin wxGlade: MainWindow.__do_layout
@@ -207,15 +288,35 @@ class WxUI(wx.Frame):
     def chatlog_focus(self, event):
         #print 'focus had'
         #self.input.SetFocus()
-        self.current_view.control.SetCaret(None)
+        self.chatlog.SetCaret(None)
         #caret.Hide()
     
+    def chatlog_scroll(self, event):
+        event.Skip()
+        # the scroll position changes after the event has been handled
+        wx.CallAfter(self._page_in)
+    
+    def _page_in(self):
+        """Page older lines into the shown view if it's scrolled to the top
+        
+        Once it's scrolled back to the bottom, the lines paged in can be
+        trimmed again.
+        
+        """
+        if self.current_view is None:
+            return
+        pos = self.chatlog.GetScrollPos(wx.VERTICAL)
+        if pos == 0:
+            self.current_view.page_older(self.page_lines)
+        elif pos + self.chatlog.GetScrollThumb(wx.VERTICAL) >= \
+                self.chatlog.GetScrollRange(wx.VERTICAL):
+            self.current_view.scrolled_to_end()
+    
     def enter_message(self, event):
-        # HACK: RELIES ON GLOBAL FACTORY
         input = self.input.GetValue()
         if input:
             self.input.SetValue('')
-            self.factory.send_command(self.current_view.name, input)
+            self.metaclient.send_command(self.current_view, input)
 
     def channel_change(self, event): # wxGlade: MainWindow.<event_handler>
         item = event.GetItem()
@@ -232,86 +333,129 @@ class WxUI(wx.Frame):
     
 # end of class MainWindow
 
-def closable(func):
-    def wrapped(self, *args, **kwargs):
-        if self.closed:
-            raise ValueError("%r is closed" % self)
-        else:
-            return func(self, *args, **kwargs)
-    return wrapped
+# style runs are keyed on element paths (see `css.Cascade`)
+ROOT_PATH = css.ROOT_PATH
+style_path = css.element_path
 
-class WxTabView(object):
-    zope.interface.implements(interfaces.IUITab)
-    def __init__(self, name, control):
-        self.name = name
-        self.control = control
-        self.closed = False
-    
-    @closable
-    def receive_xml(self, element):
-        start = self.control.GetLastPosition()
-        self.control.AppendText(common.etree_tostring(element) + '\n')
+closable = common.closable
+
+class WxTabView(common.ControlView):
+    zope.interface.implements(interfaces.IUIPreparedTab,
+        interfaces.IUIEventTab)
+    def __init__(self, name, buffer=None, batcher_factory=None,
+            scrollback_factory=None, text_attrs=None):
+        """Create a tab view keeping its lines in `buffer`
         
-        # starts[node] = start_of_element
-        starts = {}
-        ends = {}
+        `buffer` is a `common.LineBuffer` flattening lines by `style_path`;
+        by default one keeping 500 lines in memory (and none on disk) is
+        created. Its `render` function, which `receive_event` needs, renders
+        event records. The view is only written to a wx.TextCtrl while
+        attached to one with `attach`; see `common.ControlView` for
+        `batcher_factory` and `scrollback_factory`.
         
-        # we'll mark up in order of endpoints. It doesn't make a difference
-        # (due to perfect nesting)
-        pos = 0
-        for node, seen in common.dfs(element):
-            if not seen:
-                starts[node] = pos + start
-                pos += len(node.text or '')
-            else:
-                ends[node] = pos + start
-                pos += len(node.tail or '')
-                
-        for node, start in sorted(starts.iteritems(), key=operator.itemgetter(1)):
-            try:
-                end = ends[node]
-            except KeyError:
-                log.err()
-                continue
-            
-            attr = element2TextAttr(node)
-            success = self.control.SetStyle(start, end, attr)
-            if not success:
-                log.err("SetStyle failed for element: %s" %
-                    etree.tostring(node))
+        `text_attrs` is the `TextAttrCache` giving the `wx.TextAttr` for each
+        element path; by default one for the default stylesheet is created.
+        
+        """
+        if buffer is None:
+            buffer = common.LineBuffer(500, None, style_path, ROOT_PATH)
+        if text_attrs is None:
+            text_attrs = TextAttrCache()
+        super(WxTabView, self).__init__(name, buffer, batcher_factory,
+            scrollback_factory, text_attrs)
+
+class WxChannelView(WxTabView):
+    zope.interface.implements(interfaces.IUIChannel, interfaces.IUIUserList)
+    def __init__(self, name, user_list, *args, **kwargs):
+        """Create a channel view, showing its users in the wx.ListBox
+        `user_list` while attached
+        
+        """
+        super(WxChannelView, self).__init__(name, *args, **kwargs)
+        self.user_list = user_list
+        self.users = [] # display strings, e.g. '@nick'
+        self.topic = None
+    
+    @closable
+    def attach(self, control, window=500):
+        super(WxChannelView, self).attach(control, window)
+        self.user_list.Set(self.users)
+    
+    @closable
+    def set_topic(self, topic):
+        self.topic = topic
+    
+    def _users_changed(self):
+        if self.control is not None:
+            self.user_list.Set(self.users)
     
     @closable
-    def close(self):
-        self.closed = True
+    def add_user(self, nick):
+        self.users.append(nick)
+        self._users_changed()
+    
+    @closable
+    def remove_user(self, nick):
+        self.users = [user for user in self.users
+            if user.lstrip(userlist.PREFIXES) != nick]
+        self._users_changed()
+    
+    @closable
+    def set_users(self, users):
+        self.users = [prefix + nick for prefix, nick in users]
+        self._users_changed()
 
 class WxNetworkView(WxTabView):
     zope.interface.implements(interfaces.IUINetwork)
-    def __init__(self, ui, tree, control):
-        super(WxNetworkView, self).__init__(None, control)
+    def __init__(self, ui, network, tree):
+        super(WxNetworkView, self).__init__(None, ui._buffer(), ui._batcher,
+            ui._scrollback, ui.text_attrs)
+        self.network = network
         self.ui = ui
         self.tree = tree
         self.tab_map = {}
     
-    def _add_tab(self, tab_name):
-        control = self.ui._channel_ctrl()
-        view = WxTabView(tab_name, control)
+    def _view_args(self):
+        """Arguments for the WxTabView of a new tab"""
+        return (self.ui._buffer(), self.ui._batcher, self.ui._scrollback,
+            self.ui.text_attrs)
+    
+    def _add_tab(self, view):
+        view.network = self.network
         data = wx.TreeItemData(view)
-        self.ui.channel_list.AppendItem(self.tree, tab_name, -1, -1, data)
-        self.tab_map[tab_name] = view
+        self.ui.channel_list.AppendItem(self.tree, view.name, -1, -1, data)
+        self.tab_map[view.name] = view
         return view
     
-    add_channel = add_convo = _add_tab
+    def add_channel(self, channel_name):
+        return self._add_tab(WxChannelView(
+            channel_name, self.ui.user_list, *self._view_args()))
+    
+    def add_convo(self, nick):
+        return self._add_tab(WxTabView(nick, *self._view_args()))
 
 
+def install_reactor():
+    """Install the Twisted reactor this UI runs on"""
+    from twisted.internet import wxreactor
+    wxreactor.install()
+
 def create_metaclient(reactor, metaclient_factory):
     app = wx.PySimpleApp(0)
     wx.InitAllImageHandlers()
     frame_1 = WxUI(None, -1, "")
+    frame_1.reactor = reactor
     app.SetTopWindow(frame_1)
     frame_1.Show()
+    wx.CallAfter(frame_1.check_stylesheet)
     
     reactor.registerWxApp(app)
     
-    return metaclient_factory(reactor, frame_1)
+    if frame_1.stylesheet_poll_interval is not None:
+        task.LoopingCall(frame_1.check_stylesheet).start(
+            frame_1.stylesheet_poll_interval, now=False)
+    
+    metaclient = frame_1.metaclient = metaclient_factory(reactor, frame_1)
+    return metaclient
 
 
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+"""Who is in which channel, kept up to date from JOIN, PART, QUIT and NAMES
+
+Every channel keeps its members sorted the way user lists show them: by
+prefix mode (ops, then half-ops, then voiced users, then everyone else), then
+by nick. A reverse index from nicks to channels finds every channel a user
+was in when they quit or change nick, without looking through all channels.
+
+"""
+import bisect
+import string
+
+# prefix modes in display order, and the channel modes that grant them
+PREFIXES = '@%+'
+MODE_PREFIXES = {'o': '@', 'h': '%', 'v': '+'}
+
+_IRC_LOWER = string.maketrans(
+    string.ascii_uppercase + '[]\\~', string.ascii_lowercase + '{}|^')
+
+def irc_lower(name):
+    """Lower-case a nick or channel name with the RFC 1459 case mapping"""
+    if isinstance(name, unicode):
+        return name.lower()
+    return name.translate(_IRC_LOWER)
+
+class IRCDict(dict):
+    """A dict of nicks or channel names, ignoring their case (see irc_lower)"""
+    def __getitem__(self, name):
+        return dict.__getitem__(self, irc_lower(name))
+
+    def __setitem__(self, name, value):
+        dict.__setitem__(self, irc_lower(name), value)
+
+    def __delitem__(self, name):
+        dict.__delitem__(self, irc_lower(name))
+
+    def __contains__(self, name):
+        return dict.__contains__(self, irc_lower(name))
+
+    def get(self, name, default=None):
+        return dict.get(self, irc_lower(name), default)
+
+    def pop(self, name, *default):
+        return dict.pop(self, irc_lower(name), *default)
+
+def rank(prefix):
+    """Sort position of a user with the prefix modes `prefix`"""
+    if prefix:
+        return PREFIXES.index(prefix[0])
+    return len(PREFIXES)
+
+def split_prefix(name):
+    """Split a NAMES entry such as ``@+nick`` into ``('@+', 'nick')``"""
+    i = 0
+    while i < len(name) and name[i] in PREFIXES:
+        i += 1
+    return name[:i], name[i:]
+
+def add_prefix(prefix, char):
+    return ''.join(c for c in PREFIXES if c in prefix or c == char)
+
+def remove_prefix(prefix, char):
+    return prefix.replace(char, '')
+
+class Channel(object):
+    """The members of a channel, in display order
+
+    Iterating over a channel yields `(prefix, nick)` pairs, where `prefix`
+    holds the user's prefix modes (e.g. ``'@'``, ``'@+'`` or ``''``).
+    Adding or removing a member finds its place by bisection; bulk `load`
+    sorts once.
+
+    """
+    def __init__(self, name):
+        self.name = name
+        self.keys = [] # sorted (rank, lower-cased nick)
+        self.members = {} # lower-cased nick -> (prefix, nick)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        members = self.members
+        for _rank, low in self.keys:
+            yield members[low]
+
+    def __contains__(self, nick):
+        return irc_lower(nick) in self.members
+
+    def prefix(self, nick):
+        """Return the prefix modes of the member `nick`"""
+        return self.members[irc_lower(nick)][0]
+
+    def add(self, nick, prefix=''):
+        """Add `nick` (or change its prefix modes); returns its position"""
+        low = irc_lower(nick)
+        if low in self.members:
+            self._remove(low)
+        key = (rank(prefix), low)
+        i = bisect.bisect_left(self.keys, key)
+        self.keys.insert(i, key)
+        self.members[low] = (prefix, nick)
+        return i
+
+    def _remove(self, low):
+        prefix, _nick = self.members.pop(low)
+        i = bisect.bisect_left(self.keys, (rank(prefix), low))
+        del self.keys[i]
+        return i
+
+    def remove(self, nick):
+        """Remove `nick`; returns its position, or None if it wasn't here"""
+        low = irc_lower(nick)
+        if low not in self.members:
+            return None
+        return self._remove(low)
+
+    def load(self, entries):
+        """Replace the members with `entries`, `(prefix, nick)` pairs"""
+        self.members = dict((irc_lower(nick), (prefix, nick))
+            for prefix, nick in entries)
+        self.keys = sorted((rank(prefix), low)
+            for low, (prefix, _nick) in self.members.iteritems())
+
+class Membership(object):
+    """The channels we are in on one network, and who is in them"""
+    def __init__(self):
+        self.channels = {} # lower-cased name -> Channel
+        self.nick_channels = {} # lower-cased nick -> set of lower-cased names
+        self._names = {} # lower-cased name -> NAMES entries so far
+
+    def __getitem__(self, channel):
+        return self.channels[irc_lower(channel)]
+
+    def __contains__(self, channel):
+        return irc_lower(channel) in self.channels
+
+    def _index(self, low_nick, low_channel):
+        try:
+            self.nick_channels[low_nick].add(low_channel)
+        except KeyError:
+            self.nick_channels[low_nick] = set([low_channel])
+
+    def _unindex(self, low_nick, low_channel):
+        channels = self.nick_channels.get(low_nick)
+        if channels is not None:
+            channels.discard(low_channel)
+            if not channels:
+                del self.nick_channels[low_nick]
+
+    def channels_of(self, nick):
+        """Return the `Channel`s `nick` is in"""
+        return [self.channels[low]
+            for low in self.nick_channels.get(irc_lower(nick), ())]
+
+    def joined(self, channel):
+        """We joined `channel`; returns its new `Channel`"""
+        self.left(channel)
+        model = self.channels[irc_lower(channel)] = Channel(channel)
+        return model
+
+    def left(self, channel):
+        """We left (or were kicked from) `channel`"""
+        low_channel = irc_lower(channel)
+        model = self.channels.pop(low_channel, None)
+        self._names.pop(low_channel, None)
+        if model is not None:
+            for low_nick in model.members:
+                self._unindex(low_nick, low_channel)
+
+    def names(self, channel, entries):
+        """Collect a NAMES reply line's `entries`, e.g. ``['@op', 'user']``"""
+        self._names.setdefault(irc_lower(channel), []).extend(
+            split_prefix(entry) for entry in entries if entry)
+
+    def end_of_names(self, channel):
+        """Replace the members of `channel` with the NAMES reply collected
+
+        Returns the `Channel`, or None if we aren't in it.
+
+        """
+        low_channel = irc_lower(channel)
+        entries = self._names.pop(low_channel, [])
+        model = self.channels.get(low_channel)
+        if model is None:
+            return None
+        for low_nick in model.members:
+            self._unindex(low_nick, low_channel)
+        model.load(entries)
+        for low_nick in model.members:
+            self._index(low_nick, low_channel)
+        return model
+
+    def user_joined(self, channel, nick, prefix=''):
+        """`nick` joined `channel`; returns the `Channel` (None if not in it)
+        """
+        model = self.channels.get(irc_lower(channel))
+        if model is not None:
+            model.add(nick, prefix)
+            self._index(irc_lower(nick), irc_lower(channel))
+        return model
+
+    def user_left(self, channel, nick):
+        """`nick` left `channel`; returns the `Channel` (None if not in it)
+        """
+        model = self.channels.get(irc_lower(channel))
+        if model is not None:
+            model.remove(nick)
+            self._unindex(irc_lower(nick), irc_lower(channel))
+        return model
+
+    def user_quit(self, nick):
+        """`nick` quit; returns the `Channel`s they were in"""
+        models = self.channels_of(nick)
+        for model in models:
+            model.remove(nick)
+        self.nick_channels.pop(irc_lower(nick), None)
+        return models
+
+    def user_renamed(self, old, new):
+        """`old` is now known as `new`; returns the `Channel`s they are in"""
+        low_old, low_new = irc_lower(old), irc_lower(new)
+        models = self.channels_of(old)
+        for model in models:
+            prefix = model.prefix(old)
+            model.remove(old)
+            model.add(new, prefix)
+        channels = self.nick_channels.pop(low_old, None)
+        if channels:
+            self.nick_channels.setdefault(low_new, set()).update(channels)
+        return models
+
+    def mode_changed(self, channel, nick, mode, added):
+        """Channel `mode` was set (`added`) or unset for `nick`
+
+        Returns the `Channel` if the member's prefix modes changed.
+
+        """
+        char = MODE_PREFIXES.get(mode)
+        model = self.channels.get(irc_lower(channel))
+        if char is None or model is None or nick not in model:
+            return None
+        prefix = model.prefix(nick)
+        if added:
+            new_prefix = add_prefix(prefix, char)
+        else:
+            new_prefix = remove_prefix(prefix, char)
+        if new_prefix == prefix:
+            return None
+        model.add(nick, new_prefix)
+        return model